@@ -7,7 +7,14 @@ from typing import Optional
 from flask import Flask
 from flask_migrate import Migrate
 
-from api.utils.misc.helpers import DATETIME_STRING_FORMAT, get_db_connection_string, set_env, set_logger_settings
+from api.utils.misc.helpers import (
+    DATETIME_STRING_FORMAT,
+    get_db_connection_string,
+    get_db_engine_options,
+    get_db_replica_connection_string,
+    set_env,
+    set_logger_settings,
+)
 
 
 def create_app(config: Optional[str] = '', debug: Optional[bool] = False) -> Flask:
@@ -22,24 +29,54 @@ def create_app(config: Optional[str] = '', debug: Optional[bool] = False) -> Fla
     app = Flask(__name__)
     app.url_map.strict_slashes = False
     app.config['SQLALCHEMY_DATABASE_URI'] = get_db_connection_string()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_db_engine_options('primary')
+    # GET requests read from a replica if it is set, see api.database.replica
+    app.config['SQLALCHEMY_REPLICA_URI'] = get_db_replica_connection_string()
+    app.config['SQLALCHEMY_REPLICA_ENGINE_OPTIONS'] = get_db_engine_options('replica')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Minute candlesticks are stored as rows or packed per-day blocks, see api.utils.candlesticks.storage
+    app.config['CANDLESTICK_STORAGE'] = os.environ.get('CANDLESTICK_STORAGE', 'rows')
     app.secret_key = os.environ['CRLF_TOKEN']
 
     add_extensions(app)
     add_blueprints(app)
+    add_commands(app)
 
     return app
 
 
 def add_extensions(app: Flask) -> None:
-    from api.database import db
+    from api.database import db, read_replica
+    from api.utils.api_requests import request_metadata_recorder
+    from api.utils.assets import asset_registry
+    from api.utils.cache import result_cache
+    from api.utils.candlesticks import archive_store
+    from api.utils.compression import compression
 
     db.init_app(app)
     migrate = Migrate()
     migrate.init_app(app, db)
+    read_replica.init_app(app)
+    result_cache.init_app(app)
+    archive_store.init_app(app)
+    request_metadata_recorder.init_app(app)
+    asset_registry.init_app(app)
+    compression.init_app(app)
 
 
 def add_blueprints(app: Flask) -> None:
-    from api.endpoints import asset_blueprint
+    from api.endpoints import asset_blueprint, metrics_blueprint, service_blueprint
 
     app.register_blueprint(asset_blueprint)
+    app.register_blueprint(service_blueprint)
+    app.register_blueprint(metrics_blueprint)
+
+
+def add_commands(app: Flask) -> None:
+    from api.commands import archives_cli, blocks_cli, cache_cli, partitions_cli, rollups_cli
+
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(partitions_cli)
+    app.cli.add_command(blocks_cli)
+    app.cli.add_command(archives_cli)
+    app.cli.add_command(cache_cli)
@@ -0,0 +1 @@
+from api.asgi.app import create_asgi_app
@@ -0,0 +1,36 @@
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.routing import Mount, Route
+
+from api import create_app
+from api.asgi.views import AssetBatchEndpoint, AssetEndpoint
+from api.utils.misc.helpers import get_async_db_connection_string, get_db_engine_options
+
+
+def create_asgi_app(config: Optional[str] = '', debug: Optional[bool] = False) -> Starlette:
+    """
+    Create an ASGI app which serves reads of candlesticks and coverage by an async database driver. Other requests,
+    e.g. uploads, streamed reads and service ones, are served by the Flask app in a thread pool. It is run by
+    uvicorn workers of gunicorn, e.g. `gunicorn "api.asgi:create_asgi_app()" -k uvicorn.workers.UvicornWorker`.
+    """
+
+    flask_app = create_app(config, debug)
+    # Reads are routed to a replica if it is set, as reads of the Flask app
+    replica_uri = flask_app.config['SQLALCHEMY_REPLICA_URI']
+    uri = replica_uri or flask_app.config['SQLALCHEMY_DATABASE_URI']
+    engine = create_async_engine(
+        get_async_db_connection_string(uri),
+        **get_db_engine_options('async_replica' if replica_uri else 'async_primary', is_async=True),
+    )
+
+    wsgi_app = WSGIMiddleware(flask_app)
+    routes = [
+        # Batch routes go first, since their paths match asset routes too
+        Route('/assets/batch/{field}/{from_}/{to}', AssetBatchEndpoint(flask_app, wsgi_app, engine), methods=['GET']),
+        Route('/assets/{field}/{ticker}/{from_}/{to}', AssetEndpoint(flask_app, wsgi_app, engine), methods=['GET']),
+        Mount('', app=wsgi_app),
+    ]
+    return Starlette(debug=debug, routes=routes)
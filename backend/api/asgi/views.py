@@ -0,0 +1,411 @@
+from abc import ABC, abstractmethod
+import datetime as dt
+import logging
+import os
+import traceback
+from typing import Dict, List, Optional, Sequence
+import uuid
+
+from flask import Flask, jsonify
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from api.endpoints.assets.views import MAX_BATCH_TICKERS
+from api.utils.api_requests import ApiRequestLogger, request_metadata_recorder
+from api.utils.assets import AssetRef, asset_registry
+from api.utils.cache import CachedResponse, result_cache
+from api.utils.candlesticks import (
+    CANDLESTICK_MIMETYPES,
+    COLUMNS_BINARY_MIMETYPE,
+    COLUMNS_JSON_MIMETYPE,
+    DEFAULT_RESOLUTION,
+    JSON_MIMETYPE,
+    RESOLUTIONS,
+    STREAMING_MIMETYPES,
+    build_candlestick_query,
+    candlesticks_to_binary,
+    candlesticks_to_columns,
+    candlesticks_to_records,
+    dump_candlestick_data,
+    get_batch_coverage_gaps,
+    get_conditional_headers,
+    get_coverage_data,
+    get_coverage_gaps,
+    get_range_version,
+    group_by_asset,
+    is_final_range,
+    is_not_modified,
+    read_batch_minute_candlesticks,
+    read_minute_candlesticks,
+)
+from api.utils.compression import compression
+from api.utils.metrics import DB_QUERY_SECONDS, PAYLOAD_BYTES, REQUEST_SECONDS, ROWS_RETURNED, SERIALIZATION_SECONDS
+from api.utils.misc.helpers import datetime_to_string, string_to_datetime
+
+
+class ReadEndpoint(ABC):
+    """
+    An ASGI endpoint which reads by an async session, so a worker serves other requests while a read waits
+    for the database. Requests which it does not serve are passed to the Flask app. Responses are the same
+    as of the Flask views of the route.
+    """
+
+    # A label of request metrics, the same as of the Flask view
+    name = ''
+
+    def __init__(self, flask_app: Flask, wsgi_app: ASGIApp, engine: AsyncEngine):
+        self.flask_app = flask_app
+        self.wsgi_app = wsgi_app
+        self.engine = engine
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        request = Request(scope, receive)
+        if not self.is_served(request):
+            await self.wsgi_app(scope, receive, send)
+            return
+
+        request_id = uuid.uuid4().hex
+        logger = ApiRequestLogger.get_logger(request_id)
+        start_at = dt.datetime.utcnow()
+        try:
+            async with AsyncSession(self.engine) as session:
+                response = await self.get(request, session, logger)
+        except Exception:
+            logger.info('Process common error')
+            logger.error(traceback.format_exc())
+            response = get_bad_request_response(500)
+
+        response = await self.compress_response(request, response)
+        record_request(request, response.status_code, self.name, request_id, start_at)
+        await response(scope, receive, send)
+
+    def is_served(self, request: Request) -> bool:
+        return True
+
+    @abstractmethod
+    async def get(self, request: Request, session: AsyncSession, logger: logging.LoggerAdapter) -> Response:
+        pass
+
+    @staticmethod
+    async def compress_response(request: Request, response: Response) -> Response:
+        # Responses are compressed as by the Flask app, see api.utils.compression
+        if 'Content-Encoding' in response.headers:
+            return response
+        if not compression.is_compressible(response.status_code, len(response.body)):
+            return response
+
+        response.headers['Vary'] = ', '.join(filter(None, (response.headers.get('Vary'), 'Accept-Encoding')))
+        encoding = compression.get_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.body = await run_in_threadpool(compression.compress, response.body, encoding)
+            response.headers['Content-Encoding'] = encoding
+            response.headers['Content-Length'] = str(len(response.body))
+        return response
+
+    @property
+    def storage(self) -> str:
+        return self.flask_app.config['CANDLESTICK_STORAGE']
+
+    async def get_json_response(
+        self, data: Dict, headers: Optional[Dict[str, str]] = None, status_code: Optional[int] = 200
+    ) -> Response:
+        # Coverage of long ranges and of batches may be large, so it is not encoded in the event loop
+        return await run_in_threadpool(self.encode_json_response, data, headers, status_code)
+
+    def encode_json_response(
+        self, data: Dict, headers: Optional[Dict[str, str]] = None, status_code: Optional[int] = 200
+    ) -> Response:
+        # The Flask app serializes JSON, so the output is the same as of the Flask views
+        with self.flask_app.app_context():
+            payload = jsonify(data).get_data()
+        return Response(payload, status_code, headers={'Content-Type': JSON_MIMETYPE, **(headers or {})})
+
+
+class AssetEndpoint(ReadEndpoint):
+    """Candlesticks and coverage of an asset. Streamed candlesticks are served by the Flask app."""
+
+    name = 'asset_blueprint.asset_view'
+
+    def is_served(self, request: Request) -> bool:
+        return request.path_params['field'] != 'candlesticks' or get_mimetype(request) not in STREAMING_MIMETYPES
+
+    async def get(self, request: Request, session: AsyncSession, logger: logging.LoggerAdapter) -> Response:
+        field = request.path_params['field']
+        ticker = request.path_params['ticker']
+        asset = await session.run_sync(asset_registry.get, ticker)
+        # Nothing is covered for an unknown asset, so there is no need in it to answer about coverage
+        if not asset and field != 'coverage':
+            logger.warning(f'Cannot find an asset for ticker {ticker}')
+            return await self.get_json_response({})
+
+        resolution = request.query_params.get('resolution', DEFAULT_RESOLUTION)
+        if resolution not in RESOLUTIONS:
+            logger.warning(f'Unknown resolution "{resolution}"')
+            return get_bad_request_response(400)
+
+        mimetype = get_mimetype(request)
+        data = {
+            'ticker': ticker,
+            'resolution': resolution,
+            'status': 'OK',
+            'results': {},
+        }
+
+        from_ = string_to_datetime(request.path_params['from_'])
+        to = string_to_datetime(request.path_params['to']) + dt.timedelta(hours=23, minutes=59, seconds=59)
+        if from_ > to:
+            return await self.get_json_response(data)
+
+        if field == 'candlesticks':
+            logger.debug(f'Get candlestick data as {mimetype}...')
+            return await self._get_candlestick_response(request, session, logger, asset, from_, to, resolution, data)
+        elif field == 'coverage':
+            logger.debug('Get coverage gaps...')
+            # Coverage intervals are half-open, so the end of the last day is the next midnight
+            to += dt.timedelta(seconds=1)
+            with DB_QUERY_SECONDS.labels('coverage').time():
+                gaps = await session.run_sync(get_coverage_gaps, asset.id, from_, to) if asset else [(from_, to)]
+            logger.debug(f'Found {len(gaps)} coverage gaps between {from_} and {to}')
+            data['results'] = get_coverage_data(gaps)
+        else:
+            logger.warning(f'Cannot prepare data for "{field}". Unknown field')
+            data['status'] = 'ERROR'
+            return await self.get_json_response(data, status_code=400)
+        return await self.get_json_response(data)
+
+    async def _get_candlestick_response(
+        self,
+        request: Request,
+        session: AsyncSession,
+        logger: logging.LoggerAdapter,
+        asset: AssetRef,
+        from_: dt.datetime,
+        to: dt.datetime,
+        resolution: str,
+        data: Dict,
+    ) -> Response:
+        mimetype = get_mimetype(request)
+        with DB_QUERY_SECONDS.labels('range_version').time():
+            range_version = await session.run_sync(get_range_version, asset.id, from_, to)
+        etag = range_version.get_etag(str(asset.id), resolution, from_.isoformat(), to.isoformat(), mimetype)
+        is_final = await session.run_sync(is_final_range, asset.id, from_, to)
+        max_age = int(result_cache.ttl) if is_final else None
+        conditional_headers = get_conditional_headers(etag, range_version.updated_at, max_age)
+        if is_not_modified(request.headers, etag, range_version.updated_at):
+            logger.debug(f'Candlestick data are not modified, etag={etag}')
+            return Response(status_code=304, headers={**conditional_headers, 'Vary': 'Accept'})
+
+        # The result cache may be kept in a file, so it is not read or written in the event loop
+        cache_key = result_cache.get_key(asset.id, resolution, from_, to, mimetype, etag)
+        cached_response = await run_in_threadpool(result_cache.get, cache_key)
+        if cached_response is None:
+            logger.debug(
+                f'Request to db for candlesticks for asset={asset.id} ({asset.ticker}), '
+                f'from={from_}, to={to}, resolution={resolution}'
+            )
+            label = 'candlesticks' if resolution == DEFAULT_RESOLUTION else 'resampled_candlesticks'
+            with DB_QUERY_SECONDS.labels(label).time():
+                candlesticks = await session.run_sync(
+                    read_candlesticks, asset.id, from_, to, resolution, self.storage, self.engine.dialect.name
+                )
+            ROWS_RETURNED.labels(resolution).observe(len(candlesticks))
+
+            # Serialization takes a while for long ranges, so it does not block the event loop
+            cached_response = await run_in_threadpool(
+                self._serialize_candlesticks, candlesticks, resolution, mimetype, data
+            )
+            ttl = result_cache.ttl if is_final else result_cache.recent_ttl
+            await run_in_threadpool(result_cache.set, cache_key, cached_response, asset.id, from_, to, ttl)
+        else:
+            logger.debug('Got candlestick data from cache')
+
+        PAYLOAD_BYTES.labels(mimetype).observe(len(cached_response.payload))
+        response = Response(cached_response.payload, headers=dict(cached_response.headers))
+        response.headers.update(conditional_headers)
+        return response
+
+    def _serialize_candlesticks(
+        self, candlesticks: Sequence, resolution: str, mimetype: str, data: Dict
+    ) -> CachedResponse:
+        if mimetype == COLUMNS_BINARY_MIMETYPE:
+            headers = {
+                'Content-Type': COLUMNS_BINARY_MIMETYPE,
+                'Vary': 'Accept',
+                'X-Resolution': resolution,
+                'X-Result-Count': str(len(candlesticks)),
+            }
+            if candlesticks:
+                headers['X-Min-Datetime'] = datetime_to_string(candlesticks[0].first_datetime)
+                headers['X-Max-Datetime'] = datetime_to_string(candlesticks[-1].last_datetime)
+            with SERIALIZATION_SECONDS.labels(mimetype).time():
+                payload = candlesticks_to_binary(candlesticks)
+            return CachedResponse(payload, list(headers.items()))
+
+        headers = {'Content-Type': mimetype, 'Vary': 'Accept'}
+        if mimetype == JSON_MIMETYPE and not self._is_json_pretty_printed():
+            if candlesticks:
+                data['results'] = get_candlestick_summary(candlesticks)
+            with SERIALIZATION_SECONDS.labels(mimetype).time():
+                payload = dump_candlestick_data(data, candlesticks)
+            return CachedResponse(payload, list(headers.items()))
+
+        with SERIALIZATION_SECONDS.labels(mimetype).time():
+            if candlesticks:
+                if mimetype == COLUMNS_JSON_MIMETYPE:
+                    data['results'] = {'columns': candlesticks_to_columns(candlesticks)}
+                else:
+                    data['results'] = {'data': candlesticks_to_records(candlesticks)}
+                data['results'].update(get_candlestick_summary(candlesticks))
+            with self.flask_app.app_context():
+                payload = jsonify(data).get_data()
+        return CachedResponse(payload, list(headers.items()))
+
+    def _is_json_pretty_printed(self) -> bool:
+        return self.flask_app.config.get('JSONIFY_PRETTYPRINT_REGULAR') or self.flask_app.debug
+
+
+class AssetBatchEndpoint(ReadEndpoint):
+    """Candlesticks or coverage of several assets read by one query per table and returned in one response."""
+
+    name = 'asset_blueprint.asset_batch_view'
+
+    async def get(self, request: Request, session: AsyncSession, logger: logging.LoggerAdapter) -> Response:
+        field = request.path_params['field']
+        tickers = list(dict.fromkeys(ticker for ticker in request.query_params.get('tickers', '').split(',') if ticker))
+        if not tickers or len(tickers) > MAX_BATCH_TICKERS:
+            logger.warning(f'Expected from 1 to {MAX_BATCH_TICKERS} tickers, got {len(tickers)}')
+            return get_bad_request_response(400)
+
+        resolution = request.query_params.get('resolution', DEFAULT_RESOLUTION)
+        if resolution not in RESOLUTIONS:
+            logger.warning(f'Unknown resolution "{resolution}"')
+            return get_bad_request_response(400)
+
+        data = {
+            'tickers': tickers,
+            'resolution': resolution,
+            'status': 'OK',
+            'results': {},
+        }
+
+        from_ = string_to_datetime(request.path_params['from_'])
+        to = string_to_datetime(request.path_params['to']) + dt.timedelta(hours=23, minutes=59, seconds=59)
+        if from_ > to:
+            return await self.get_json_response(data)
+
+        assets = await session.run_sync(asset_registry.get_many, tickers)
+        for ticker in tickers:
+            if ticker not in assets:
+                logger.warning(f'Cannot find an asset for ticker {ticker}')
+        asset_ids = [asset.id for asset in assets.values()]
+
+        if field == 'candlesticks':
+            logger.debug(f'Get candlestick data of {len(asset_ids)} assets...')
+            candlesticks = {}
+            if asset_ids:
+                label = 'batch_candlesticks' if resolution == DEFAULT_RESOLUTION else 'batch_resampled_candlesticks'
+                with DB_QUERY_SECONDS.labels(label).time():
+                    candlesticks = await session.run_sync(
+                        read_batch_candlesticks,
+                        asset_ids,
+                        from_,
+                        to,
+                        resolution,
+                        self.storage,
+                        self.engine.dialect.name,
+                    )
+            ROWS_RETURNED.labels(resolution).observe(sum(map(len, candlesticks.values())))
+
+            def serialize() -> Response:
+                with SERIALIZATION_SECONDS.labels(COLUMNS_JSON_MIMETYPE).time():
+                    for ticker in tickers:
+                        asset_candlesticks = candlesticks.get(assets[ticker].id, []) if ticker in assets else []
+                        data['results'][ticker] = get_batch_candlestick_data(asset_candlesticks)
+                    return self.encode_json_response(data)
+
+            return await run_in_threadpool(serialize)
+        elif field == 'coverage':
+            logger.debug(f'Get coverage gaps of {len(asset_ids)} assets...')
+            # Coverage intervals are half-open, so the end of the last day is the next midnight
+            to += dt.timedelta(seconds=1)
+            gaps = {}
+            if asset_ids:
+                with DB_QUERY_SECONDS.labels('batch_coverage').time():
+                    gaps = await session.run_sync(get_batch_coverage_gaps, asset_ids, from_, to)
+            for ticker in tickers:
+                asset = assets.get(ticker)
+                data['results'][ticker] = get_coverage_data(gaps[asset.id] if asset else [(from_, to)])
+        else:
+            logger.warning(f'Cannot prepare data for "{field}". Unknown field')
+            data['status'] = 'ERROR'
+            return await self.get_json_response(data, status_code=400)
+        return await self.get_json_response(data)
+
+
+def read_candlesticks(
+    session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime, resolution: str, storage: str, dialect: str
+) -> Sequence:
+    if resolution == DEFAULT_RESOLUTION:
+        return read_minute_candlesticks(session, asset_id, from_, to, storage)
+    return session.execute(build_candlestick_query(asset_id, from_, to, resolution, dialect)).all()
+
+
+def read_batch_candlesticks(
+    session: Session,
+    asset_ids: List[int],
+    from_: dt.datetime,
+    to: dt.datetime,
+    resolution: str,
+    storage: str,
+    dialect: str,
+) -> Dict[int, Sequence]:
+    if resolution == DEFAULT_RESOLUTION:
+        return read_batch_minute_candlesticks(session, asset_ids, from_, to, storage)
+    return group_by_asset(session.execute(build_candlestick_query(asset_ids, from_, to, resolution, dialect)).all())
+
+
+def get_mimetype(request: Request) -> str:
+    accept = parse_accept_header(request.headers.get('Accept'), MIMEAccept)
+    return accept.best_match(CANDLESTICK_MIMETYPES, default=JSON_MIMETYPE)
+
+
+def get_candlestick_summary(candlesticks: Sequence) -> Dict[str, object]:
+    return {
+        'min_datetime': datetime_to_string(candlesticks[0].first_datetime),
+        'max_datetime': datetime_to_string(candlesticks[-1].last_datetime),
+        'result_count': len(candlesticks),
+    }
+
+
+def get_batch_candlestick_data(candlesticks: Sequence) -> Dict[str, object]:
+    if not candlesticks:
+        return {}
+    return {'columns': candlesticks_to_columns(candlesticks), **get_candlestick_summary(candlesticks)}
+
+
+def get_bad_request_response(status_code: int) -> Response:
+    return Response('Bad request', status_code, media_type='text/html')
+
+
+def record_request(request: Request, status_code: int, endpoint: str, request_id: str, start_at: dt.datetime) -> None:
+    end_at = dt.datetime.utcnow()
+    duration = (end_at - start_at).total_seconds()
+    REQUEST_SECONDS.labels(request.method, endpoint, status_code).observe(duration)
+    request_metadata_recorder.record(
+        {
+            'request_id': request_id,
+            'start_at': start_at,
+            'end_at': end_at,
+            'duration': duration,
+            'method': request.method,
+            'base_url': str(request.url.replace(query='')),
+            'log_file': os.environ['LOG'],
+            'status': status_code,
+        }
+    )
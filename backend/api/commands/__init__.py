@@ -0,0 +1,5 @@
+from api.commands.archives import archives_cli
+from api.commands.blocks import blocks_cli
+from api.commands.cache import cache_cli
+from api.commands.partitions import partitions_cli
+from api.commands.rollups import rollups_cli
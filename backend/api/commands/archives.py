@@ -0,0 +1,135 @@
+import datetime as dt
+import logging
+from typing import List, Optional
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from api.database import db, Asset, Candlestick, CandlestickArchive, CandlestickBlock
+from api.utils.candlesticks import (
+    BLOCKS_STORAGE,
+    archive_month,
+    archive_store,
+    get_month_start,
+    get_month_starts,
+    rehydrate_archive,
+)
+
+
+logger = logging.getLogger(__name__)
+
+archives_cli = AppGroup('archives', help='Move closed months of minute candlesticks to local Arrow files and back.')
+
+
+def _get_archives(
+    ticker: Optional[str], since: Optional[dt.datetime] = None, until: Optional[dt.datetime] = None
+) -> List[CandlestickArchive]:
+    query = db.session.query(CandlestickArchive)
+    if ticker:
+        query = query.join(Asset, Asset.id == CandlestickArchive.asset_id).filter(Asset.ticker == ticker)
+    if since:
+        query = query.filter(CandlestickArchive.month >= get_month_start(since).date())
+    if until:
+        query = query.filter(CandlestickArchive.month <= until.date())
+    return query.order_by(CandlestickArchive.asset_id, CandlestickArchive.month).all()
+
+
+@archives_cli.command('archive')
+@click.option('--ticker', type=str, required=False, default=None, help='Archive only the given ticker.')
+@click.option(
+    '--keep-months',
+    type=int,
+    required=False,
+    default=12,
+    help='Past months to keep in the database besides the current one.',
+)
+def archive_(ticker: Optional[str], keep_months: int) -> None:
+    """Move minute candlesticks of closed months to archive files, a transaction per asset and month."""
+
+    storage = current_app.config['CANDLESTICK_STORAGE']
+    to = get_month_start(dt.datetime.utcnow())
+    for _ in range(keep_months):
+        to = get_month_start(to - dt.timedelta(days=1))
+
+    query = db.session.query(Asset)
+    if ticker:
+        query = query.filter(Asset.ticker == ticker)
+    for asset in query.order_by(Asset.id).all():
+        if storage == BLOCKS_STORAGE:
+            min_datetime = db.session.query(func.min(CandlestickBlock.date)).filter_by(asset_id=asset.id).scalar()
+        else:
+            min_datetime = db.session.query(func.min(Candlestick.datetime)).filter_by(asset_id=asset.id).scalar()
+        if min_datetime is None or get_month_start(min_datetime) >= to:
+            logger.info(f'No candlesticks of {asset} before {to:%Y-%m}. Skip')
+            continue
+
+        archived = {archive.month for archive in _get_archives(asset.ticker)}
+        for month_start in get_month_starts(get_month_start(min_datetime), to - dt.timedelta(microseconds=1)):
+            if month_start.date() in archived:
+                continue
+
+            try:
+                archive = archive_month(db.session, asset.id, month_start.date(), storage)
+                db.session.commit()
+            except RuntimeError as e:
+                db.session.rollback()
+                logger.warning(f'Cannot archive candlesticks of {asset} for {month_start:%Y-%m}: {e}')
+                continue
+            if archive:
+                logger.info(f'Archived {archive.count} candlesticks of {asset} for {month_start:%Y-%m}')
+
+
+@archives_cli.command('verify')
+@click.option('--ticker', type=str, required=False, default=None, help='Verify only archives of the given ticker.')
+def verify(ticker: Optional[str]) -> None:
+    """Check sizes, checksums and contents of archive files. Exit with an error if any of them is broken."""
+
+    archives = _get_archives(ticker)
+    broken = 0
+    for archive in archives:
+        problems = archive_store.verify(archive)
+        for problem in problems:
+            click.echo(f'{archive}\t{problem}')
+        broken += bool(problems)
+
+    # Uploads to archived months move them back to the database and leave their files
+    if not ticker:
+        for path in archive_store.get_unreferenced_paths(archives):
+            click.echo(f'{path} is not referenced by any archive and may be removed')
+
+    count = sum(archive.count for archive in archives)
+    size = sum(archive.size for archive in archives)
+    click.echo(f'Verified {len(archives)} archives of {count} candlesticks, {size} bytes')
+    if broken:
+        raise click.ClickException(f'{broken} archives are broken')
+
+
+@archives_cli.command('rehydrate')
+@click.option('--ticker', type=str, required=False, default=None, help='Rehydrate only the given ticker.')
+@click.option(
+    '--since',
+    type=click.DateTime(formats=['%Y-%m-%d']),
+    required=False,
+    default=None,
+    help='Rehydrate archived months since this date.',
+)
+@click.option(
+    '--until',
+    type=click.DateTime(formats=['%Y-%m-%d']),
+    required=False,
+    default=None,
+    help='Rehydrate archived months until this date.',
+)
+def rehydrate(ticker: Optional[str], since: Optional[dt.datetime], until: Optional[dt.datetime]) -> None:
+    """Move archived months overlapping the given dates back to the database and remove their files."""
+
+    dialect = db.engine.dialect.name
+    storage = current_app.config['CANDLESTICK_STORAGE']
+    for archive in _get_archives(ticker, since, until):
+        description = str(archive)
+        result = rehydrate_archive(db.session, archive, dialect, storage)
+        db.session.commit()
+        archive_store.remove(archive)
+        logger.info(f'Rehydrated {result.inserted} candlesticks of {description}')
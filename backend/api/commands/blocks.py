@@ -0,0 +1,119 @@
+import datetime as dt
+import logging
+from typing import List, Optional
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, delete, func, select
+
+from api.database import db, Asset, Candlestick, CandlestickBlock
+from api.utils.candlesticks import (
+    BLOCKS_STORAGE,
+    ON_CONFLICT_NOTHING,
+    get_block_stats,
+    ingest_blocks,
+    ingest_candlesticks,
+    read_block_candlesticks,
+)
+from api.utils.candlesticks.ingest import PRICE_COLUMNS, to_candlestick_row
+
+
+logger = logging.getLogger(__name__)
+
+blocks_cli = AppGroup('blocks', help='Convert minute candlesticks between rows and compact per-day blocks.')
+
+
+def _get_assets(ticker: Optional[str]) -> List[Asset]:
+    query = db.session.query(Asset)
+    if ticker:
+        query = query.filter(Asset.ticker == ticker)
+    return query.order_by(Asset.id).all()
+
+
+@blocks_cli.command('pack')
+@click.option('--ticker', type=str, required=False, default=None, help='Pack only the given ticker.')
+@click.option('--days', type=int, required=False, default=30, help='Days of candlesticks committed at once.')
+def pack(ticker: Optional[str], days: int) -> None:
+    """Move minute candlesticks from rows to blocks. Set CANDLESTICK_STORAGE=blocks before, so uploads go to blocks."""
+
+    if current_app.config['CANDLESTICK_STORAGE'] != BLOCKS_STORAGE:
+        logger.warning(f'CANDLESTICK_STORAGE is not "{BLOCKS_STORAGE}", so packed candlesticks are not read by the API')
+
+    dialect = db.engine.dialect.name
+    for asset in _get_assets(ticker):
+        min_datetime, max_datetime = (
+            db.session.query(func.min(Candlestick.datetime), func.max(Candlestick.datetime))
+            .filter(Candlestick.asset_id == asset.id)
+            .one()
+        )
+        if min_datetime is None:
+            logger.info(f'No candlestick rows for {asset}. Skip')
+            continue
+
+        logger.info(f'Pack candlesticks of {asset} from {min_datetime} to {max_datetime}')
+        columns = [getattr(Candlestick, column) for column in ('asset_id', 'datetime', *PRICE_COLUMNS)]
+        from_ = dt.datetime.combine(min_datetime.date(), dt.time())
+        while from_ <= max_datetime:
+            to = from_ + dt.timedelta(days=days)
+            condition = and_(Candlestick.asset_id == asset.id, Candlestick.datetime >= from_, Candlestick.datetime < to)
+            rows = [dict(row._mapping) for row in db.session.execute(select(*columns).where(condition))]
+            # Blocks written by uploads in the blocks mode are newer, so they win
+            result = ingest_blocks(db.session, rows, dialect, ON_CONFLICT_NOTHING)
+            db.session.execute(delete(Candlestick.__table__).where(condition))
+            db.session.commit()
+            logger.debug(f'Packed {result.inserted} candlesticks of {asset} up to {to}')
+            from_ = to
+
+
+@blocks_cli.command('unpack')
+@click.option('--ticker', type=str, required=False, default=None, help='Unpack only the given ticker.')
+@click.option('--days', type=int, required=False, default=30, help='Days of candlesticks committed at once.')
+def unpack(ticker: Optional[str], days: int) -> None:
+    """Move minute candlesticks from blocks back to rows."""
+
+    dialect = db.engine.dialect.name
+    for asset in _get_assets(ticker):
+        min_date, max_date = (
+            db.session.query(func.min(CandlestickBlock.date), func.max(CandlestickBlock.date))
+            .filter(CandlestickBlock.asset_id == asset.id)
+            .one()
+        )
+        if min_date is None:
+            logger.info(f'No candlestick blocks for {asset}. Skip')
+            continue
+
+        logger.info(f'Unpack candlesticks of {asset} from {min_date} to {max_date}')
+        from_date = min_date
+        while from_date <= max_date:
+            to_date = from_date + dt.timedelta(days=days - 1)
+            candlesticks = read_block_candlesticks(
+                db.session,
+                asset.id,
+                dt.datetime.combine(from_date, dt.time()),
+                dt.datetime.combine(to_date, dt.time.max),
+            )
+            rows = [to_candlestick_row(asset.id, candlestick) for candlestick in candlesticks]
+            result = ingest_candlesticks(db.session, rows, dialect, ON_CONFLICT_NOTHING)
+            db.session.execute(
+                delete(CandlestickBlock.__table__).where(
+                    and_(CandlestickBlock.asset_id == asset.id, CandlestickBlock.date.between(from_date, to_date))
+                )
+            )
+            db.session.commit()
+            logger.debug(f'Unpacked {result.inserted} candlesticks of {asset} up to {to_date}')
+            from_date = to_date + dt.timedelta(days=1)
+
+
+@blocks_cli.command('stats')
+def stats() -> None:
+    """Print numbers of stored candlestick rows and blocks and the size of packed candlesticks."""
+
+    rows = db.session.query(func.count()).select_from(Candlestick).scalar()
+    blocks, packed, size = get_block_stats(db.session)
+    click.echo(f'rows\t{rows}')
+    click.echo(f'blocks\t{blocks}')
+    click.echo(f'packed candlesticks\t{packed}')
+    click.echo(f'packed bytes\t{size}')
+    if packed:
+        click.echo(f'bytes per packed candlestick\t{size / packed:.1f}')
@@ -0,0 +1,19 @@
+import click
+from flask.cli import AppGroup
+
+from api.utils.cache import MemoryCacheBackend, result_cache
+
+
+cache_cli = AppGroup('cache', help='Manage the result cache.')
+
+
+@cache_cli.command('clear')
+def clear() -> None:
+    """Drop all cached responses. A memory cache belongs to every worker process, so it is not shared with a command."""
+
+    if isinstance(result_cache.backend, MemoryCacheBackend):
+        raise click.ClickException('A memory cache is kept by API worker processes. Restart them to clear it')
+
+    entries = result_cache.get_stats()['entries']
+    result_cache.clear()
+    click.echo(f'Dropped {entries} cached responses')
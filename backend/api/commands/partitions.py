@@ -0,0 +1,96 @@
+import datetime as dt
+import logging
+from typing import Optional
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from api.database import db
+from api.utils.candlesticks import (
+    create_partition,
+    get_month_start,
+    get_month_starts,
+    get_next_month_start,
+    get_partition_name,
+    get_partitions,
+)
+
+
+logger = logging.getLogger(__name__)
+
+partitions_cli = AppGroup('partitions', help='Manage monthly partitions of minute candlesticks on Postgres.')
+
+
+def _is_partitioned() -> bool:
+    if db.engine.dialect.name != 'postgresql':
+        logger.info(f'Candlesticks are not partitioned on {db.engine.dialect.name}. Nothing to do')
+        return False
+    return True
+
+
+@partitions_cli.command('ensure')
+@click.option('--months-ahead', type=int, required=False, default=3, help='Months after the current one to create.')
+@click.option(
+    '--since',
+    type=click.DateTime(formats=['%Y-%m-%d']),
+    required=False,
+    default=None,
+    help='Create partitions since this date as well, e.g. before a backfill.',
+)
+def ensure(months_ahead: int, since: Optional[dt.datetime]) -> None:
+    """Create missing partitions up to a few months ahead, so ingestion never waits for their creation."""
+
+    if not _is_partitioned():
+        return
+
+    now = dt.datetime.utcnow()
+    to = get_month_start(now)
+    for _ in range(months_ahead):
+        to = get_next_month_start(to)
+
+    created = 0
+    for month_start in get_month_starts(since or now, to):
+        if create_partition(db.session, month_start):
+            created += 1
+    db.session.commit()
+    logger.info(f'Created {created} partitions up to {to:%Y-%m}')
+
+
+@partitions_cli.command('list')
+def list_() -> None:
+    """Print partitions with estimated numbers of rows."""
+
+    if not _is_partitioned():
+        return
+
+    for name in get_partitions(db.session):
+        rows = db.session.execute(
+            text('SELECT reltuples::bigint FROM pg_class WHERE relname = :name'), {'name': name}
+        ).scalar()
+        click.echo(f'{name}\t{max(rows, 0)}')
+
+
+@partitions_cli.command('cluster')
+@click.option('--months', type=int, required=False, default=1, help='Cluster partitions of this many past months.')
+def cluster(months: int) -> None:
+    """
+    Rewrite partitions of past months in order of their primary key, so a date range of an asset is stored in
+    adjacent pages. A partition is locked while it is rewritten, so run it when the month is not written anymore.
+    """
+
+    if not _is_partitioned():
+        return
+
+    month_start = get_month_start(dt.datetime.utcnow())
+    existing = set(get_partitions(db.session))
+    for _ in range(months):
+        month_start = get_month_start(month_start - dt.timedelta(days=1))
+        name = get_partition_name(month_start)
+        if name not in existing:
+            continue
+
+        logger.info(f'Cluster partition {name}')
+        db.session.execute(text(f'CLUSTER {name} USING {name}_pkey'))
+        db.session.execute(text(f'ANALYZE {name}'))
+        db.session.commit()
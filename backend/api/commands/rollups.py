@@ -0,0 +1,75 @@
+import datetime as dt
+import logging
+from typing import Optional
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func
+
+from api.database import db, Asset, Candlestick, CandlestickArchive, CandlestickBlock
+from api.utils.candlesticks import (
+    BLOCKS_STORAGE,
+    ROLLUP_MODELS,
+    get_month_start,
+    get_next_month_start,
+    refresh_block_rollups,
+    refresh_rollup,
+)
+
+
+logger = logging.getLogger(__name__)
+
+rollups_cli = AppGroup('rollups', help='Manage candlestick rollup tables.')
+
+
+@rollups_cli.command('backfill')
+@click.option('--ticker', type=str, required=False, default=None, help='Backfill only the given ticker.')
+@click.option('--days', type=int, required=False, default=30, help='Days of candlesticks committed at once.')
+def backfill(ticker: Optional[str], days: int) -> None:
+    """Build rollups of all resolutions from stored minute candlesticks."""
+
+    query = db.session.query(Asset)
+    if ticker:
+        query = query.filter(Asset.ticker == ticker)
+
+    dialect = db.engine.dialect.name
+    is_packed = current_app.config['CANDLESTICK_STORAGE'] == BLOCKS_STORAGE
+    for asset in query.order_by(Asset.id).all():
+        if is_packed:
+            min_datetime, max_datetime = (
+                db.session.query(func.min(CandlestickBlock.date), func.max(CandlestickBlock.date))
+                .filter(CandlestickBlock.asset_id == asset.id)
+                .one()
+            )
+        else:
+            min_datetime, max_datetime = (
+                db.session.query(func.min(Candlestick.datetime), func.max(Candlestick.datetime))
+                .filter(Candlestick.asset_id == asset.id)
+                .one()
+            )
+        if min_datetime is None:
+            logger.info(f'No candlesticks for {asset}. Skip')
+            continue
+
+        logger.info(f'Backfill rollups for {asset} from {min_datetime} to {max_datetime}')
+        # Minute candlesticks of archived months are not in the database, so their rollups are kept as they are
+        archived = {month for month, in db.session.query(CandlestickArchive.month).filter_by(asset_id=asset.id)}
+        # Chunks start at midnight, so every bucket of every resolution is rebuilt within exactly one chunk
+        from_ = dt.datetime(min_datetime.year, min_datetime.month, min_datetime.day)
+        while from_ <= dt.datetime.combine(max_datetime, dt.time.max):
+            to = min(from_ + dt.timedelta(days=days), get_next_month_start(from_))
+            if get_month_start(from_).date() in archived:
+                from_ = to
+                continue
+
+            if is_packed:
+                refresh_block_rollups(
+                    db.session, asset.id, [from_ + dt.timedelta(days=i) for i in range((to - from_).days)]
+                )
+            else:
+                for model in ROLLUP_MODELS.values():
+                    refresh_rollup(db.session, model, asset.id, from_, to - dt.timedelta(microseconds=1), dialect)
+            db.session.commit()
+            logger.debug(f'Rollups of {asset} are built up to {to}')
+            from_ = to
@@ -1,2 +1,15 @@
 from api.database.database import db
-from api.database.models import Asset, Candlestick, ApiRequestMetadata
+from api.database.models import (
+    Asset,
+    AssetCoverage,
+    Candlestick,
+    Candlestick1d,
+    Candlestick1h,
+    Candlestick5m,
+    CandlestickArchive,
+    CandlestickBlock,
+    CandlestickRollup,
+    CandlestickVersion,
+    ApiRequestMetadata,
+)
+from api.database.replica import ReadReplica, read_replica
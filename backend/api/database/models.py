@@ -1,3 +1,5 @@
+from sqlalchemy.orm import declared_attr
+
 from api.database.database import db
 
 
@@ -5,7 +7,7 @@ class Asset(db.Model):
     __tablename__ = 'assets'
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    ticker = db.Column(db.String, nullable=True, default=True)
+    ticker = db.Column(db.String, nullable=True, default=True, index=True, unique=True)
     isin = db.Column(db.String, nullable=True, default=True)
     currency = db.Column(db.String, nullable=True, default='USD')
 
@@ -18,10 +20,18 @@ class Asset(db.Model):
 
 
 class Candlestick(db.Model):
+    """
+    A minute candlestick. Candlesticks are clustered by (asset_id, datetime), so a date range of an asset is read by
+    one index range scan. On Postgres the table is partitioned by month of datetime, on SQLite it is stored in order
+    of the key.
+    """
+
     __tablename__ = 'candlesticks'
-    __table_args__ = (db.UniqueConstraint('datetime', 'asset_id', name='unique_candlesticks_date_asset_id'),)
+    __table_args__ = (
+        db.PrimaryKeyConstraint('asset_id', 'datetime', name='candlesticks_pkey'),
+        {'postgresql_partition_by': 'RANGE (datetime)', 'sqlite_with_rowid': False},
+    )
 
-    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     datetime = db.Column(db.DateTime, nullable=False)
     low_price = db.Column(db.Float, nullable=True, default=None)
     high_price = db.Column(db.Float, nullable=True, default=None)
@@ -29,7 +39,7 @@ class Candlestick(db.Model):
     close_price = db.Column(db.Float, nullable=True, default=None)
     volume = db.Column(db.Float, nullable=True)
     weighted_volume = db.Column(db.Float, nullable=True)
-    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'))
+    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), nullable=False)
 
     asset = db.relationship('Asset', back_populates='candlesticks', uselist=False)
 
@@ -42,6 +52,136 @@ class Candlestick(db.Model):
     __str__ = __repr__
 
 
+class CandlestickRollup:
+    """
+    Candlesticks aggregated to a coarser resolution. Each row is a bucket starting at datetime, first_datetime and
+    last_datetime are of the first and the last minute candlesticks in it, so a partially filled bucket is told apart.
+    Rollups are maintained on ingest, so long date ranges are read without scanning minute candlesticks.
+    """
+
+    resolution = None
+
+    @declared_attr
+    def __table_args__(cls):
+        return (db.PrimaryKeyConstraint('asset_id', 'datetime'),)
+
+    @declared_attr
+    def asset_id(cls):
+        return db.Column(db.Integer, db.ForeignKey('assets.id'), nullable=False)
+
+    datetime = db.Column(db.DateTime, nullable=False)
+    low_price = db.Column(db.Float, nullable=True, default=None)
+    high_price = db.Column(db.Float, nullable=True, default=None)
+    open_price = db.Column(db.Float, nullable=True, default=None)
+    close_price = db.Column(db.Float, nullable=True, default=None)
+    volume = db.Column(db.Float, nullable=True)
+    weighted_volume = db.Column(db.Float, nullable=True)
+    # Rollups built before these columns were added have them empty until `flask rollups backfill`
+    first_datetime = db.Column(db.DateTime, nullable=True)
+    last_datetime = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f'{self.__class__.__name__}(datetime={self.datetime}, close_price={self.close_price}, '
+            f'open_price={self.open_price}, low_price={self.low_price}, high_price={self.high_price}), '
+            f'volume={self.volume}'
+        )
+
+    __str__ = __repr__
+
+
+class Candlestick5m(CandlestickRollup, db.Model):
+    __tablename__ = 'candlesticks_5m'
+
+    resolution = '5m'
+
+
+class Candlestick1h(CandlestickRollup, db.Model):
+    __tablename__ = 'candlesticks_1h'
+
+    resolution = '1h'
+
+
+class Candlestick1d(CandlestickRollup, db.Model):
+    __tablename__ = 'candlesticks_1d'
+
+    resolution = '1d'
+
+
+class AssetCoverage(db.Model):
+    """A [from_datetime, to_datetime) interval of an asset which was already fetched from an extra source."""
+
+    __tablename__ = 'asset_coverage'
+    __table_args__ = (db.Index('index_asset_coverage_asset_id_from_datetime', 'asset_id', 'from_datetime'),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), nullable=False)
+    from_datetime = db.Column(db.DateTime, nullable=False)
+    to_datetime = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'AssetCoverage(asset_id={self.asset_id}, from={self.from_datetime}, to={self.to_datetime})'
+
+    __str__ = __repr__
+
+
+class CandlestickVersion(db.Model):
+    """A version of candlesticks of an asset for a day. It is increased every time they are changed."""
+
+    __tablename__ = 'candlestick_versions'
+
+    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'CandlestickVersion(asset_id={self.asset_id}, date={self.date}, version={self.version})'
+
+    __str__ = __repr__
+
+
+class CandlestickBlock(db.Model):
+    """
+    Minute candlesticks of an asset for a UTC day packed to columns of scaled integers. They are stored instead of
+    rows of the candlesticks table in the compact storage mode, see api.utils.candlesticks.blocks.
+    """
+
+    __tablename__ = 'candlestick_blocks'
+
+    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'CandlestickBlock(asset_id={self.asset_id}, date={self.date}, count={self.count})'
+
+    __str__ = __repr__
+
+
+class CandlestickArchive(db.Model):
+    """
+    A closed month of minute candlesticks of an asset moved from the database to a local Arrow file,
+    see api.utils.candlesticks.archives. Rollups of the month stay in the database.
+    """
+
+    __tablename__ = 'candlestick_archives'
+
+    asset_id = db.Column(db.Integer, db.ForeignKey('assets.id'), primary_key=True)
+    month = db.Column(db.Date, primary_key=True)
+    path = db.Column(db.String, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    checksum = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self) -> str:
+        return f'CandlestickArchive(asset_id={self.asset_id}, month={self.month}, count={self.count})'
+
+    __str__ = __repr__
+
+
 class ApiRequestMetadata(db.Model):
     __tablename__ = 'api_request_metadata'
 
@@ -0,0 +1,61 @@
+import time
+from typing import Dict, Union
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from api.utils.metrics import DB_POOL_CHECKOUT_SECONDS, DB_POOL_CONNECTIONS, DB_POOL_SATURATION, DB_POOL_TIMEOUTS
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    A queue pool which reports time to get connections, timeouts and usage as metrics. Pools are labeled
+    by the pool_logging_name option of their engines.
+    """
+
+    @property
+    def name(self) -> str:
+        return getattr(self, 'logging_name', None) or 'default'
+
+    def connect(self):
+        # A connection is checked and replaced here if pre-ping is enabled, so it is a part of the measured time
+        started_at = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            DB_POOL_TIMEOUTS.labels(self.name).inc()
+            raise
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.labels(self.name).observe(time.perf_counter() - started_at)
+        self._observe_usage()
+        return connection
+
+    def _do_return_conn(self, record) -> None:
+        super()._do_return_conn(record)
+        self._observe_usage()
+
+    def get_capacity(self) -> int:
+        # A negative overflow means that it is not limited
+        return self.size() + max(self._max_overflow, 0)
+
+    def get_stats(self) -> Dict[str, Union[int, float]]:
+        checked_out = self.checkedout()
+        capacity = self.get_capacity()
+        return {
+            'size': self.size(),
+            'capacity': capacity,
+            'checked_out': checked_out,
+            'idle': self.checkedin(),
+            'overflow': self.overflow(),
+            'saturation': checked_out / capacity if capacity else 0,
+        }
+
+    def _observe_usage(self) -> None:
+        stats = self.get_stats()
+        DB_POOL_CONNECTIONS.labels(self.name, 'checked_out').set(stats['checked_out'])
+        DB_POOL_CONNECTIONS.labels(self.name, 'idle').set(stats['idle'])
+        DB_POOL_SATURATION.labels(self.name).set(stats['saturation'])
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """An instrumented queue pool of async engines, whose connections are waited for by coroutines."""
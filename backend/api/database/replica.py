@@ -0,0 +1,48 @@
+import logging
+from typing import Dict, Optional
+
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, scoped_session, sessionmaker
+
+from api.database.database import db
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReadReplica:
+    """
+    Sessions of an optional read replica of the database. Without a replica, sessions of the primary are used.
+    Reads of a replica may lag behind uploads to the primary.
+    """
+
+    def __init__(self):
+        self.engine: Optional[Engine] = None
+        self._session: Optional[scoped_session] = None
+
+    def init_app(self, app: Flask) -> None:
+        uri = app.config.get('SQLALCHEMY_REPLICA_URI')
+        if uri:
+            self.engine = create_engine(uri, **app.config.get('SQLALCHEMY_REPLICA_ENGINE_OPTIONS', {}))
+            self._session = scoped_session(sessionmaker(bind=self.engine))
+            app.teardown_appcontext(self._remove_session)
+            logger.info(f'Reads are routed to a replica at {self.engine.url!r}')
+        app.extensions['read_replica'] = self
+
+    @property
+    def session(self) -> Session:
+        return self._session if self._session is not None else db.session
+
+    def get_engines(self) -> Dict[str, Engine]:
+        engines = {'primary': db.engine}
+        if self.engine is not None:
+            engines['replica'] = self.engine
+        return engines
+
+    def _remove_session(self, _) -> None:
+        self._session.remove()
+
+
+read_replica = ReadReplica()
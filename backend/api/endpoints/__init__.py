@@ -1 +1,3 @@
 from api.endpoints.assets import asset_blueprint
+from api.endpoints.metrics import metrics_blueprint
+from api.endpoints.service import service_blueprint
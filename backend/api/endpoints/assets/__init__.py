@@ -1,4 +1,4 @@
-from api.endpoints.assets.views import AssetView
+from api.endpoints.assets.views import AssetBatchView, AssetView
 
 from flask import Blueprint
 from api.utils.api_requests import handle_database_error, handle_error, init_request_metadata, update_request_metadata
@@ -6,6 +6,7 @@ from sqlalchemy.exc import SQLAlchemyError
 
 
 asset_view = AssetView.as_view('asset_view')
+asset_batch_view = AssetBatchView.as_view('asset_batch_view')
 
 asset_blueprint = Blueprint('asset_blueprint', __name__, url_prefix='/')
 asset_blueprint.before_request(init_request_metadata)
@@ -14,3 +15,4 @@ asset_blueprint.register_error_handler(SQLAlchemyError, handle_database_error)
 asset_blueprint.register_error_handler(Exception, handle_error)
 asset_blueprint.add_url_rule('/assets', view_func=asset_view)
 asset_blueprint.add_url_rule('/assets/<string:field>/<string:ticker>/<string:from_>/<string:to>', view_func=asset_view)
+asset_blueprint.add_url_rule('/assets/batch/<string:field>/<string:from_>/<string:to>', view_func=asset_batch_view)
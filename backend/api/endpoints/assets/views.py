@@ -1,20 +1,61 @@
 import datetime as dt
-from typing import Dict, List, Union
+import json
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
-from flask import jsonify, request, session
+from flask import Response, current_app, jsonify, make_response, request, session, stream_with_context
 from flask.views import MethodView
-from sqlalchemy import and_, or_
 
-from api.database import db, Asset, Candlestick
-from api.schemas import CandlestickSchema
+from api.database import db, read_replica
+from api.utils.assets import AssetRef, asset_registry
+from api.utils.cache import CachedResponse, result_cache
+from api.utils.candlesticks import (
+    CANDLESTICK_MIMETYPES,
+    COLUMNS_BINARY_MIMETYPE,
+    COLUMNS_JSON_MIMETYPE,
+    COLUMNS_NDJSON_MIMETYPE,
+    DEFAULT_RESOLUTION,
+    JSON_MIMETYPE,
+    ON_CONFLICT_NOTHING,
+    RESOLUTIONS,
+    STREAMING_MIMETYPES,
+    CoverageData,
+    add_coverage,
+    build_candlestick_query,
+    bump_versions,
+    candlesticks_to_binary,
+    candlesticks_to_columns,
+    candlesticks_to_records,
+    dump_candlestick_data,
+    get_batch_coverage_gaps,
+    get_conditional_headers,
+    get_coverage_data,
+    get_coverage_gaps,
+    get_range_version,
+    group_by_asset,
+    is_final_range,
+    is_not_modified,
+    iter_minute_candlesticks,
+    parse_candlesticks,
+    read_batch_minute_candlesticks,
+    read_minute_candlesticks,
+    store_candlesticks,
+    update_rollups,
+)
+from api.utils.metrics import DB_QUERY_SECONDS, INGESTED_ROWS, PAYLOAD_BYTES, ROWS_RETURNED, SERIALIZATION_SECONDS
 from api.utils.misc.helpers import datetime_to_string, string_to_datetime
 from api.utils.api_requests.loggers import ApiRequestLogger
 
 
 CandlestickData = Dict[str, Union[str, Dict[str, float]]]
 
+STREAM_BATCH_SIZE = 5000
+# Tickers of one batch request are read by one query, so their number bounds its response size
+MAX_BATCH_TICKERS = 50
+
 
 class AssetView(MethodView):
+    """Reads of candlesticks and coverage, which are routed to a read replica if it is set, and uploads."""
+
     methods = ['GET', 'POST']
 
     def __init__(self, *args, **kwargs):
@@ -24,13 +65,21 @@ class AssetView(MethodView):
         self.logger = ApiRequestLogger.get_logger(request_id)
 
     def get(self, field: str, ticker: str, from_: str, to: str):
-        asset = db.session.query(Asset).filter(Asset.ticker == ticker).first()
-        if not asset:
+        asset = asset_registry.get(read_replica.session, ticker)
+        # Nothing is covered for an unknown asset, so there is no need in it to answer about coverage
+        if not asset and field != 'coverage':
             self.logger.warning(f'Cannot find an asset for ticker {ticker}')
             return jsonify({})
 
+        resolution = request.args.get('resolution', DEFAULT_RESOLUTION)
+        if resolution not in RESOLUTIONS:
+            self.logger.warning(f'Unknown resolution "{resolution}"')
+            return 'Bad request', 400
+
+        mimetype = request.accept_mimetypes.best_match(CANDLESTICK_MIMETYPES, default=JSON_MIMETYPE)
         data = {
             'ticker': ticker,
+            'resolution': resolution,
             'status': 'OK',
             'results': {},
         }
@@ -41,93 +90,345 @@ class AssetView(MethodView):
             return data, 200
 
         if field == 'candlesticks':
-            self.logger.debug('Get candlestick data...')
-            data['results'] = self._get_candlestick_data(asset, from_, to)
+            self.logger.debug(f'Get candlestick data as {mimetype}...')
+            if mimetype in STREAMING_MIMETYPES:
+                return self._stream_candlestick_data(asset, from_, to, resolution, mimetype)
+
+            # Candlesticks are changed only by ingestion, which increases versions of their days. So a version
+            # of a range validates both a client copy and a cached response without querying candlesticks.
+            with DB_QUERY_SECONDS.labels('range_version').time():
+                range_version = get_range_version(read_replica.session, asset.id, from_, to)
+            etag = range_version.get_etag(str(asset.id), resolution, from_.isoformat(), to.isoformat(), mimetype)
+            is_final = is_final_range(read_replica.session, asset.id, from_, to)
+            max_age = int(result_cache.ttl) if is_final else None
+            conditional_headers = get_conditional_headers(etag, range_version.updated_at, max_age)
+            if is_not_modified(request.headers, etag, range_version.updated_at):
+                self.logger.debug(f'Candlestick data are not modified, etag={etag}')
+                return Response(status=304, headers={**conditional_headers, 'Vary': 'Accept'})
+
+            # Serialized responses are cached as they are, so a hit costs neither queries nor serialization
+            cache_key = result_cache.get_key(asset.id, resolution, from_, to, mimetype, etag)
+            cached_response = result_cache.get(cache_key)
+            if cached_response is not None:
+                self.logger.debug('Got candlestick data from cache')
+                response = Response(cached_response.payload, headers=cached_response.headers)
+                response.headers.extend(conditional_headers)
+                PAYLOAD_BYTES.labels(mimetype).observe(len(cached_response.payload))
+                return response
+
+            if mimetype == COLUMNS_BINARY_MIMETYPE:
+                response = self._get_candlestick_binary(asset, from_, to, resolution)
+            elif mimetype == JSON_MIMETYPE and not self._is_json_pretty_printed():
+                response = self._get_candlestick_json(asset, from_, to, resolution, data)
+            else:
+                data['results'] = self._get_candlestick_data(asset, from_, to, resolution, mimetype)
+                # Headers passed to make_response are added to ones of jsonify, so the content type is replaced
+                response = make_response(data, 200, {'Vary': 'Accept'})
+                response.headers['Content-Type'] = mimetype
+            cached_response = CachedResponse(response.get_data(), list(response.headers.items()))
+            PAYLOAD_BYTES.labels(mimetype).observe(len(cached_response.payload))
+            ttl = result_cache.ttl if is_final else result_cache.recent_ttl
+            result_cache.set(cache_key, cached_response, asset.id, from_, to, ttl)
+            response.headers.extend(conditional_headers)
+            return response
+        elif field == 'coverage':
+            self.logger.debug('Get coverage gaps...')
+            # Coverage intervals are half-open, so the end of the last day is the next midnight
+            data['results'] = self._get_coverage_data(asset, from_, to + dt.timedelta(seconds=1))
+            return data, 200
         else:
             self.logger.warning(f'Cannot prepare data for "{field}". Unknown field')
-        return data, 200
+            data['status'] = 'ERROR'
+            return data, 400
+
+    def _get_candlestick_data(
+        self,
+        asset: AssetRef,
+        from_: dt.datetime,
+        to: dt.datetime,
+        resolution: str = DEFAULT_RESOLUTION,
+        mimetype: str = JSON_MIMETYPE,
+    ) -> CandlestickData:
+        candlesticks, min_datetime, max_datetime = self._query_candlesticks(asset, from_, to, resolution)
 
-    def _get_candlestick_data(self, asset: Asset, from_: dt.date, to: dt.date) -> CandlestickData:
-        self.logger.debug(
-            f'Request to db for candlesticks for asset={asset.id} ({asset.ticker}), ' f'from={from_}, to={to}'
-        )
-        candlesticks = (
-            db.session.query(Candlestick)
-            .filter(
-                and_(
-                    Candlestick.asset_id == asset.id,
-                    Candlestick.datetime.between(from_, to),
-                )
-            )
-            .order_by(Candlestick.datetime)
-            .all()
-        )
         candlestick_data = {}
         if candlesticks:
             self.logger.debug('Got candlestick data from db')
-            candlestick_schema = CandlestickSchema()
-
-            candlestick_data['data'] = candlestick_schema.dump(candlesticks, many=True)
-            candlestick_data['min_datetime'] = datetime_to_string(candlesticks[0].datetime)
-            candlestick_data['max_datetime'] = datetime_to_string(candlesticks[-1].datetime)
-            candlestick_data['result_count'] = len(list(candlesticks))
+            with SERIALIZATION_SECONDS.labels(mimetype).time():
+                if mimetype == COLUMNS_JSON_MIMETYPE:
+                    candlestick_data['columns'] = candlesticks_to_columns(candlesticks)
+                else:
+                    candlestick_data['data'] = candlesticks_to_records(candlesticks)
+            candlestick_data['min_datetime'] = datetime_to_string(min_datetime)
+            candlestick_data['max_datetime'] = datetime_to_string(max_datetime)
+            candlestick_data['result_count'] = len(candlesticks)
         else:
             self.logger.debug('No candlestick data')
 
         return candlestick_data
 
+    def _get_candlestick_json(
+        self, asset: AssetRef, from_: dt.datetime, to: dt.datetime, resolution: str, data: Dict
+    ) -> Response:
+        """Serialize candlesticks bypassing Flask JSON encoding. The output is the same as of jsonify."""
+
+        candlesticks, min_datetime, max_datetime = self._query_candlesticks(asset, from_, to, resolution)
+        if candlesticks:
+            data['results'] = {
+                'min_datetime': datetime_to_string(min_datetime),
+                'max_datetime': datetime_to_string(max_datetime),
+                'result_count': len(candlesticks),
+            }
+
+        with SERIALIZATION_SECONDS.labels(JSON_MIMETYPE).time():
+            payload = dump_candlestick_data(data, candlesticks)
+        return Response(payload, mimetype=JSON_MIMETYPE, headers={'Vary': 'Accept'})
+
+    @staticmethod
+    def _is_json_pretty_printed() -> bool:
+        return current_app.config.get('JSONIFY_PRETTYPRINT_REGULAR') or current_app.debug
+
+    def _get_coverage_data(self, asset: Optional[AssetRef], from_: dt.datetime, to: dt.datetime) -> CoverageData:
+        """Return [from, to) sub-intervals of the given interval which were never fetched for the asset."""
+
+        with DB_QUERY_SECONDS.labels('coverage').time():
+            gaps = get_coverage_gaps(read_replica.session, asset.id, from_, to) if asset else [(from_, to)]
+        self.logger.debug(f'Found {len(gaps)} coverage gaps between {from_} and {to}')
+        return get_coverage_data(gaps)
+
+    def _get_candlestick_binary(
+        self, asset: AssetRef, from_: dt.datetime, to: dt.datetime, resolution: str
+    ) -> Response:
+        candlesticks, min_datetime, max_datetime = self._query_candlesticks(asset, from_, to, resolution)
+
+        headers = {'Vary': 'Accept', 'X-Resolution': resolution, 'X-Result-Count': str(len(candlesticks))}
+        if candlesticks:
+            headers['X-Min-Datetime'] = datetime_to_string(min_datetime)
+            headers['X-Max-Datetime'] = datetime_to_string(max_datetime)
+        with SERIALIZATION_SECONDS.labels(COLUMNS_BINARY_MIMETYPE).time():
+            payload = candlesticks_to_binary(candlesticks)
+        return Response(payload, mimetype=COLUMNS_BINARY_MIMETYPE, headers=headers)
+
+    def _stream_candlestick_data(
+        self, asset: AssetRef, from_: dt.datetime, to: dt.datetime, resolution: str, mimetype: str
+    ) -> Response:
+        """
+        Stream candlesticks as NDJSON reading them with a server-side cursor batch by batch,
+        so memory of a worker does not depend on a date range. The last record is a trailer with totals.
+        """
+
+        session = read_replica.session
+        if resolution == DEFAULT_RESOLUTION:
+            batches = iter_minute_candlesticks(
+                session, asset.id, from_, to, STREAM_BATCH_SIZE, current_app.config['CANDLESTICK_STORAGE']
+            )
+        else:
+            query = build_candlestick_query(asset.id, from_, to, resolution, db.engine.dialect.name)
+            batches = session.execute(query.execution_options(stream_results=True)).partitions(STREAM_BATCH_SIZE)
+
+        def generate() -> Iterator[str]:
+            self.logger.debug(f'Stream candlesticks for asset={asset.id} ({asset.ticker}) by {STREAM_BATCH_SIZE}')
+            trailer = {'ticker': asset.ticker, 'resolution': resolution, 'status': 'OK', 'result_count': 0}
+            for candlesticks in batches:
+                if not trailer['result_count']:
+                    trailer['min_datetime'] = datetime_to_string(candlesticks[0].first_datetime)
+                trailer['max_datetime'] = datetime_to_string(candlesticks[-1].last_datetime)
+                trailer['result_count'] += len(candlesticks)
+
+                if mimetype == COLUMNS_NDJSON_MIMETYPE:
+                    yield json.dumps({'columns': candlesticks_to_columns(candlesticks)}, separators=(',', ':')) + '\n'
+                else:
+                    yield ''.join(
+                        json.dumps(candlestick, separators=(',', ':')) + '\n'
+                        for candlestick in candlesticks_to_records(candlesticks)
+                    )
+
+            self.logger.debug(f'Streamed {trailer["result_count"]} candlesticks')
+            ROWS_RETURNED.labels(resolution).observe(trailer['result_count'])
+            yield json.dumps({'trailer': trailer}, separators=(',', ':')) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype=mimetype, headers={'Vary': 'Accept'})
+
+    def _query_candlesticks(
+        self, asset: AssetRef, from_: dt.datetime, to: dt.datetime, resolution: str
+    ) -> Tuple[Sequence, Optional[dt.datetime], Optional[dt.datetime]]:
+        """Return candlesticks of the given resolution and datetimes of the first and the last minute in them."""
+
+        self.logger.debug(
+            f'Request to db for candlesticks for asset={asset.id} ({asset.ticker}), '
+            f'from={from_}, to={to}, resolution={resolution}'
+        )
+        # Plain rows are read instead of ORM objects, so there is no identity map to fill
+        if resolution == DEFAULT_RESOLUTION:
+            with DB_QUERY_SECONDS.labels('candlesticks').time():
+                candlesticks = read_minute_candlesticks(
+                    read_replica.session, asset.id, from_, to, current_app.config['CANDLESTICK_STORAGE']
+                )
+        else:
+            query = build_candlestick_query(asset.id, from_, to, resolution, db.engine.dialect.name)
+            with DB_QUERY_SECONDS.labels('resampled_candlesticks').time():
+                candlesticks = read_replica.session.execute(query).all()
+        min_datetime = candlesticks[0].first_datetime if candlesticks else None
+        max_datetime = candlesticks[-1].last_datetime if candlesticks else None
+        ROWS_RETURNED.labels(resolution).observe(len(candlesticks))
+
+        return candlesticks, min_datetime, max_datetime
+
     def post(self):
         json_data = request.json
         ticker = json_data.get('ticker')
         if not ticker:
             raise KeyError('Cannot extract asset info from the given data. No "ticker" key')
 
-        asset = self._get_asset(ticker)
+        asset = asset_registry.get(db.session, ticker)
+        if not asset:
+            asset = asset_registry.create(db.session, ticker, db.engine.dialect.name)
 
+        data = {
+            'ticker': ticker,
+            'status': 'OK',
+            'results': {},
+        }
         if 'candlesticks' in json_data:
             self.logger.debug('Handle candlestick data')
-            self._process_candlesticks(json_data['candlesticks'], asset)
+            on_conflict = json_data.get('on_conflict', ON_CONFLICT_NOTHING)
+            data['results'] = self._process_candlesticks(json_data['candlesticks'], asset, on_conflict)
 
-        if db.session.new:
-            self.logger.info('Upload new data')
-            db.session.commit()
+        if 'coverage' in json_data:
+            self.logger.debug('Handle coverage data')
+            self._process_coverage(json_data['coverage'], asset)
 
-        return 'Created!', 200
+        self.logger.info('Upload new data')
+        db.session.commit()
+        asset_registry.add(asset)
 
-    def _get_asset(self, ticker: str) -> Asset:
-        asset = Asset.query.filter_by(ticker=ticker).first()
-        if not asset:
-            asset = Asset(ticker=ticker)
-            db.session.add(asset)
-        return asset
-
-    def _process_candlesticks(self, candlestick_data: List[Dict[str, float]], asset: Asset) -> None:
-        candlestick_schema = CandlestickSchema()
-        candlesticks = candlestick_schema.load(candlestick_data, many=True)
-        if asset.id:
-            self.logger.debug(
-                f'Request to db to get candlestick data for asset={asset.id} ({asset.ticker}) and '
-                f'for the given datetime data'
-            )
-            ands = [
-                Candlestick.asset_id == asset.id,
-                Candlestick.datetime.in_([candlestick.datetime for candlestick in candlesticks]),
-            ]
-
-            db_candlesticks = db.session.query(Candlestick).filter(*ands).all()
-
-            db_candlesticks = {(candlestick.datetime, asset.id): candlestick for candlestick in db_candlesticks}
-            self.logger.debug(f'Got {len(db_candlesticks)} candlestick rows from db')
-
-            for candlestick in candlesticks:
-                key = (candlestick.datetime, asset.id)
-                db_candlestick = db_candlesticks.get(key)
-                if not db_candlestick:
-                    candlestick.asset_id = asset.id
-                    db.session.add(candlestick)
-                    self.logger.debug(f'Put to db a new candlestick: {candlestick}')
-                else:
-                    self.logger.debug(f'Candlestick is already in db: {candlestick}')
+        return data, 200
+
+    def _process_coverage(self, coverage_data: List[Dict[str, str]], asset: AssetRef) -> None:
+        """Mark [from, to) intervals as fetched from an extra source even if there were no candlesticks in them."""
+
+        for interval in coverage_data:
+            from_ = string_to_datetime(interval['from'])
+            to = string_to_datetime(interval['to'])
+            self.logger.debug(f'Add coverage for asset={asset.id} ({asset.ticker}) from {from_} to {to}')
+            add_coverage(db.session, asset.id, from_, to)
+
+    def _process_candlesticks(
+        self, candlestick_data: List[Dict[str, float]], asset: AssetRef, on_conflict: str
+    ) -> Dict[str, int]:
+        """Insert candlesticks in bulk and update rollups of the affected buckets."""
+
+        rows = parse_candlesticks(candlestick_data, asset.id)
+        dialect = db.engine.dialect.name
+        storage = current_app.config['CANDLESTICK_STORAGE']
+        with DB_QUERY_SECONDS.labels('ingest').time():
+            result = store_candlesticks(db.session, rows, dialect, on_conflict, storage)
+        INGESTED_ROWS.labels('inserted').inc(result.inserted)
+        INGESTED_ROWS.labels('updated').inc(result.updated)
+        INGESTED_ROWS.labels('skipped').inc(result.skipped)
+        self.logger.info(
+            f'Ingested candlesticks for asset={asset.id} ({asset.ticker}): inserted={result.inserted}, '
+            f'updated={result.updated}, skipped={result.skipped}'
+        )
+
+        if result.datetimes:
+            self.logger.debug(f'Update rollups for {len(result.datetimes)} changed candlesticks')
+            with DB_QUERY_SECONDS.labels('rollups').time():
+                update_rollups(db.session, asset.id, result.datetimes, dialect, storage)
+            bump_versions(db.session, asset.id, result.datetimes, dialect)
+            result_cache.invalidate(asset.id, min(result.datetimes), max(result.datetimes))
+
+        return {'inserted': result.inserted, 'updated': result.updated, 'skipped': result.skipped}
+
+
+class AssetBatchView(MethodView):
+    """Candlesticks or coverage of several assets read by one query per table and returned in one response."""
+
+    methods = ['GET']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        request_id = session['request_id']
+        self.logger = ApiRequestLogger.get_logger(request_id)
+
+    def get(self, field: str, from_: str, to: str):
+        tickers = list(dict.fromkeys(ticker for ticker in request.args.get('tickers', '').split(',') if ticker))
+        if not tickers or len(tickers) > MAX_BATCH_TICKERS:
+            self.logger.warning(f'Expected from 1 to {MAX_BATCH_TICKERS} tickers, got {len(tickers)}')
+            return 'Bad request', 400
 
+        resolution = request.args.get('resolution', DEFAULT_RESOLUTION)
+        if resolution not in RESOLUTIONS:
+            self.logger.warning(f'Unknown resolution "{resolution}"')
+            return 'Bad request', 400
+
+        data = {
+            'tickers': tickers,
+            'resolution': resolution,
+            'status': 'OK',
+            'results': {},
+        }
+
+        from_ = string_to_datetime(from_)
+        to = string_to_datetime(to) + dt.timedelta(hours=23, minutes=59, seconds=59)
+        if from_ > to:
+            return data, 200
+
+        assets = asset_registry.get_many(read_replica.session, tickers)
+        for ticker in tickers:
+            if ticker not in assets:
+                self.logger.warning(f'Cannot find an asset for ticker {ticker}')
+        asset_ids = [asset.id for asset in assets.values()]
+
+        if field == 'candlesticks':
+            self.logger.debug(f'Get candlestick data of {len(asset_ids)} assets...')
+            candlesticks = self._query_candlesticks(asset_ids, from_, to, resolution) if asset_ids else {}
+            with SERIALIZATION_SECONDS.labels(COLUMNS_JSON_MIMETYPE).time():
+                for ticker in tickers:
+                    asset_candlesticks = candlesticks.get(assets[ticker].id, []) if ticker in assets else []
+                    data['results'][ticker] = self._get_candlestick_data(asset_candlesticks)
+        elif field == 'coverage':
+            self.logger.debug(f'Get coverage gaps of {len(asset_ids)} assets...')
+            # Coverage intervals are half-open, so the end of the last day is the next midnight
+            to += dt.timedelta(seconds=1)
+            with DB_QUERY_SECONDS.labels('batch_coverage').time():
+                gaps = get_batch_coverage_gaps(read_replica.session, asset_ids, from_, to) if asset_ids else {}
+            for ticker in tickers:
+                asset = assets.get(ticker)
+                data['results'][ticker] = get_coverage_data(gaps[asset.id] if asset else [(from_, to)])
         else:
-            asset.candlesticks.extend(candlesticks)
+            self.logger.warning(f'Cannot prepare data for "{field}". Unknown field')
+            data['status'] = 'ERROR'
+            return data, 400
+        return data, 200
+
+    def _query_candlesticks(
+        self, asset_ids: List[int], from_: dt.datetime, to: dt.datetime, resolution: str
+    ) -> Dict[int, Sequence]:
+        self.logger.debug(
+            f'Request to db for candlesticks for assets={asset_ids}, from={from_}, to={to}, resolution={resolution}'
+        )
+        if resolution == DEFAULT_RESOLUTION:
+            with DB_QUERY_SECONDS.labels('batch_candlesticks').time():
+                candlesticks = read_batch_minute_candlesticks(
+                    read_replica.session, asset_ids, from_, to, current_app.config['CANDLESTICK_STORAGE']
+                )
+        else:
+            query = build_candlestick_query(asset_ids, from_, to, resolution, db.engine.dialect.name)
+            with DB_QUERY_SECONDS.labels('batch_resampled_candlesticks').time():
+                candlesticks = group_by_asset(read_replica.session.execute(query).all())
+        ROWS_RETURNED.labels(resolution).observe(sum(map(len, candlesticks.values())))
+        return candlesticks
+
+    @staticmethod
+    def _get_candlestick_data(candlesticks: Sequence) -> CandlestickData:
+        if not candlesticks:
+            return {}
+
+        return {
+            'columns': candlesticks_to_columns(candlesticks),
+            'min_datetime': datetime_to_string(candlesticks[0].first_datetime),
+            'max_datetime': datetime_to_string(candlesticks[-1].last_datetime),
+            'result_count': len(candlesticks),
+        }
@@ -0,0 +1,9 @@
+from flask import Blueprint
+
+from api.endpoints.metrics.views import MetricsView
+
+
+metrics_view = MetricsView.as_view('metrics_view')
+
+metrics_blueprint = Blueprint('metrics_blueprint', __name__)
+metrics_blueprint.add_url_rule('/metrics', view_func=metrics_view)
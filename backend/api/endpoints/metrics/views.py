@@ -0,0 +1,12 @@
+from flask import Response
+from flask.views import MethodView
+
+from api.utils.metrics import generate_metrics
+
+
+class MetricsView(MethodView):
+    methods = ['GET']
+
+    def get(self):
+        metrics, content_type = generate_metrics()
+        return Response(metrics, content_type=content_type)
@@ -0,0 +1,13 @@
+from flask import Blueprint
+
+from api.endpoints.service.views import CacheView, DatabaseView, RequestMetadataView
+
+
+cache_view = CacheView.as_view('cache_view')
+database_view = DatabaseView.as_view('database_view')
+request_metadata_view = RequestMetadataView.as_view('request_metadata_view')
+
+service_blueprint = Blueprint('service_blueprint', __name__, url_prefix='/service')
+service_blueprint.add_url_rule('/cache', view_func=cache_view)
+service_blueprint.add_url_rule('/requests', view_func=request_metadata_view)
+service_blueprint.add_url_rule('/db', view_func=database_view)
@@ -0,0 +1,59 @@
+import time
+
+from flask.views import MethodView
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+from api.database import read_replica
+from api.database.pool import InstrumentedQueuePool
+from api.utils.api_requests import request_metadata_recorder
+from api.utils.cache import result_cache
+
+
+class CacheView(MethodView):
+    methods = ['GET']
+
+    def get(self):
+        """Return counters of the result cache. A memory cache counts requests of a process handling the request."""
+
+        return {'status': 'OK', 'results': result_cache.get_stats()}, 200
+
+
+class RequestMetadataView(MethodView):
+    methods = ['GET']
+
+    def get(self):
+        """Return counters of request metadata buffered by a process handling the request."""
+
+        return {'status': 'OK', 'results': request_metadata_recorder.get_stats()}, 200
+
+
+class DatabaseView(MethodView):
+    methods = ['GET']
+
+    def get(self):
+        """
+        Check connections to the primary database and its replica. Return their latencies and pools
+        of a process handling the request, or 503 if any of them is not available.
+        """
+
+        results = {}
+        status = 200
+        for name, engine in read_replica.get_engines().items():
+            result = results[name] = {}
+            started_at = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(text('SELECT 1'))
+                result['status'] = 'OK'
+            except SQLAlchemyError as e:
+                result['status'] = 'ERROR'
+                result['error'] = str(e.__cause__ or e)
+                status = 503
+            result['seconds'] = time.perf_counter() - started_at
+            if isinstance(engine.pool, InstrumentedQueuePool):
+                result['pool'] = engine.pool.get_stats()
+            else:
+                result['pool'] = {'status': engine.pool.status()}
+
+        return {'status': 'OK' if status == 200 else 'ERROR', 'results': results}, status
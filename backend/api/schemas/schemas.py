@@ -14,7 +14,6 @@ class AssetSchema(Schema):
 
 
 class CandlestickSchema(Schema):
-    id = fields.Integer()
     datetime = fields.DateTime(format=DATETIME_STRING_FORMAT)
     low_price = fields.Float()
     high_price = fields.Float()
@@ -1,3 +1,4 @@
 from api.utils.api_requests.loggers import ApiRequestLogger
 from api.utils.api_requests.errors import handle_database_error, handle_error
 from api.utils.api_requests.helpers import init_request_metadata, update_request_metadata
+from api.utils.api_requests.recorder import RequestMetadataRecorder, request_metadata_recorder
@@ -2,12 +2,10 @@ import datetime as dt
 import os
 import uuid
 
-from flask import Response, request, session
-from sqlalchemy.exc import SQLAlchemyError
+from flask import Response, g, request, session
 
-from api.database import db, ApiRequestMetadata
-from api.utils.misc.helpers import string_to_datetime, datetime_to_string
-from api.utils.api_requests.loggers import ApiRequestLogger
+from api.utils.api_requests.recorder import request_metadata_recorder
+from api.utils.metrics import REQUEST_SECONDS
 
 
 def init_request_metadata():
@@ -16,36 +14,29 @@ def init_request_metadata():
         session.pop('request_id')
 
     session['request_id'] = request_id
-    start_at = dt.datetime.utcnow()
-    session['request_start_at'] = datetime_to_string(start_at)
-    log_name = os.environ['LOG']
-    request_metadata = ApiRequestMetadata(
-        request_id=request_id, start_at=start_at, log_file=log_name, method=request.method, base_url=request.base_url
-    )
-    db.session.add(request_metadata)
-    db.session.commit()
+    g.request_start_at = dt.datetime.utcnow()
 
 
 def update_request_metadata(response: Response):
     request_id = session['request_id']
-    start_at = string_to_datetime(session['request_start_at'])
-    request_metadata = db.session.query(ApiRequestMetadata).filter(ApiRequestMetadata.request_id == request_id).first()
-
+    start_at = g.request_start_at
     end_at = dt.datetime.utcnow()
     duration = (end_at - start_at).total_seconds()
-    status = response.status_code
-    request_metadata.end_at = end_at
-    request_metadata.duration = duration
-    request_metadata.status = status
-
-    try:
-        db.session.add(request_metadata)
-        db.session.commit()
-    except SQLAlchemyError:
-        logger = ApiRequestLogger.get_logger(request_id)
-        db.session.rollback()
-        logger.error('Cannot upload request metadata')
+    REQUEST_SECONDS.labels(request.method, request.endpoint, response.status_code).observe(duration)
+
+    # Metadata are written in background, so a request does not wait for the database
+    request_metadata_recorder.record(
+        {
+            'request_id': request_id,
+            'start_at': start_at,
+            'end_at': end_at,
+            'duration': duration,
+            'method': request.method,
+            'base_url': request.base_url,
+            'log_file': os.environ['LOG'],
+            'status': response.status_code,
+        }
+    )
 
     session.pop('request_id')
-    session.pop('request_start_at')
     return response
@@ -0,0 +1,150 @@
+import atexit
+import datetime as dt
+import json
+import logging
+import os
+import queue
+import threading
+from typing import Dict, List, Optional, Union
+
+from flask import Flask
+
+from api.database import db, ApiRequestMetadata
+
+
+logger = logging.getLogger(__name__)
+
+REQUEST_METADATA_LOGGER_NAME = 'api_request_metadata'
+
+RequestMetadata = Dict[str, Union[str, int, float, dt.datetime]]
+
+
+class RequestMetadataRecorder:
+    """
+    Buffer metadata of API requests in a bounded queue and write them in batches from a background thread,
+    so requests do not wait for the database. Metadata are dropped if the queue is full.
+    A sink is chosen by the REQUEST_METADATA_SINK env variable: `database`, `log` or `none`.
+    """
+
+    DATABASE_SINK = 'database'
+    LOG_SINK = 'log'
+    NO_SINK = 'none'
+
+    def __init__(
+        self,
+        sink: Optional[str] = DATABASE_SINK,
+        queue_size: Optional[int] = 10000,
+        batch_size: Optional[int] = 500,
+        flush_interval: Optional[float] = 5,
+    ):
+        self.sink = sink
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self._app = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def init_app(self, app: Flask) -> None:
+        self.sink = os.environ.get('REQUEST_METADATA_SINK', self.sink)
+        if self.sink not in (self.DATABASE_SINK, self.LOG_SINK, self.NO_SINK):
+            raise ValueError(f'Unknown request metadata sink "{self.sink}"')
+
+        self.queue_size = int(os.environ.get('REQUEST_METADATA_QUEUE_SIZE', self.queue_size))
+        self.batch_size = int(os.environ.get('REQUEST_METADATA_BATCH_SIZE', self.batch_size))
+        self.flush_interval = float(os.environ.get('REQUEST_METADATA_FLUSH_INTERVAL', self.flush_interval))
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._app = app
+        app.extensions['request_metadata_recorder'] = self
+        atexit.register(self.stop)
+
+    def record(self, metadata: RequestMetadata) -> None:
+        if self.sink == self.NO_SINK:
+            return
+
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(metadata)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.recorded += 1
+
+    def stop(self) -> None:
+        """Stop the background thread and write buffered metadata."""
+
+        self._stopped.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._flush()
+
+    def get_stats(self) -> Dict[str, Union[int, str]]:
+        return {
+            'sink': self.sink,
+            'queued': self._queue.qsize(),
+            'queue_size': self.queue_size,
+            'recorded': self.recorded,
+            'dropped': self.dropped,
+            'written': self.written,
+            'failed': self.failed,
+        }
+
+    def _ensure_thread(self) -> None:
+        # Threads do not survive forks, so every worker process starts its own one
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._run, name='request-metadata-recorder', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self) -> None:
+        while True:
+            batch = self._get_batch()
+            if not batch:
+                return
+
+            try:
+                self._write(batch)
+            except Exception:
+                self.failed += len(batch)
+                logger.exception(f'Cannot write metadata of {len(batch)} requests')
+            else:
+                self.written += len(batch)
+
+    def _get_batch(self) -> List[RequestMetadata]:
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[RequestMetadata]) -> None:
+        if self.sink == self.LOG_SINK:
+            metadata_logger = logging.getLogger(REQUEST_METADATA_LOGGER_NAME)
+            for metadata in batch:
+                metadata_logger.info(json.dumps(metadata, default=str, separators=(',', ':')))
+            return
+
+        with self._app.app_context():
+            with db.engine.begin() as connection:
+                connection.execute(ApiRequestMetadata.__table__.insert(), batch)
+
+
+request_metadata_recorder = RequestMetadataRecorder()
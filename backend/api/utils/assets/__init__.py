@@ -0,0 +1 @@
+from api.utils.assets.registry import AssetRef, AssetRegistry, asset_registry
@@ -0,0 +1,90 @@
+import logging
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from flask import Flask
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from api.database import db, Asset
+
+
+logger = logging.getLogger(__name__)
+
+
+class AssetRef(NamedTuple):
+    id: int
+    ticker: str
+
+
+class AssetRegistry:
+    """
+    A process-wide map of tickers to asset IDs, so requests find their assets without querying the database.
+    Assets are never renamed or deleted by the API, so entries do not expire. The map is filled at start,
+    on misses and after new assets are committed. Unknown tickers are not remembered, since other processes
+    may create them at any time.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions['asset_registry'] = self
+        with app.app_context():
+            self.warm(db.session)
+
+    def warm(self, session: Session) -> None:
+        try:
+            rows = session.execute(select(Asset.ticker, Asset.id).where(Asset.ticker.isnot(None))).all()
+        except SQLAlchemyError as e:
+            # E.g. the database is not migrated yet when the app is created to migrate it
+            session.rollback()
+            logger.warning(f'Cannot load assets, the registry starts empty: {e}')
+            return
+        self._ids = {ticker: asset_id for ticker, asset_id in rows}
+        logger.info(f'Loaded {len(self._ids)} assets')
+
+    def get(self, session: Session, ticker: str) -> Optional[AssetRef]:
+        return self.get_many(session, [ticker]).get(ticker)
+
+    def get_many(self, session: Session, tickers: Iterable[str]) -> Dict[str, AssetRef]:
+        """Return known assets of the given tickers. Missing ones are looked up by one query."""
+
+        assets = {}
+        missing = []
+        for ticker in tickers:
+            asset_id = self._ids.get(ticker)
+            if asset_id is None:
+                missing.append(ticker)
+            else:
+                assets[ticker] = AssetRef(asset_id, ticker)
+
+        if missing:
+            for ticker, asset_id in session.execute(select(Asset.ticker, Asset.id).where(Asset.ticker.in_(missing))):
+                self._ids[ticker] = asset_id
+                assets[ticker] = AssetRef(asset_id, ticker)
+        return assets
+
+    @staticmethod
+    def create(session: Session, ticker: str, dialect: str) -> AssetRef:
+        """
+        Insert an asset unless it exists and return it. Concurrent requests for a new ticker insert it once,
+        since the unique index on tickers makes the others skip their inserts. The asset is not remembered
+        until it is committed, see `add`.
+        """
+
+        insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+        session.execute(insert(Asset.__table__).values(ticker=ticker).on_conflict_do_nothing(index_elements=['ticker']))
+        asset_id = session.execute(select(Asset.id).where(Asset.ticker == ticker)).scalar_one()
+        return AssetRef(asset_id, ticker)
+
+    def add(self, asset: AssetRef) -> None:
+        self._ids[asset.ticker] = asset.id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+asset_registry = AssetRegistry()
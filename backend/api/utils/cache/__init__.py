@@ -0,0 +1,2 @@
+from api.utils.cache.backends import CacheBackend, CachedResponse, MemoryCacheBackend, SQLiteCacheBackend
+from api.utils.cache.cache import ResultCache, result_cache
@@ -0,0 +1,390 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+import datetime as dt
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+CacheStats = Dict[str, Union[int, float, str]]
+
+
+class CachedResponse(NamedTuple):
+    payload: bytes
+    headers: List[Tuple[str, str]]
+
+    @property
+    def size(self) -> int:
+        return len(self.payload) + sum(len(name) + len(value) for name, value in self.headers)
+
+
+class CacheBackend(ABC):
+    """
+    A storage of cached responses bounded by a total size of them. Every response is cached for an asset and
+    a datetime range, so uploads may invalidate responses of ranges they change. Errors of a backend are logged
+    and treated as misses, so a cache never fails a request.
+    """
+
+    name = None
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[CachedResponse]:
+        pass
+
+    @abstractmethod
+    def set(
+        self, key: str, response: CachedResponse, asset_id: int, from_: dt.datetime, to: dt.datetime, ttl: float
+    ) -> bool:
+        """Put a response for the asset and the range [from_, to] and evict least recently used ones if needed."""
+
+    @abstractmethod
+    def invalidate(self, asset_id: int, from_: dt.datetime, to: dt.datetime) -> int:
+        """Drop responses of the asset which ranges intersect [from_, to] and return their number."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        pass
+
+    @abstractmethod
+    def get_stats(self) -> CacheStats:
+        pass
+
+
+class _Entry(NamedTuple):
+    response: CachedResponse
+    asset_id: int
+    from_: dt.datetime
+    to: dt.datetime
+    expires_at: float
+
+
+class MemoryCacheBackend(CacheBackend):
+    """An LRU cache in memory of a process. Every worker process has its own one."""
+
+    name = 'memory'
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            if entry.expires_at <= time.monotonic():
+                self._pop(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.response
+
+    def set(
+        self, key: str, response: CachedResponse, asset_id: int, from_: dt.datetime, to: dt.datetime, ttl: float
+    ) -> bool:
+        size = response.size
+        if ttl <= 0 or size > self.max_size:
+            return False
+
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+            while self._entries and self.size + size > self.max_size:
+                _, entry = self._entries.popitem(last=False)
+                self.size -= entry.response.size
+                self.evictions += 1
+
+            self._entries[key] = _Entry(response, asset_id, from_, to, time.monotonic() + ttl)
+            self.size += size
+        return True
+
+    def invalidate(self, asset_id: int, from_: dt.datetime, to: dt.datetime) -> int:
+        with self._lock:
+            keys = [
+                key
+                for key, entry in self._entries.items()
+                if entry.asset_id == asset_id and entry.from_ <= to and from_ <= entry.to
+            ]
+            for key in keys:
+                self._pop(key)
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def get_stats(self) -> CacheStats:
+        with self._lock:
+            return {
+                'backend': self.name,
+                'entries': len(self._entries),
+                'size': self.size,
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
+
+    def _pop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self.size -= entry.response.size
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    An LRU cache in a local SQLite database shared by all worker processes of a host, so a response is computed
+    once per host and uploads invalidate it for every process. The database is memory-mapped for reads.
+
+    Reads do not write, so worker processes do not wait for each other on hits. Access times and hit counters
+    are buffered by every process and written in batches with the next put or every `flush_interval` seconds,
+    so the LRU order is approximate within that interval. A total size of entries is kept by triggers.
+    """
+
+    name = 'sqlite'
+    COUNTERS = ('hits', 'misses', 'evictions', 'invalidations')
+    DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int,
+        timeout: Optional[float] = 5,
+        mmap_size: Optional[int] = 256 * 1024 * 1024,
+        flush_interval: Optional[float] = 1,
+    ):
+        super().__init__(max_size)
+        self._path = path
+        self._timeout = timeout
+        self._mmap_size = mmap_size
+        self._flush_interval = flush_interval
+        self._accessed_at: Dict[str, float] = {}
+        self._counters = dict.fromkeys(('hits', 'misses'), 0)
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache_entries ('
+                'key TEXT PRIMARY KEY, '
+                'payload BLOB NOT NULL, '
+                'headers TEXT NOT NULL, '
+                'size INTEGER NOT NULL, '
+                'asset_id INTEGER NOT NULL, '
+                'from_datetime TEXT NOT NULL, '
+                'to_datetime TEXT NOT NULL, '
+                'expires_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS index_cache_entries_accessed_at ON cache_entries (accessed_at)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS index_cache_entries_asset_id ON cache_entries (asset_id)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS index_cache_entries_expires_at ON cache_entries (expires_at)'
+            )
+            connection.execute('CREATE TABLE IF NOT EXISTS cache_counters (name TEXT PRIMARY KEY, value INTEGER)')
+            connection.executemany(
+                'INSERT OR IGNORE INTO cache_counters (name, value) VALUES (?, 0)', [(name,) for name in self.COUNTERS]
+            )
+            # A running total instead of a sum over all entries on every put
+            connection.execute(
+                "INSERT OR IGNORE INTO cache_counters (name, value) "
+                "SELECT 'size', COALESCE(SUM(size), 0) FROM cache_entries"
+            )
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_entries_insert AFTER INSERT ON cache_entries BEGIN '
+                "UPDATE cache_counters SET value = value + NEW.size WHERE name = 'size'; END"
+            )
+            connection.execute(
+                'CREATE TRIGGER IF NOT EXISTS cache_entries_delete AFTER DELETE ON cache_entries BEGIN '
+                "UPDATE cache_counters SET value = value - OLD.size WHERE name = 'size'; END"
+            )
+            connection.execute('COMMIT')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation in the autocommit mode, so the cache may be used from any thread and process
+        connection = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+        try:
+            connection.execute(f'PRAGMA mmap_size={self._mmap_size}')
+            yield connection
+        finally:
+            connection.close()
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        now = time.time()
+        try:
+            with self._connect() as connection:
+                row = connection.execute(
+                    'SELECT payload, headers, expires_at FROM cache_entries WHERE key = ?', (key,)
+                ).fetchone()
+        except sqlite3.Error:
+            logger.exception(f'Cannot get a cached response for key={key}')
+            return None
+
+        # Expired entries are deleted by puts, since they are counted in the total size
+        is_hit = row is not None and row[2] > now
+        with self._lock:
+            if is_hit:
+                self._accessed_at[key] = now
+                self._counters['hits'] += 1
+            else:
+                self._counters['misses'] += 1
+            is_flush_due = time.monotonic() - self._flushed_at >= self._flush_interval
+            if is_flush_due:
+                self._flushed_at = time.monotonic()
+        if is_flush_due:
+            self.flush()
+
+        if not is_hit:
+            return None
+        return CachedResponse(bytes(row[0]), [tuple(header) for header in json.loads(row[1])])
+
+    def flush(self) -> None:
+        """Write buffered access times and counters of this process."""
+
+        with self._lock:
+            if not self._accessed_at and not any(self._counters.values()):
+                return
+        try:
+            with self._connect() as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                self._flush(connection)
+                connection.execute('COMMIT')
+        except sqlite3.Error:
+            logger.exception('Cannot write access times of cached responses')
+
+    def _flush(self, connection: sqlite3.Connection) -> None:
+        with self._lock:
+            accessed_at, self._accessed_at = self._accessed_at, {}
+            counters, self._counters = self._counters, dict.fromkeys(self._counters, 0)
+            self._flushed_at = time.monotonic()
+
+        connection.executemany(
+            'UPDATE cache_entries SET accessed_at = MAX(accessed_at, ?) WHERE key = ?',
+            [(at, key) for key, at in accessed_at.items()],
+        )
+        for name, value in counters.items():
+            self._increment(connection, name, value)
+
+    def set(
+        self, key: str, response: CachedResponse, asset_id: int, from_: dt.datetime, to: dt.datetime, ttl: float
+    ) -> bool:
+        size = response.size
+        if ttl <= 0 or size > self.max_size:
+            return False
+
+        now = time.time()
+        try:
+            with self._connect() as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                # Accesses are written first, so entries read since the last flush are not evicted as unused
+                self._flush(connection)
+                connection.execute('DELETE FROM cache_entries WHERE key = ?', (key,))
+                if self._get_size(connection) + size > self.max_size:
+                    self._evict(connection, size, now)
+
+                connection.execute(
+                    'INSERT INTO cache_entries '
+                    '(key, payload, headers, size, asset_id, from_datetime, to_datetime, expires_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (
+                        key,
+                        response.payload,
+                        json.dumps(response.headers),
+                        size,
+                        asset_id,
+                        from_.strftime(self.DATETIME_FORMAT),
+                        to.strftime(self.DATETIME_FORMAT),
+                        now + ttl,
+                        now,
+                    ),
+                )
+                connection.execute('COMMIT')
+        except sqlite3.Error:
+            logger.exception(f'Cannot cache a response for key={key}')
+            return False
+        return True
+
+    def _evict(self, connection: sqlite3.Connection, size: int, now: float) -> None:
+        """Free space for an entry of the given size, expired entries go first."""
+
+        connection.execute('DELETE FROM cache_entries WHERE expires_at <= ?', (now,))
+        excess = self._get_size(connection) + size - self.max_size
+        if excess <= 0:
+            return
+
+        keys = []
+        for key, entry_size in connection.execute('SELECT key, size FROM cache_entries ORDER BY accessed_at'):
+            keys.append((key,))
+            excess -= entry_size
+            if excess <= 0:
+                break
+
+        connection.executemany('DELETE FROM cache_entries WHERE key = ?', keys)
+        self._increment(connection, 'evictions', len(keys))
+
+    def invalidate(self, asset_id: int, from_: dt.datetime, to: dt.datetime) -> int:
+        try:
+            with self._connect() as connection:
+                connection.execute('BEGIN IMMEDIATE')
+                count = connection.execute(
+                    'DELETE FROM cache_entries WHERE asset_id = ? AND from_datetime <= ? AND to_datetime >= ?',
+                    (asset_id, to.strftime(self.DATETIME_FORMAT), from_.strftime(self.DATETIME_FORMAT)),
+                ).rowcount
+                self._increment(connection, 'invalidations', count)
+                connection.execute('COMMIT')
+        except sqlite3.Error:
+            logger.exception(f'Cannot invalidate cached responses for asset={asset_id}')
+            return 0
+        return count
+
+    def clear(self) -> None:
+        with self._connect() as connection:
+            connection.execute('DELETE FROM cache_entries')
+
+    def get_stats(self) -> CacheStats:
+        self.flush()
+        with self._connect() as connection:
+            entries = connection.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+            counters = dict(connection.execute('SELECT name, value FROM cache_counters'))
+        return {
+            'backend': self.name,
+            'entries': entries,
+            'size': counters.pop('size'),
+            'max_size': self.max_size,
+            **counters,
+        }
+
+    @staticmethod
+    def _get_size(connection: sqlite3.Connection) -> int:
+        return connection.execute("SELECT value FROM cache_counters WHERE name = 'size'").fetchone()[0]
+
+    @staticmethod
+    def _increment(connection: sqlite3.Connection, name: str, value: Optional[int] = 1) -> None:
+        if value:
+            connection.execute('UPDATE cache_counters SET value = value + ? WHERE name = ?', (value, name))
@@ -0,0 +1,84 @@
+import datetime as dt
+import logging
+import os
+from typing import Optional
+
+from flask import Flask
+
+from api.utils.cache.backends import (
+    CacheBackend,
+    CachedResponse,
+    CacheStats,
+    MemoryCacheBackend,
+    SQLiteCacheBackend,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """
+    A cache of serialized query results stored by a pluggable backend chosen by the CACHE_BACKEND env variable.
+    Entries expire after their TTL, so they are refreshed eventually even if invalidation does not reach them.
+    """
+
+    def __init__(
+        self, max_size: Optional[int] = 64 * 1024 * 1024, ttl: Optional[float] = 86400, recent_ttl: Optional[float] = 60
+    ):
+        """
+        :param ttl: TTL in seconds of results which are not changed anymore.
+        :param recent_ttl: TTL in seconds of results which may be changed yet, e.g. ones including today.
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.recent_ttl = recent_ttl
+        self.backend = MemoryCacheBackend(max_size)
+
+    def init_app(self, app: Flask) -> None:
+        self.max_size = int(os.environ.get('CACHE_MAX_SIZE', self.max_size))
+        self.ttl = float(os.environ.get('CACHE_TTL', self.ttl))
+        self.recent_ttl = float(os.environ.get('CACHE_RECENT_TTL', self.recent_ttl))
+        self.backend = self.create_backend(os.environ.get('CACHE_BACKEND', MemoryCacheBackend.name), self.max_size)
+        app.extensions['result_cache'] = self
+
+    @staticmethod
+    def create_backend(name: str, max_size: int) -> CacheBackend:
+        if name == MemoryCacheBackend.name:
+            return MemoryCacheBackend(max_size)
+        if name == SQLiteCacheBackend.name:
+            return SQLiteCacheBackend(os.environ.get('CACHE_PATH', 'cache.db'), max_size)
+        raise ValueError(f'Unknown cache backend "{name}"')
+
+    @staticmethod
+    def get_key(
+        asset_id: int, resolution: str, from_: dt.datetime, to: dt.datetime, mimetype: str, version: str
+    ) -> str:
+        return f'{asset_id}:{resolution}:{from_.isoformat()}:{to.isoformat()}:{mimetype}:{version}'
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        return self.backend.get(key)
+
+    def set(
+        self, key: str, response: CachedResponse, asset_id: int, from_: dt.datetime, to: dt.datetime, ttl: float
+    ) -> bool:
+        return self.backend.set(key, response, asset_id, from_, to, ttl)
+
+    def invalidate(self, asset_id: int, from_: dt.datetime, to: dt.datetime) -> int:
+        count = self.backend.invalidate(asset_id, from_, to)
+        if count:
+            logger.debug(f'Invalidated {count} cached results for asset={asset_id} from {from_} to {to}')
+        return count
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def get_stats(self) -> CacheStats:
+        stats = self.backend.get_stats()
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / requests if requests else 0.0
+        return stats
+
+
+result_cache = ResultCache()
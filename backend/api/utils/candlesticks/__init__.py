@@ -0,0 +1,62 @@
+from api.utils.candlesticks.partitions import (
+    create_partition,
+    ensure_partitions,
+    get_month_start,
+    get_month_starts,
+    get_next_month_start,
+    get_partition_name,
+    get_partitions,
+)
+from api.utils.candlesticks.resampling import DEFAULT_RESOLUTION, RESOLUTIONS, AssetIds, build_resample_query
+from api.utils.candlesticks.rollups import ROLLUP_MODELS, refresh_rollup, refresh_rollups
+from api.utils.candlesticks.queries import build_candlestick_query, build_minute_query, group_by_asset
+from api.utils.candlesticks.ingest import (
+    ON_CONFLICT_NOTHING,
+    ingest_candlesticks,
+    parse_candlesticks,
+    to_candlestick_row,
+)
+from api.utils.candlesticks.serializers import (
+    CANDLESTICK_MIMETYPES,
+    COLUMNS_BINARY_MIMETYPE,
+    COLUMNS_JSON_MIMETYPE,
+    COLUMNS_NDJSON_MIMETYPE,
+    JSON_MIMETYPE,
+    NDJSON_MIMETYPE,
+    STREAMING_MIMETYPES,
+    candlesticks_to_binary,
+    candlesticks_to_columns,
+    candlesticks_to_records,
+    dump_candlestick_data,
+)
+from api.utils.candlesticks.coverage import add_coverage, get_batch_coverage_gaps, get_coverage_gaps
+from api.utils.candlesticks.versions import RangeVersion, bump_versions, get_range_version
+from api.utils.candlesticks.conditional import (
+    CoverageData,
+    get_conditional_headers,
+    get_coverage_data,
+    is_final_range,
+    is_not_modified,
+)
+from api.utils.candlesticks.blocks import (
+    decode_block,
+    encode_block,
+    get_block_stats,
+    ingest_blocks,
+    read_batch_block_candlesticks,
+    read_block_candlesticks,
+    refresh_block_rollups,
+)
+from api.utils.candlesticks.archives import ArchiveStore, archive_store, get_archives, merge_candlesticks
+from api.utils.candlesticks.storage import (
+    BLOCKS_STORAGE,
+    ROWS_STORAGE,
+    STORAGES,
+    archive_month,
+    iter_minute_candlesticks,
+    read_batch_minute_candlesticks,
+    read_minute_candlesticks,
+    rehydrate_archive,
+    store_candlesticks,
+    update_rollups,
+)
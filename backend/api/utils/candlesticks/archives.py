@@ -0,0 +1,231 @@
+import datetime as dt
+import hashlib
+import heapq
+import logging
+from operator import attrgetter
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from flask import Flask
+import numpy as np
+from sqlalchemy import and_, or_, select
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from api.database.models import CandlestickArchive
+from api.utils.candlesticks.blocks import MinuteCandlestick
+from api.utils.candlesticks.ingest import PRICE_COLUMNS
+from api.utils.candlesticks.partitions import get_month_start, get_next_month_start
+from api.utils.candlesticks.resampling import AssetIds, asset_condition
+
+
+logger = logging.getLogger(__name__)
+
+# Closed months of minute candlesticks may be moved from the database to uncompressed Arrow IPC files,
+# one per asset and month. Files are memory-mapped on read, so a read maps only pages of the requested range
+# and does not decode anything. Rollups of archived months stay in the database.
+ARCHIVE_FORMAT_VERSION = '1'
+ARCHIVE_SUFFIX = '.arrow'
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+
+def get_archive_schema() -> 'pa.Schema':
+    return pa.schema(
+        [
+            pa.field('datetime', pa.timestamp('us'), nullable=False),
+            *(pa.field(column, pa.float64()) for column in PRICE_COLUMNS),
+        ]
+    )
+
+
+def get_month_range(month: dt.date) -> Tuple[dt.datetime, dt.datetime]:
+    """Return the first and the last microsecond of the month."""
+
+    from_ = dt.datetime.combine(month, dt.time())
+    return from_, get_next_month_start(from_) - dt.timedelta(microseconds=1)
+
+
+class ArchiveStore:
+    """Archive files of candlesticks stored in a local directory chosen by the ARCHIVE_DIR env variable."""
+
+    def __init__(self, directory: Optional[str] = 'archive'):
+        self.directory = Path(directory)
+
+    def init_app(self, app: Flask) -> None:
+        self.directory = Path(os.environ.get('ARCHIVE_DIR', self.directory))
+        app.extensions['archive_store'] = self
+
+    @staticmethod
+    def get_relative_path(asset_id: int, month: dt.date) -> str:
+        return f'{asset_id}/{month:%Y-%m}{ARCHIVE_SUFFIX}'
+
+    def get_path(self, archive: CandlestickArchive) -> Path:
+        return self.directory / archive.path
+
+    def write(self, asset_id: int, month: dt.date, candlesticks: Sequence) -> CandlestickArchive:
+        """Write minute candlesticks of the month ordered by datetime to a file. Return an unsaved record of it."""
+
+        _check_pyarrow()
+        metadata = {'asset_id': str(asset_id), 'month': month.isoformat(), 'version': ARCHIVE_FORMAT_VERSION}
+        schema = get_archive_schema().with_metadata(metadata)
+        arrays = [pa.array([candlestick.datetime for candlestick in candlesticks], type=pa.timestamp('us'))]
+        for column in PRICE_COLUMNS:
+            arrays.append(pa.array([getattr(candlestick, column) for candlestick in candlesticks], type=pa.float64()))
+        table = pa.Table.from_arrays(arrays, schema=schema)
+
+        archive = CandlestickArchive(asset_id=asset_id, month=month, path=self.get_relative_path(asset_id, month))
+        path = self.get_path(archive)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A file is written aside and renamed, so readers never map a partially written file
+        temporary_path = path.with_name(f'.{path.name}.{os.getpid()}')
+        with pa.OSFile(str(temporary_path), 'wb') as sink:
+            with pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+        os.replace(temporary_path, path)
+
+        archive.count = table.num_rows
+        archive.size = path.stat().st_size
+        archive.checksum = get_checksum(path)
+        archive.created_at = dt.datetime.utcnow()
+        logger.debug(f'Wrote {archive.count} candlesticks of asset={asset_id} to {path} ({archive.size} bytes)')
+        return archive
+
+    def open(self, archive: CandlestickArchive) -> 'pa.Table':
+        """Map an archive file to memory. Buffers of the table point to pages of the file."""
+
+        _check_pyarrow()
+        return pa.ipc.open_file(pa.memory_map(str(self.get_path(archive)), 'r')).read_all()
+
+    def read(
+        self, archive: CandlestickArchive, from_: Optional[dt.datetime] = None, to: Optional[dt.datetime] = None
+    ) -> List[MinuteCandlestick]:
+        """Return archived minute candlesticks within [from, to]."""
+
+        table = self.open(archive)
+        # Candlesticks are ordered by datetime, so the range is found by binary search over the mapped column
+        datetimes = table.column('datetime').to_numpy()
+        start, stop = 0, len(datetimes)
+        if from_ is not None:
+            start = int(np.searchsorted(datetimes, np.datetime64(from_, 'us'), 'left'))
+        if to is not None:
+            stop = int(np.searchsorted(datetimes, np.datetime64(to, 'us'), 'right'))
+        if start >= stop:
+            return []
+
+        table = table.slice(start, stop - start)
+        columns = [table.column('datetime').to_numpy().tolist()]
+        for column in PRICE_COLUMNS:
+            values = table.column(column)
+            columns.append(values.to_pylist() if values.null_count else values.to_numpy().tolist())
+        return [MinuteCandlestick(*row, row[0], row[0]) for row in zip(*columns)]
+
+    def verify(self, archive: CandlestickArchive) -> List[str]:
+        """Return problems of an archive file. An intact file has none."""
+
+        path = self.get_path(archive)
+        if not path.exists():
+            return [f'{path} does not exist']
+
+        problems = []
+        if path.stat().st_size != archive.size:
+            problems.append(f'{path} has {path.stat().st_size} bytes instead of {archive.size}')
+        if get_checksum(path) != archive.checksum:
+            problems.append(f'{path} has a wrong checksum')
+            return problems
+
+        table = self.open(archive)
+        if table.num_rows != archive.count:
+            problems.append(f'{path} has {table.num_rows} candlesticks instead of {archive.count}')
+        if table.schema.remove_metadata() != get_archive_schema():
+            problems.append(f'{path} has an unexpected schema')
+            return problems
+
+        datetimes = table.column('datetime').to_numpy()
+        from_, to = get_month_range(archive.month)
+        if len(datetimes) and (datetimes[0] < np.datetime64(from_, 'us') or datetimes[-1] > np.datetime64(to, 'us')):
+            problems.append(f'{path} has candlesticks out of {archive.month:%Y-%m}')
+        if np.any(np.diff(datetimes) <= np.timedelta64(0, 'us')):
+            problems.append(f'{path} has candlesticks out of order')
+        return problems
+
+    def remove(self, archive: CandlestickArchive) -> None:
+        self.get_path(archive).unlink(missing_ok=True)
+
+    def get_unreferenced_paths(self, archives: Iterable[CandlestickArchive]) -> List[Path]:
+        """Return archive files which are not referenced by the given records, e.g. left by uploads to their months."""
+
+        referenced = {self.get_path(archive) for archive in archives}
+        return sorted(path for path in self.directory.glob(f'*/*{ARCHIVE_SUFFIX}') if path not in referenced)
+
+
+def get_checksum(path: Path) -> str:
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHECKSUM_CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    return checksum.hexdigest()
+
+
+def get_archives(
+    session: Session, asset_id: AssetIds, from_: dt.datetime, to: dt.datetime
+) -> List[CandlestickArchive]:
+    """Return archives of months overlapping [from, to] in order of assets and time."""
+
+    query = (
+        select(CandlestickArchive)
+        .where(
+            and_(
+                asset_condition(CandlestickArchive.asset_id, asset_id),
+                CandlestickArchive.month.between(get_month_start(from_).date(), to.date()),
+            )
+        )
+        .order_by(CandlestickArchive.asset_id, CandlestickArchive.month)
+    )
+    return session.execute(query).scalars().all()
+
+
+def get_month_archives(session: Session, datetimes: Iterable[Tuple[int, dt.datetime]]) -> List[CandlestickArchive]:
+    """Return archives of months of the given asset IDs and datetimes."""
+
+    months: Dict[int, Set[dt.date]] = {}
+    for asset_id, datetime in datetimes:
+        months.setdefault(asset_id, set()).add(get_month_start(datetime).date())
+    if not months:
+        return []
+
+    condition = or_(
+        *(
+            and_(CandlestickArchive.asset_id == asset_id, CandlestickArchive.month.in_(sorted(asset_months)))
+            for asset_id, asset_months in months.items()
+        )
+    )
+    return session.execute(select(CandlestickArchive).where(condition)).scalars().all()
+
+
+def merge_candlesticks(archived: List[MinuteCandlestick], candlesticks: Sequence) -> Sequence:
+    """
+    Merge archived minute candlesticks with ones stored in the database in order of datetime.
+    Stored candlesticks win, since they may be written only after a month is archived.
+    """
+
+    if not candlesticks:
+        return archived
+    if not archived:
+        return candlesticks
+
+    datetimes = {candlestick.datetime for candlestick in candlesticks}
+    archived = (candlestick for candlestick in archived if candlestick.datetime not in datetimes)
+    return list(heapq.merge(archived, candlesticks, key=attrgetter('datetime')))
+
+
+def _check_pyarrow() -> None:
+    if pa is None:
+        raise RuntimeError('pyarrow is required to read and write candlestick archives')
+
+
+archive_store = ArchiveStore()
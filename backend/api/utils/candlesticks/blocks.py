@@ -0,0 +1,398 @@
+import datetime as dt
+import struct
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import zlib
+
+import numpy as np
+from sqlalchemy import and_, delete, func, insert, select, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from api.database.models import CandlestickBlock
+from api.utils.candlesticks.ingest import (
+    ON_CONFLICT_MODES,
+    ON_CONFLICT_NOTHING,
+    ON_CONFLICT_UPDATE,
+    PRICE_COLUMNS,
+    CandlestickRow,
+    IngestResult,
+)
+from api.utils.candlesticks.resampling import RESOLUTIONS
+from api.utils.candlesticks.rollups import ROLLUP_MODELS
+
+
+# A block holds minute candlesticks of an asset for a UTC day in columns:
+#   a header of a format version and a row count, uint32 seconds of the day delta-encoded,
+#   and per price column an encoding byte, a null flag byte, an optional packed null mask and int64 deltas of
+#   scaled integers (ticks) or raw float64 values.
+# Bytes of every 8-byte column are shuffled into planes, so zlib finds long runs of equal high bytes.
+BLOCK_VERSION = 1
+HEADER_FORMAT = '<BH'
+COLUMN_HEADER_FORMAT = '<BB'
+FLOAT_ENCODING = 255
+# Prices are scaled by the smallest power of 10 up to this exponent which keeps them exact
+MAX_EXPONENT = 8
+MAX_TICKS = 2 ** 53
+COMPRESSION_LEVEL = 6
+# A key of transaction-level advisory locks per asset, so concurrent uploads merge into the same blocks one by one
+BLOCKS_LOCK_ID = 70162304
+READ_BATCH_DAYS = 31
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class MinuteCandlestick(NamedTuple):
+    """A decoded minute candlestick shaped like rows of build_minute_query."""
+
+    datetime: dt.datetime
+    low_price: Optional[float]
+    high_price: Optional[float]
+    open_price: Optional[float]
+    close_price: Optional[float]
+    volume: Optional[float]
+    weighted_volume: Optional[float]
+    first_datetime: dt.datetime
+    last_datetime: dt.datetime
+
+
+class DecodedBlock(NamedTuple):
+    """Columns of a block. Missing prices are NaN and marked in masks."""
+
+    seconds: np.ndarray
+    values: Dict[str, np.ndarray]
+    nulls: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return len(self.seconds)
+
+
+def encode_block(candlesticks: Iterable[CandlestickRow]) -> bytes:
+    """Pack candlesticks of one day to a block. Datetimes must be unique."""
+
+    candlesticks = sorted(candlesticks, key=lambda candlestick: candlestick['datetime'])
+    count = len(candlesticks)
+    day_start = dt.datetime.combine(candlesticks[0]['datetime'].date(), dt.time())
+    seconds = np.fromiter(
+        ((candlestick['datetime'] - day_start) // dt.timedelta(seconds=1) for candlestick in candlesticks),
+        dtype='<u4',
+        count=count,
+    )
+    if seconds[-1] >= SECONDS_PER_DAY:
+        raise ValueError(f'Candlesticks of a block must be within one day starting at {day_start}')
+
+    chunks = [struct.pack(HEADER_FORMAT, BLOCK_VERSION, count), _delta(seconds).astype('<u4').tobytes()]
+    for column in PRICE_COLUMNS:
+        raw = [candlestick[column] for candlestick in candlesticks]
+        nulls = np.fromiter((value is None for value in raw), dtype=bool, count=count)
+        values = np.fromiter((0.0 if value is None else value for value in raw), dtype='<f8', count=count)
+        chunks.extend(_encode_column(values, nulls))
+    return zlib.compress(b''.join(chunks), COMPRESSION_LEVEL)
+
+
+def decode_block(data: bytes) -> DecodedBlock:
+    buffer = zlib.decompress(data)
+    version, count = struct.unpack_from(HEADER_FORMAT, buffer)
+    if version != BLOCK_VERSION:
+        raise ValueError(f'Unknown block version {version}')
+
+    offset = struct.calcsize(HEADER_FORMAT)
+    seconds = np.cumsum(np.frombuffer(buffer, dtype='<u4', count=count, offset=offset), dtype=np.int64)
+    offset += 4 * count
+
+    values = {}
+    nulls = {}
+    for column in PRICE_COLUMNS:
+        encoding, has_nulls = struct.unpack_from(COLUMN_HEADER_FORMAT, buffer, offset)
+        offset += struct.calcsize(COLUMN_HEADER_FORMAT)
+        if has_nulls:
+            mask_size = (count + 7) // 8
+            mask = np.frombuffer(buffer, dtype=np.uint8, count=mask_size, offset=offset)
+            nulls[column] = np.unpackbits(mask, count=count).astype(bool)
+            offset += mask_size
+        else:
+            nulls[column] = np.zeros(count, dtype=bool)
+
+        column_values = _unshuffle(buffer[offset : offset + 8 * count], count)
+        offset += 8 * count
+        if encoding == FLOAT_ENCODING:
+            column_values = column_values.view('<f8').astype(float)
+        else:
+            column_values = np.cumsum(column_values.view('<i8')) / 10.0 ** encoding
+        column_values[nulls[column]] = np.nan
+        values[column] = column_values
+
+    return DecodedBlock(seconds, values, nulls)
+
+
+def block_to_candlesticks(
+    date: dt.date, block: DecodedBlock, from_: Optional[dt.datetime] = None, to: Optional[dt.datetime] = None
+) -> List[MinuteCandlestick]:
+    """Convert a block to candlesticks within [from, to]."""
+
+    datetimes = (np.datetime64(date, 's') + block.seconds.astype('timedelta64[s]')).astype('datetime64[us]')
+    selected = np.ones(len(block), dtype=bool)
+    if from_ is not None:
+        selected &= datetimes >= np.datetime64(from_, 'us')
+    if to is not None:
+        selected &= datetimes <= np.datetime64(to, 'us')
+
+    columns = [datetimes[selected].tolist()]
+    for column in PRICE_COLUMNS:
+        values = block.values[column][selected].tolist()
+        if block.nulls[column].any():
+            values = [None if is_null else value for value, is_null in zip(values, block.nulls[column][selected])]
+        columns.append(values)
+    return [MinuteCandlestick(*row, row[0], row[0]) for row in zip(*columns)]
+
+
+def get_blocks(
+    session: Session, asset_id: int, from_date: dt.date, to_date: dt.date
+) -> Iterator[Tuple[dt.date, bytes]]:
+    query = (
+        select(CandlestickBlock.date, CandlestickBlock.data)
+        .where(and_(CandlestickBlock.asset_id == asset_id, CandlestickBlock.date.between(from_date, to_date)))
+        .order_by(CandlestickBlock.date)
+    )
+    return iter(session.execute(query))
+
+
+def read_block_candlesticks(
+    session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime
+) -> List[MinuteCandlestick]:
+    """Return minute candlesticks within [from, to] from blocks."""
+
+    candlesticks = []
+    for batch in iter_block_candlesticks(session, asset_id, from_, to):
+        candlesticks.extend(batch)
+    return candlesticks
+
+
+def iter_block_candlesticks(
+    session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime, days: Optional[int] = READ_BATCH_DAYS
+) -> Iterator[List[MinuteCandlestick]]:
+    """Yield minute candlesticks within [from, to] reading blocks of at most the given number of days at once."""
+
+    from_date = from_.date()
+    while from_date <= to.date():
+        to_date = min(from_date + dt.timedelta(days=days - 1), to.date())
+        candlesticks = []
+        for date, data in get_blocks(session, asset_id, from_date, to_date):
+            candlesticks.extend(block_to_candlesticks(date, decode_block(data), from_, to))
+        if candlesticks:
+            yield candlesticks
+        from_date = to_date + dt.timedelta(days=1)
+
+
+def read_batch_block_candlesticks(
+    session: Session, asset_ids: Sequence[int], from_: dt.datetime, to: dt.datetime
+) -> Dict[int, List[MinuteCandlestick]]:
+    """Return minute candlesticks of several assets within [from, to] from blocks read by one query."""
+
+    query = (
+        select(CandlestickBlock.asset_id, CandlestickBlock.date, CandlestickBlock.data)
+        .where(
+            and_(
+                CandlestickBlock.asset_id.in_(asset_ids),
+                CandlestickBlock.date.between(from_.date(), to.date()),
+            )
+        )
+        .order_by(CandlestickBlock.asset_id, CandlestickBlock.date)
+    )
+    candlesticks = {}
+    for asset_id, date, data in session.execute(query):
+        candlesticks.setdefault(asset_id, []).extend(block_to_candlesticks(date, decode_block(data), from_, to))
+    return candlesticks
+
+
+def ingest_blocks(
+    session: Session, rows: List[CandlestickRow], dialect: str, on_conflict: Optional[str] = ON_CONFLICT_NOTHING
+) -> IngestResult:
+    """Merge candlestick rows into blocks of their days skipping or updating the stored ones."""
+
+    if on_conflict not in ON_CONFLICT_MODES:
+        raise ValueError(f'Unknown on_conflict mode "{on_conflict}". Only {", ".join(ON_CONFLICT_MODES)} are possible')
+
+    days: Dict[Tuple[int, dt.date], Dict[dt.datetime, CandlestickRow]] = {}
+    for row in rows:
+        days.setdefault((row['asset_id'], row['datetime'].date()), {})[row['datetime']] = row
+
+    inserted = updated = 0
+    datetimes = []
+    for asset_id in sorted({asset_id for asset_id, _ in days}):
+        if dialect == 'postgresql':
+            session.execute(
+                text('SELECT pg_advisory_xact_lock(:id, :asset_id)'), {'id': BLOCKS_LOCK_ID, 'asset_id': asset_id}
+            )
+
+        dates = sorted(date for day_asset_id, date in days if day_asset_id == asset_id)
+        stored = {
+            date: data for date, data in get_blocks(session, asset_id, dates[0], dates[-1]) if (asset_id, date) in days
+        }
+
+        blocks = []
+        for date in dates:
+            new_rows = days[(asset_id, date)]
+            merged = {}
+            if date in stored:
+                for candlestick in block_to_candlesticks(date, decode_block(stored[date])):
+                    merged[candlestick.datetime] = {
+                        'asset_id': asset_id,
+                        'datetime': candlestick.datetime,
+                        **{column: getattr(candlestick, column) for column in PRICE_COLUMNS},
+                    }
+
+            changed = []
+            for datetime, row in new_rows.items():
+                if datetime not in merged:
+                    inserted += 1
+                elif on_conflict == ON_CONFLICT_UPDATE:
+                    updated += 1
+                else:
+                    continue
+                merged[datetime] = row
+                changed.append(datetime)
+
+            if changed:
+                datetimes.extend(sorted(changed))
+                data = encode_block(merged.values())
+                blocks.append({'asset_id': asset_id, 'date': date, 'count': len(merged), 'data': data})
+
+        if blocks:
+            _upsert_blocks(session, blocks, dialect)
+
+    return IngestResult(inserted, updated, len(rows) - inserted - updated, datetimes)
+
+
+def _upsert_blocks(session: Session, blocks: List[Dict], dialect: str) -> None:
+    insert_ = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+    statement = insert_(CandlestickBlock.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['asset_id', 'date'],
+        set_={'count': statement.excluded['count'], 'data': statement.excluded.data},
+    )
+    session.execute(statement, blocks)
+
+
+def refresh_block_rollups(session: Session, asset_id: int, datetimes: Iterable[dt.datetime]) -> None:
+    """Rebuild rollups of days of the given datetimes from blocks. Rollup buckets never cross a day."""
+
+    dates = sorted({datetime.date() for datetime in datetimes})
+    if not dates:
+        return
+
+    blocks = dict(get_blocks(session, asset_id, dates[0], dates[-1]))
+    for date in dates:
+        from_ = dt.datetime.combine(date, dt.time())
+        to = from_ + dt.timedelta(days=1) - dt.timedelta(microseconds=1)
+        for model in ROLLUP_MODELS.values():
+            session.execute(
+                delete(model.__table__).where(and_(model.asset_id == asset_id, model.datetime.between(from_, to)))
+            )
+
+        if date not in blocks:
+            continue
+
+        block = decode_block(blocks[date])
+        for resolution, model in ROLLUP_MODELS.items():
+            rows = [{'asset_id': asset_id, **row} for row in resample_block(date, block, resolution)]
+            session.execute(insert(model.__table__), rows)
+
+
+def resample_block(date: dt.date, block: DecodedBlock, resolution: str) -> List[Dict]:
+    """Aggregate a block as build_resample_query does: first open, max high, min low, last close, summed volume."""
+
+    buckets = block.seconds // RESOLUTIONS[resolution]
+    _, starts = np.unique(buckets, return_index=True)
+    ends = np.append(starts[1:], len(block)) - 1
+
+    values = block.values
+    low_prices = np.fmin.reduceat(values['low_price'], starts)
+    high_prices = np.fmax.reduceat(values['high_price'], starts)
+
+    has_volume = ~block.nulls['volume']
+    volumes = np.add.reduceat(np.where(has_volume, values['volume'], 0.0), starts)
+    volume_counts = np.add.reduceat(has_volume.astype(int), starts)
+    has_product = has_volume & ~block.nulls['weighted_volume']
+    products = np.where(has_product, values['weighted_volume'] * values['volume'], 0.0)
+    weighted_sums = np.add.reduceat(products, starts)
+    product_counts = np.add.reduceat(has_product.astype(int), starts)
+
+    day_start = dt.datetime.combine(date, dt.time())
+    rows = []
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        volume = float(volumes[i]) if volume_counts[i] else None
+        rows.append(
+            {
+                'datetime': day_start + dt.timedelta(seconds=int(buckets[start]) * RESOLUTIONS[resolution]),
+                'low_price': _to_optional(low_prices[i]),
+                'high_price': _to_optional(high_prices[i]),
+                'open_price': _to_optional(values['open_price'][start]),
+                'close_price': _to_optional(values['close_price'][end]),
+                'volume': volume,
+                'weighted_volume': float(weighted_sums[i]) / volume if product_counts[i] and volume else None,
+                'first_datetime': day_start + dt.timedelta(seconds=int(block.seconds[start])),
+                'last_datetime': day_start + dt.timedelta(seconds=int(block.seconds[end])),
+            }
+        )
+    return rows
+
+
+def get_block_stats(session: Session) -> Tuple[int, int, int]:
+    """Return numbers of blocks and candlesticks in them and the size of packed data."""
+
+    query = select(
+        func.count(),
+        func.coalesce(func.sum(CandlestickBlock.count), 0),
+        func.coalesce(func.sum(func.length(CandlestickBlock.data)), 0),
+    )
+    return tuple(session.execute(query).one())
+
+
+def _encode_column(values: np.ndarray, nulls: np.ndarray) -> List[bytes]:
+    exponent = _get_exponent(values)
+    has_nulls = bool(nulls.any())
+    chunks = [struct.pack(COLUMN_HEADER_FORMAT, FLOAT_ENCODING if exponent is None else exponent, has_nulls)]
+    if has_nulls:
+        chunks.append(np.packbits(nulls).tobytes())
+
+    if exponent is None:
+        chunks.append(_shuffle(values.astype('<f8')))
+    else:
+        ticks = np.round(values * 10.0 ** exponent).astype('<i8')
+        # Missing values repeat the previous one, so their deltas are zero
+        if has_nulls:
+            ticks = ticks.copy()
+            for i in np.flatnonzero(nulls):
+                ticks[i] = ticks[i - 1] if i else 0
+        chunks.append(_shuffle(_delta(ticks)))
+    return chunks
+
+
+def _get_exponent(values: np.ndarray) -> Optional[int]:
+    """Return the smallest decimal exponent scaling values to integers which are decoded to the same floats."""
+
+    if not np.all(np.isfinite(values)):
+        return None
+    for exponent in range(MAX_EXPONENT + 1):
+        scale = 10.0 ** exponent
+        ticks = np.round(values * scale)
+        if np.all(np.abs(ticks) < MAX_TICKS) and np.array_equal(ticks / scale, values):
+            return exponent
+    return None
+
+
+def _delta(values: np.ndarray) -> np.ndarray:
+    return np.diff(values, prepend=values.dtype.type(0)).astype('<i8')
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    return values.view(np.uint8).reshape(-1, 8).T.tobytes()
+
+
+def _unshuffle(buffer: bytes, count: int) -> np.ndarray:
+    return np.frombuffer(buffer, dtype=np.uint8, count=8 * count).reshape(8, count).T.copy().view('<u8').ravel()
+
+
+def _to_optional(value: float) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
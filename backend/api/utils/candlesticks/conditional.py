@@ -0,0 +1,55 @@
+import datetime as dt
+from typing import Dict, List, Mapping, Optional, Union
+
+from sqlalchemy.orm import Session
+from werkzeug.http import http_date, parse_date, parse_etags, quote_etag
+
+from api.utils.candlesticks.coverage import Interval, get_coverage_gaps
+from api.utils.metrics import DB_QUERY_SECONDS
+from api.utils.misc.helpers import datetime_to_string
+
+
+CoverageData = Dict[str, Union[int, List[Dict[str, str]]]]
+
+
+def is_final_range(session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime) -> bool:
+    """Past ranges which were fetched from extra sources entirely are not changed anymore."""
+
+    today = dt.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    if to >= today:
+        return False
+
+    with DB_QUERY_SECONDS.labels('coverage').time():
+        return not get_coverage_gaps(session, asset_id, from_, to + dt.timedelta(seconds=1))
+
+
+def get_conditional_headers(etag: str, last_modified: Optional[dt.datetime], max_age: Optional[int]) -> Dict[str, str]:
+    """Return validators of a response. Without max_age a client revalidates its copy on every request."""
+
+    headers = {
+        'ETag': quote_etag(etag),
+        'Cache-Control': f'public, max-age={max_age}' if max_age is not None else 'no-cache',
+    }
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def is_not_modified(headers: Mapping[str, str], etag: str, last_modified: Optional[dt.datetime]) -> bool:
+    """Check conditional headers of a request, which may be of either the Flask or the ASGI app."""
+
+    # If-Modified-Since is ignored when If-None-Match is sent
+    if_none_match = parse_etags(headers.get('If-None-Match'))
+    if if_none_match:
+        return if_none_match.contains(etag)
+    if_modified_since = parse_date(headers.get('If-Modified-Since'))
+    if if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def get_coverage_data(gaps: List[Interval]) -> CoverageData:
+    return {
+        'gaps': [{'from': datetime_to_string(from_), 'to': datetime_to_string(to)} for from_, to in gaps],
+        'gap_count': len(gaps),
+    }
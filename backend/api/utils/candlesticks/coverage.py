@@ -0,0 +1,88 @@
+import datetime as dt
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from sqlalchemy import and_, select
+from sqlalchemy.orm import Session
+
+from api.database.models import AssetCoverage
+
+
+Interval = Tuple[dt.datetime, dt.datetime]
+
+
+def get_coverage_gaps(session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime) -> List[Interval]:
+    """Return [from, to) sub-intervals of the given interval which are not covered yet."""
+
+    query = (
+        select(AssetCoverage.from_datetime, AssetCoverage.to_datetime)
+        .where(
+            and_(
+                AssetCoverage.asset_id == asset_id,
+                AssetCoverage.from_datetime < to,
+                AssetCoverage.to_datetime > from_,
+            )
+        )
+        .order_by(AssetCoverage.from_datetime)
+    )
+    return _get_gaps(session.execute(query), from_, to)
+
+
+def get_batch_coverage_gaps(
+    session: Session, asset_ids: Sequence[int], from_: dt.datetime, to: dt.datetime
+) -> Dict[int, List[Interval]]:
+    """Return [from, to) sub-intervals which are not covered yet for every asset reading them by one query."""
+
+    query = (
+        select(AssetCoverage.asset_id, AssetCoverage.from_datetime, AssetCoverage.to_datetime)
+        .where(
+            and_(
+                AssetCoverage.asset_id.in_(asset_ids),
+                AssetCoverage.from_datetime < to,
+                AssetCoverage.to_datetime > from_,
+            )
+        )
+        .order_by(AssetCoverage.asset_id, AssetCoverage.from_datetime)
+    )
+    intervals = {asset_id: [] for asset_id in asset_ids}
+    for asset_id, from_datetime, to_datetime in session.execute(query):
+        intervals[asset_id].append((from_datetime, to_datetime))
+    return {asset_id: _get_gaps(asset_intervals, from_, to) for asset_id, asset_intervals in intervals.items()}
+
+
+def _get_gaps(intervals: Iterable[Interval], from_: dt.datetime, to: dt.datetime) -> List[Interval]:
+    """Return sub-intervals of [from, to) which are not covered by the given intervals ordered by their starts."""
+
+    gaps = []
+    start = from_
+    for from_datetime, to_datetime in intervals:
+        if from_datetime > start:
+            gaps.append((start, from_datetime))
+        start = max(start, to_datetime)
+    if start < to:
+        gaps.append((start, to))
+    return gaps
+
+
+def add_coverage(session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime) -> None:
+    """Mark the [from, to) interval as covered merging it with overlapping and adjacent intervals."""
+
+    if from_ >= to:
+        return
+
+    intervals = (
+        session.query(AssetCoverage)
+        .filter(
+            and_(
+                AssetCoverage.asset_id == asset_id,
+                AssetCoverage.from_datetime <= to,
+                AssetCoverage.to_datetime >= from_,
+            )
+        )
+        .all()
+    )
+    for interval in intervals:
+        from_ = min(from_, interval.from_datetime)
+        to = max(to, interval.to_datetime)
+        session.delete(interval)
+
+    session.add(AssetCoverage(asset_id=asset_id, from_datetime=from_, to_datetime=to))
@@ -0,0 +1,184 @@
+import csv
+import datetime as dt
+import io
+import logging
+import os
+from typing import Dict, Iterator, List, NamedTuple, Optional, Union
+
+from sqlalchemy import literal_column, text
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from api.database.models import Candlestick
+from api.utils.candlesticks.partitions import ensure_partitions
+from api.utils.misc.helpers import string_to_datetime
+
+
+logger = logging.getLogger(__name__)
+
+CandlestickRow = Dict[str, Union[int, float, dt.datetime, None]]
+
+PRICE_COLUMNS = ('low_price', 'high_price', 'open_price', 'close_price', 'volume', 'weighted_volume')
+INSERT_COLUMNS = ('asset_id', 'datetime', *PRICE_COLUMNS)
+CONFLICT_COLUMNS = ('asset_id', 'datetime')
+
+# Every row takes 8 bind parameters, so a batch stays far below the limit of 65535 parameters of Postgres.
+POSTGRESQL_BATCH_SIZE = 5000
+SQLITE_BATCH_SIZE = 5000
+# Batches of at least this size are copied to a staging table and inserted from it by one statement.
+COPY_THRESHOLD = int(os.environ.get('BULK_COPY_THRESHOLD', 50000))
+
+ON_CONFLICT_NOTHING = 'nothing'
+ON_CONFLICT_UPDATE = 'update'
+ON_CONFLICT_MODES = (ON_CONFLICT_NOTHING, ON_CONFLICT_UPDATE)
+
+
+class IngestResult(NamedTuple):
+    inserted: int
+    updated: int
+    skipped: int
+    # Datetimes of inserted and updated candlesticks. It may be a superset for databases which cannot return them.
+    datetimes: List[dt.datetime]
+
+
+def parse_candlesticks(candlestick_data: List[Dict[str, Union[float, str]]], asset_id: int) -> List[CandlestickRow]:
+    """
+    Convert posted candlesticks to rows ready for insertion.
+    Candlesticks with the same datetime are deduplicated: the last one wins.
+    """
+
+    rows = {}
+    for candlestick in candlestick_data:
+        row = {'asset_id': asset_id, 'datetime': string_to_datetime(candlestick['datetime'])}
+        for column in PRICE_COLUMNS:
+            value = candlestick.get(column)
+            row[column] = float(value) if value is not None else None
+        rows[row['datetime']] = row
+    return list(rows.values())
+
+
+def to_candlestick_row(asset_id: int, candlestick) -> CandlestickRow:
+    """Convert a minute candlestick read, e.g. of blocks or archives, back to a row ready for insertion."""
+
+    return {
+        'asset_id': asset_id,
+        'datetime': candlestick.datetime,
+        **{column: getattr(candlestick, column) for column in PRICE_COLUMNS},
+    }
+
+
+def ingest_candlesticks(
+    session: Session, rows: List[CandlestickRow], dialect: str, on_conflict: Optional[str] = ON_CONFLICT_NOTHING
+) -> IngestResult:
+    """Insert candlestick rows skipping or updating the stored ones by (datetime, asset_id)."""
+
+    if on_conflict not in ON_CONFLICT_MODES:
+        raise ValueError(f'Unknown on_conflict mode "{on_conflict}". Only {", ".join(ON_CONFLICT_MODES)} are possible')
+
+    if not rows:
+        return IngestResult(0, 0, 0, [])
+
+    if dialect == 'postgresql':
+        ensure_partitions(session, (row['datetime'] for row in rows), dialect)
+        if len(rows) >= COPY_THRESHOLD:
+            return _copy_postgresql(session, rows, on_conflict)
+        return _upsert_postgresql(session, rows, on_conflict)
+    return _upsert_sqlite(session, rows, on_conflict)
+
+
+def _batches(rows: List[CandlestickRow], size: int) -> Iterator[List[CandlestickRow]]:
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
+
+def _upsert_postgresql(session: Session, rows: List[CandlestickRow], on_conflict: str) -> IngestResult:
+    inserted = updated = 0
+    datetimes = []
+    for batch in _batches(rows, POSTGRESQL_BATCH_SIZE):
+        statement = postgresql_insert(Candlestick.__table__).values(batch)
+        if on_conflict == ON_CONFLICT_UPDATE:
+            statement = statement.on_conflict_do_update(
+                index_elements=CONFLICT_COLUMNS,
+                set_={column: statement.excluded[column] for column in PRICE_COLUMNS},
+            )
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=CONFLICT_COLUMNS)
+        # xmax of a freshly inserted row is 0, an updated row has the ID of the updating transaction
+        statement = statement.returning(Candlestick.__table__.c.datetime, literal_column('xmax = 0'))
+
+        for datetime, is_inserted in session.execute(statement):
+            datetimes.append(datetime)
+            if is_inserted:
+                inserted += 1
+            else:
+                updated += 1
+
+    return IngestResult(inserted, updated, len(rows) - inserted - updated, datetimes)
+
+
+def _copy_postgresql(session: Session, rows: List[CandlestickRow], on_conflict: str) -> IngestResult:
+    columns = ', '.join(INSERT_COLUMNS)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] if row[column] is not None else '' for column in INSERT_COLUMNS])
+    buffer.seek(0)
+
+    # The staging table lives in the same transaction as the session, so it is dropped on commit or rollback
+    session.execute(
+        text(
+            f'CREATE TEMP TABLE IF NOT EXISTS candlesticks_staging ON COMMIT DROP AS '
+            f'SELECT {columns} FROM candlesticks WITH NO DATA'
+        )
+    )
+    session.execute(text('TRUNCATE candlesticks_staging'))
+    cursor = session.connection().connection.cursor()
+    cursor.copy_expert(f'COPY candlesticks_staging ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+    logger.debug(f'Copied {len(rows)} candlesticks to the staging table')
+
+    if on_conflict == ON_CONFLICT_UPDATE:
+        assignments = ', '.join(f'{column} = excluded.{column}' for column in PRICE_COLUMNS)
+        conflict_action = f'DO UPDATE SET {assignments}'
+    else:
+        conflict_action = 'DO NOTHING'
+    result = session.execute(
+        text(
+            f'INSERT INTO candlesticks ({columns}) SELECT {columns} FROM candlesticks_staging '
+            f'ON CONFLICT ({", ".join(CONFLICT_COLUMNS)}) {conflict_action} '
+            f'RETURNING datetime, xmax = 0'
+        )
+    )
+
+    inserted = updated = 0
+    datetimes = []
+    for datetime, is_inserted in result:
+        datetimes.append(datetime)
+        if is_inserted:
+            inserted += 1
+        else:
+            updated += 1
+    return IngestResult(inserted, updated, len(rows) - inserted - updated, datetimes)
+
+
+def _upsert_sqlite(session: Session, rows: List[CandlestickRow], on_conflict: str) -> IngestResult:
+    # SQLite cannot tell inserted rows from updated ones, so rows are inserted first and the rest is updated then
+    inserted = updated = 0
+    for batch in _batches(rows, SQLITE_BATCH_SIZE):
+        statement = sqlite_insert(Candlestick.__table__).on_conflict_do_nothing(
+            index_elements=CONFLICT_COLUMNS
+        )
+        batch_inserted = session.execute(statement, batch).rowcount
+        inserted += batch_inserted
+
+        if on_conflict == ON_CONFLICT_UPDATE and batch_inserted < len(batch):
+            statement = sqlite_insert(Candlestick.__table__)
+            statement = statement.on_conflict_do_update(
+                index_elements=CONFLICT_COLUMNS,
+                set_={column: statement.excluded[column] for column in PRICE_COLUMNS},
+            )
+            session.execute(statement, batch)
+            updated += len(batch) - batch_inserted
+
+    datetimes = [row['datetime'] for row in rows] if inserted or updated else []
+    return IngestResult(inserted, updated, len(rows) - inserted - updated, datetimes)
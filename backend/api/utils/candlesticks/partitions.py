@@ -0,0 +1,106 @@
+import datetime as dt
+import logging
+from typing import Iterable, List, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+logger = logging.getLogger(__name__)
+
+# Minute candlesticks are stored in monthly range partitions of the candlesticks table on Postgres.
+# Other databases keep them in one table.
+PARENT_TABLE = 'candlesticks'
+PARTITION_NAME_FORMAT = 'candlesticks_y{year:04d}m{month:02d}'
+# A transaction-level advisory lock serializing creation of partitions by worker processes
+PARTITIONS_LOCK_ID = 7016230418
+
+# Partitions which are known to exist, so they are not looked up on every ingest
+_known_partitions: Set[str] = set()
+
+
+def get_month_start(datetime: dt.datetime) -> dt.datetime:
+    return dt.datetime(datetime.year, datetime.month, 1)
+
+
+def get_next_month_start(datetime: dt.datetime) -> dt.datetime:
+    month_start = get_month_start(datetime)
+    return (month_start + dt.timedelta(days=32)).replace(day=1)
+
+
+def get_partition_name(datetime: dt.datetime) -> str:
+    return PARTITION_NAME_FORMAT.format(year=datetime.year, month=datetime.month)
+
+
+def get_month_starts(from_: dt.datetime, to: dt.datetime) -> List[dt.datetime]:
+    """Return starts of months overlapping [from, to]."""
+
+    month_starts = []
+    month_start = get_month_start(from_)
+    while month_start <= to:
+        month_starts.append(month_start)
+        month_start = get_next_month_start(month_start)
+    return month_starts
+
+
+def ensure_partitions(session: Session, datetimes: Iterable[dt.datetime], dialect: str) -> List[str]:
+    """
+    Create missing monthly partitions for the given datetimes. Return names of created partitions.
+    Creation locks the parent table until the end of a transaction, so partitions should be created in advance by
+    the `partitions ensure` command, and ingestion creates them only for unexpected months.
+    """
+
+    if dialect != 'postgresql':
+        return []
+
+    month_starts = {get_month_start(datetime) for datetime in datetimes}
+    missing = sorted(month for month in month_starts if get_partition_name(month) not in _known_partitions)
+    if not missing:
+        return []
+
+    created = []
+    for month_start in missing:
+        name = get_partition_name(month_start)
+        if session.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar() is not None:
+            _known_partitions.add(name)
+            continue
+
+        # A created partition is not remembered, since it disappears if the transaction is rolled back
+        session.execute(text('SELECT pg_advisory_xact_lock(:id)'), {'id': PARTITIONS_LOCK_ID})
+        if create_partition(session, month_start):
+            created.append(name)
+    return created
+
+
+def create_partition(session: Session, month_start: dt.datetime) -> bool:
+    """Create a partition of the month unless it exists. Return True if it is created."""
+
+    name = get_partition_name(month_start)
+    if session.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar() is not None:
+        return False
+
+    from_ = get_month_start(month_start)
+    to = get_next_month_start(month_start)
+    session.execute(
+        text(
+            f'CREATE TABLE {name} PARTITION OF {PARENT_TABLE} '
+            f"FOR VALUES FROM ('{from_.isoformat(' ')}') TO ('{to.isoformat(' ')}')"
+        )
+    )
+    logger.info(f'Created partition {name} for candlesticks from {from_} to {to}')
+    return True
+
+
+def get_partitions(session: Session) -> List[str]:
+    """Return names of partitions of the candlesticks table in order of time."""
+
+    rows = session.execute(
+        text(
+            'SELECT child.relname FROM pg_inherits '
+            'JOIN pg_class parent ON pg_inherits.inhparent = parent.oid '
+            'JOIN pg_class child ON pg_inherits.inhrelid = child.oid '
+            'WHERE parent.relname = :parent ORDER BY child.relname'
+        ),
+        {'parent': PARENT_TABLE},
+    )
+    return [name for name, in rows]
@@ -0,0 +1,76 @@
+import datetime as dt
+from itertools import groupby
+from operator import attrgetter
+from typing import Dict, List, Sequence
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.sql import Select
+
+from api.database.models import Candlestick
+from api.utils.candlesticks.resampling import RESOLUTIONS, AssetIds, asset_condition, build_resample_query, is_batch
+from api.utils.candlesticks.rollups import ROLLUP_MODELS
+
+
+def build_minute_query(asset_id: AssetIds, from_: dt.datetime, to: dt.datetime) -> Select:
+    """Build a query for minute candlesticks as plain rows shaped like rows of aggregated candlesticks."""
+
+    asset_columns = [Candlestick.asset_id] if is_batch(asset_id) else []
+    return (
+        select(
+            *asset_columns,
+            Candlestick.datetime,
+            Candlestick.low_price,
+            Candlestick.high_price,
+            Candlestick.open_price,
+            Candlestick.close_price,
+            Candlestick.volume,
+            Candlestick.weighted_volume,
+            Candlestick.datetime.label('first_datetime'),
+            Candlestick.datetime.label('last_datetime'),
+        )
+        .where(and_(asset_condition(Candlestick.asset_id, asset_id), Candlestick.datetime.between(from_, to)))
+        .order_by(*asset_columns, Candlestick.datetime)
+    )
+
+
+def build_candlestick_query(
+    asset_id: AssetIds, from_: dt.datetime, to: dt.datetime, resolution: str, dialect: str
+) -> Select:
+    """
+    Build a query for aggregated candlesticks of the given resolution.
+    Rows are read from the coarsest rollup table the resolution is a multiple of, so a long date range touches
+    a few rows per day instead of every minute candlestick.
+    """
+
+    seconds = RESOLUTIONS[resolution]
+    models = [model for model in ROLLUP_MODELS.values() if seconds % RESOLUTIONS[model.resolution] == 0]
+    if not models:
+        return build_resample_query(Candlestick, asset_id, from_, to, resolution, dialect)
+
+    model = max(models, key=lambda model: RESOLUTIONS[model.resolution])
+    if model.resolution != resolution:
+        return build_resample_query(model, asset_id, from_, to, resolution, dialect)
+
+    asset_columns = [model.asset_id] if is_batch(asset_id) else []
+    return (
+        select(
+            *asset_columns,
+            model.datetime,
+            model.low_price,
+            model.high_price,
+            model.open_price,
+            model.close_price,
+            model.volume,
+            model.weighted_volume,
+            func.coalesce(model.first_datetime, model.datetime).label('first_datetime'),
+            func.coalesce(model.last_datetime, model.datetime).label('last_datetime'),
+        )
+        .where(and_(asset_condition(model.asset_id, asset_id), model.datetime.between(from_, to)))
+        .order_by(*asset_columns, model.datetime)
+    )
+
+
+def group_by_asset(rows: Sequence) -> Dict[int, List]:
+    """Split rows of a batch query ordered by asset_id to lists of every asset."""
+
+    return {asset_id: list(asset_rows) for asset_id, asset_rows in groupby(rows, attrgetter('asset_id'))}
@@ -0,0 +1,117 @@
+from typing import Dict, Sequence, Union
+
+from sqlalchemy import BigInteger, DateTime, Integer, and_, cast, func, literal_column, select, type_coerce
+from sqlalchemy.orm import aliased
+from sqlalchemy.sql import ColumnElement, Select
+
+
+# Queries are built for one asset ID, or for a sequence of them to read several assets at once. Rows of a batch query
+# have an asset_id column and are ordered by it first.
+AssetIds = Union[int, Sequence[int]]
+
+DEFAULT_RESOLUTION = '1m'
+RESOLUTIONS: Dict[str, int] = {
+    '1m': 60,
+    '5m': 5 * 60,
+    '15m': 15 * 60,
+    '1h': 60 * 60,
+    '1d': 24 * 60 * 60,
+}
+
+
+def epoch_expression(column: ColumnElement, dialect: str) -> ColumnElement:
+    """Convert a naive UTC datetime column to integer epoch seconds on the database side."""
+
+    if dialect == 'sqlite':
+        return cast(func.strftime('%s', column), Integer)
+    return cast(func.extract('epoch', column), BigInteger)
+
+
+def epoch_to_datetime_expression(epoch: ColumnElement, dialect: str) -> ColumnElement:
+    """Convert integer epoch seconds back to a naive UTC datetime on the database side."""
+
+    if dialect == 'sqlite':
+        # Keep the storage format of SQLAlchemy, so stored rollup datetimes are comparable with bound datetimes
+        return type_coerce(func.datetime(epoch, 'unixepoch').concat('.000000'), DateTime)
+    return type_coerce(func.timezone('UTC', func.to_timestamp(epoch)), DateTime)
+
+
+def bucket_expression(column: ColumnElement, resolution: str, dialect: str) -> ColumnElement:
+    """
+    Return the epoch of the bucket start for the given datetime column.
+    Seconds are rendered as a literal, so the same expression may be used in both SELECT and GROUP BY.
+    """
+
+    seconds = literal_column(str(RESOLUTIONS[resolution]))
+    epoch = epoch_expression(column, dialect)
+    return epoch - epoch % seconds
+
+
+def is_batch(asset_id: AssetIds) -> bool:
+    return not isinstance(asset_id, int)
+
+
+def asset_condition(column: ColumnElement, asset_id: AssetIds) -> ColumnElement:
+    return column.in_(asset_id) if is_batch(asset_id) else column == asset_id
+
+
+def build_resample_query(source, asset_id: AssetIds, from_, to, resolution: str, dialect: str) -> Select:
+    """
+    Build a query aggregating rows of the source model to the given resolution:
+    first open, max high, min low, last close, summed volume and volume-weighted vwap.
+
+    The source model must have the same price columns as Candlestick. Besides candlestick columns every row has
+    first_datetime and last_datetime of the first and the last minute candlesticks aggregated into it.
+    """
+
+    asset_columns = [source.asset_id] if is_batch(asset_id) else []
+    bucket = bucket_expression(source.datetime, resolution, dialect).label('bucket')
+    # Rollup rows start at their buckets, so minutes they aggregate are kept in columns of their own
+    if hasattr(source, 'first_datetime'):
+        first_datetime = func.coalesce(source.first_datetime, source.datetime)
+        last_datetime = func.coalesce(source.last_datetime, source.datetime)
+    else:
+        first_datetime = last_datetime = source.datetime
+    buckets = (
+        select(
+            *asset_columns,
+            bucket,
+            func.min(source.datetime).label('first_row_datetime'),
+            func.max(source.datetime).label('last_row_datetime'),
+            func.min(first_datetime).label('first_datetime'),
+            func.max(last_datetime).label('last_datetime'),
+            func.min(source.low_price).label('low_price'),
+            func.max(source.high_price).label('high_price'),
+            func.sum(source.volume).label('volume'),
+            (func.sum(source.weighted_volume * source.volume) / func.nullif(func.sum(source.volume), 0)).label(
+                'weighted_volume'
+            ),
+        )
+        .where(and_(asset_condition(source.asset_id, asset_id), source.datetime.between(from_, to)))
+        .group_by(*asset_columns, literal_column('bucket'))
+        .subquery()
+    )
+
+    bucket_asset_columns = [buckets.c.asset_id] if is_batch(asset_id) else []
+    bucket_asset_id = buckets.c.asset_id if is_batch(asset_id) else asset_id
+    first = aliased(source)
+    last = aliased(source)
+    query = (
+        select(
+            *bucket_asset_columns,
+            epoch_to_datetime_expression(buckets.c.bucket, dialect).label('datetime'),
+            buckets.c.low_price,
+            buckets.c.high_price,
+            first.open_price,
+            last.close_price,
+            buckets.c.volume,
+            buckets.c.weighted_volume,
+            buckets.c.first_datetime,
+            buckets.c.last_datetime,
+        )
+        .select_from(buckets)
+        .join(first, and_(first.asset_id == bucket_asset_id, first.datetime == buckets.c.first_row_datetime))
+        .join(last, and_(last.asset_id == bucket_asset_id, last.datetime == buckets.c.last_row_datetime))
+        .order_by(*bucket_asset_columns, buckets.c.bucket)
+    )
+    return query
@@ -0,0 +1,71 @@
+import datetime as dt
+from typing import Dict, Iterable, List, Tuple, Type
+
+from sqlalchemy import and_, delete, insert, literal, select
+from sqlalchemy.orm import Session
+
+from api.database.models import Candlestick, Candlestick1d, Candlestick1h, Candlestick5m, CandlestickRollup
+from api.utils.candlesticks.resampling import RESOLUTIONS, build_resample_query
+
+
+ROLLUP_MODELS: Dict[str, Type[CandlestickRollup]] = {
+    model.resolution: model for model in (Candlestick5m, Candlestick1h, Candlestick1d)
+}
+ROLLUP_COLUMNS = (
+    'datetime',
+    'low_price',
+    'high_price',
+    'open_price',
+    'close_price',
+    'volume',
+    'weighted_volume',
+    'first_datetime',
+    'last_datetime',
+)
+
+
+def get_bucket_start(datetime: dt.datetime, resolution: str) -> dt.datetime:
+    seconds = RESOLUTIONS[resolution]
+    epoch = int(datetime.replace(tzinfo=dt.timezone.utc).timestamp())
+    return dt.datetime.utcfromtimestamp(epoch - epoch % seconds)
+
+
+def get_bucket_ranges(datetimes: Iterable[dt.datetime], resolution: str) -> List[Tuple[dt.datetime, dt.datetime]]:
+    """
+    Return closed datetime ranges covering all buckets affected by the given datetimes.
+    Adjacent buckets are merged into one range.
+    """
+
+    step = dt.timedelta(seconds=RESOLUTIONS[resolution])
+    bucket_starts = sorted({get_bucket_start(datetime, resolution) for datetime in datetimes})
+
+    ranges = []
+    for bucket_start in bucket_starts:
+        if ranges and ranges[-1][1] == bucket_start:
+            ranges[-1][1] = bucket_start + step
+        else:
+            ranges.append([bucket_start, bucket_start + step])
+    return [(from_, to - dt.timedelta(microseconds=1)) for from_, to in ranges]
+
+
+def refresh_rollup(
+    session: Session, model: Type[CandlestickRollup], asset_id: int, from_: dt.datetime, to: dt.datetime, dialect: str
+) -> None:
+    """Rebuild rollup buckets of the given model starting between from_ and to from minute candlesticks."""
+
+    session.execute(
+        delete(model.__table__).where(and_(model.asset_id == asset_id, model.datetime.between(from_, to)))
+    )
+
+    buckets = build_resample_query(Candlestick, asset_id, from_, to, model.resolution, dialect).subquery()
+    query = select(literal(asset_id), *[buckets.c[column] for column in ROLLUP_COLUMNS])
+    session.execute(insert(model.__table__).from_select(['asset_id', *ROLLUP_COLUMNS], query))
+
+
+def refresh_rollups(session: Session, asset_id: int, datetimes: Iterable[dt.datetime], dialect: str) -> None:
+    """Rebuild only rollup buckets which contain the given minute candlestick datetimes."""
+
+    datetimes = list(datetimes)
+    for resolution, model in ROLLUP_MODELS.items():
+        for from_, to in get_bucket_ranges(datetimes, resolution):
+            refresh_rollup(session, model, asset_id, from_, to, dialect)
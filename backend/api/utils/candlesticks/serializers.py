@@ -0,0 +1,125 @@
+from array import array
+import datetime as dt
+import json
+from operator import attrgetter
+import struct
+import sys
+from typing import Any, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON_MIMETYPE = 'application/json'
+COLUMNS_JSON_MIMETYPE = 'application/vnd.candlesticks.columns+json'
+# A little-endian uint64 row count followed by int64 epoch milliseconds and a float64 buffer per price column.
+COLUMNS_BINARY_MIMETYPE = 'application/vnd.candlesticks.columns.float64'
+# Streaming formats: a JSON record per line, either a candlestick or a batch of columns, and a trailer record.
+NDJSON_MIMETYPE = 'application/x-ndjson'
+COLUMNS_NDJSON_MIMETYPE = 'application/vnd.candlesticks.columns+x-ndjson'
+STREAMING_MIMETYPES = (NDJSON_MIMETYPE, COLUMNS_NDJSON_MIMETYPE)
+CANDLESTICK_MIMETYPES = (JSON_MIMETYPE, COLUMNS_JSON_MIMETYPE, COLUMNS_BINARY_MIMETYPE, *STREAMING_MIMETYPES)
+
+PRICE_COLUMNS = ('open_price', 'high_price', 'low_price', 'close_price', 'volume', 'weighted_volume')
+# Fields of candlestick records in the order of CandlestickSchema
+RECORD_PRICE_COLUMNS = ('low_price', 'high_price', 'open_price', 'close_price', 'volume', 'weighted_volume')
+
+EPOCH = dt.datetime(1970, 1, 1)
+MILLISECOND = dt.timedelta(milliseconds=1)
+SECOND = dt.timedelta(seconds=1)
+NAN = float('nan')
+
+
+def datetime_to_epoch_ms(datetime: dt.datetime) -> int:
+    return (datetime - EPOCH) // MILLISECOND
+
+
+def candlesticks_to_columns(candlesticks: Sequence) -> Dict[str, List[Union[int, float, None]]]:
+    """Convert candlestick rows to column arrays. Datetimes are converted to epoch milliseconds."""
+
+    columns = {'datetime': [datetime_to_epoch_ms(candlestick.datetime) for candlestick in candlesticks]}
+    for column in PRICE_COLUMNS:
+        columns[column] = [getattr(candlestick, column) for candlestick in candlesticks]
+    return columns
+
+
+def candlesticks_to_binary(candlesticks: Sequence) -> bytes:
+    """Pack candlestick rows to little-endian column buffers. Missing prices are packed as NaN."""
+
+    buffers = [array('q', (datetime_to_epoch_ms(candlestick.datetime) for candlestick in candlesticks))]
+    for column in PRICE_COLUMNS:
+        values = (getattr(candlestick, column) for candlestick in candlesticks)
+        buffers.append(array('d', (NAN if value is None else value for value in values)))
+
+    if sys.byteorder == 'big':
+        for buffer in buffers:
+            buffer.byteswap()
+
+    return struct.pack('<Q', len(candlesticks)) + b''.join(buffer.tobytes() for buffer in buffers)
+
+
+def candlesticks_to_records(candlesticks: Sequence) -> List[Dict[str, Union[int, float, str, None]]]:
+    """Convert plain candlestick rows to the same records as CandlestickSchema dumps."""
+
+    return _candlesticks_to_records(candlesticks)[0]
+
+
+def dump_candlestick_data(data: Dict[str, Any], candlesticks: Sequence) -> bytes:
+    """
+    Serialize a response as Flask jsonify does with candlestick records in `data['results']['data']` if there are
+    any. orjson is used unless it would format some values differently from the json module.
+    """
+
+    records, is_portable = _candlesticks_to_records(candlesticks)
+    if records:
+        data['results']['data'] = records
+    if orjson is not None and is_portable and data['ticker'].isascii():
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def _candlesticks_to_records(candlesticks: Sequence) -> Tuple[List[Dict[str, Union[int, float, str, None]]], bool]:
+    """
+    Build records column by column. Return them and whether all floats are finite and formatted by orjson
+    as by the json module, i.e. without an exponent.
+    """
+
+    count = len(candlesticks)
+    if not count:
+        return [], True
+
+    columns = {}
+    # Epoch seconds are formatted to ISO strings at once, and they are turned to the DATETIME_STRING_FORMAT
+    # replacing separators in a view of their characters
+    epochs = np.fromiter(
+        ((candlestick.datetime - EPOCH) // SECOND for candlestick in candlesticks), dtype=np.int64, count=count
+    )
+    strings = np.datetime_as_string(epochs.astype('datetime64[s]'), unit='s')
+    characters = strings.view(np.uint32).reshape(count, -1)
+    characters[:, 10] = ord('_')
+    characters[:, [13, 16]] = ord('-')
+    columns['datetime'] = strings.tolist()
+
+    is_portable = True
+    for column in RECORD_PRICE_COLUMNS:
+        values = np.fromiter(map(attrgetter(column), candlesticks), dtype=float, count=count)
+        if np.isnan(values).any():
+            # Missing values are NaN in the array, so values are taken as they are to dump them as nulls
+            values = map(attrgetter(column), candlesticks)
+            columns[column] = [None if value is None else float(value) for value in values]
+            is_portable = False
+            continue
+
+        magnitudes = np.abs(values)
+        is_portable = is_portable and bool(
+            np.all(np.isfinite(values) & ((magnitudes == 0) | ((magnitudes >= 1e-4) & (magnitudes < 1e16))))
+        )
+        columns[column] = values.tolist()
+
+    names = list(columns)
+    records = [dict(zip(names, values)) for values in zip(*columns.values())]
+    return records, is_portable
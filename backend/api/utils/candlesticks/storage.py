@@ -0,0 +1,221 @@
+from collections import Counter
+import datetime as dt
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import and_, delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from api.database.models import Candlestick, CandlestickArchive, CandlestickBlock
+from api.utils.candlesticks.archives import (
+    archive_store,
+    get_archives,
+    get_month_archives,
+    get_month_range,
+    merge_candlesticks,
+)
+from api.utils.candlesticks.blocks import (
+    ingest_blocks,
+    iter_block_candlesticks,
+    read_batch_block_candlesticks,
+    read_block_candlesticks,
+    refresh_block_rollups,
+)
+from api.utils.candlesticks.coverage import get_coverage_gaps
+from api.utils.candlesticks.ingest import (
+    ON_CONFLICT_NOTHING,
+    CandlestickRow,
+    IngestResult,
+    ingest_candlesticks,
+    to_candlestick_row,
+)
+from api.utils.candlesticks.queries import build_minute_query, group_by_asset
+from api.utils.candlesticks.rollups import refresh_rollups
+
+
+# Minute candlesticks are stored as rows of the candlesticks table or as packed per-day blocks.
+# Closed months of them may be moved to archive files in both modes. Rollups are stored as rows in all cases.
+ROWS_STORAGE = 'rows'
+BLOCKS_STORAGE = 'blocks'
+STORAGES = (ROWS_STORAGE, BLOCKS_STORAGE)
+
+
+def store_candlesticks(
+    session: Session,
+    rows: List[CandlestickRow],
+    dialect: str,
+    on_conflict: Optional[str] = ON_CONFLICT_NOTHING,
+    storage: Optional[str] = ROWS_STORAGE,
+) -> IngestResult:
+    # Archived months are brought back to the database before they are changed, so conflicts are resolved
+    # against archived candlesticks too and rollups are rebuilt from the whole month
+    for archive in get_month_archives(session, ((row['asset_id'], row['datetime']) for row in rows)):
+        rehydrate_archive(session, archive, dialect, storage)
+    return _store_candlesticks(session, rows, dialect, on_conflict, storage)
+
+
+def _store_candlesticks(
+    session: Session, rows: List[CandlestickRow], dialect: str, on_conflict: str, storage: str
+) -> IngestResult:
+    if storage == BLOCKS_STORAGE:
+        return ingest_blocks(session, rows, dialect, on_conflict)
+    return ingest_candlesticks(session, rows, dialect, on_conflict)
+
+
+def update_rollups(
+    session: Session,
+    asset_id: int,
+    datetimes: Iterable[dt.datetime],
+    dialect: str,
+    storage: Optional[str] = ROWS_STORAGE,
+) -> None:
+    if storage == BLOCKS_STORAGE:
+        refresh_block_rollups(session, asset_id, datetimes)
+    else:
+        refresh_rollups(session, asset_id, datetimes, dialect)
+
+
+def read_minute_candlesticks(
+    session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime, storage: Optional[str] = ROWS_STORAGE
+) -> Sequence:
+    """Return minute candlesticks within [from, to] of the database and archives as plain rows."""
+
+    candlesticks = _read_minute_candlesticks(session, asset_id, from_, to, storage)
+    archives = get_archives(session, asset_id, from_, to)
+    if not archives:
+        return candlesticks
+
+    archived = []
+    for archive in archives:
+        archived.extend(archive_store.read(archive, from_, to))
+    return merge_candlesticks(archived, candlesticks)
+
+
+def read_batch_minute_candlesticks(
+    session: Session,
+    asset_ids: Sequence[int],
+    from_: dt.datetime,
+    to: dt.datetime,
+    storage: Optional[str] = ROWS_STORAGE,
+) -> Dict[int, Sequence]:
+    """Return minute candlesticks of several assets within [from, to] reading every storage by one query."""
+
+    if storage == BLOCKS_STORAGE:
+        candlesticks = read_batch_block_candlesticks(session, asset_ids, from_, to)
+    else:
+        candlesticks = group_by_asset(session.execute(build_minute_query(asset_ids, from_, to)).all())
+
+    archived = {}
+    for archive in get_archives(session, asset_ids, from_, to):
+        archived.setdefault(archive.asset_id, []).extend(archive_store.read(archive, from_, to))
+    for asset_id, archived_candlesticks in archived.items():
+        candlesticks[asset_id] = merge_candlesticks(archived_candlesticks, candlesticks.get(asset_id, []))
+    return candlesticks
+
+
+def _read_minute_candlesticks(
+    session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime, storage: str
+) -> Sequence:
+    if storage == BLOCKS_STORAGE:
+        return read_block_candlesticks(session, asset_id, from_, to)
+    return session.execute(build_minute_query(asset_id, from_, to)).all()
+
+
+def iter_minute_candlesticks(
+    session: Session,
+    asset_id: int,
+    from_: dt.datetime,
+    to: dt.datetime,
+    batch_size: int,
+    storage: Optional[str] = ROWS_STORAGE,
+) -> Iterator[Sequence]:
+    """Yield batches of minute candlesticks within [from, to] without reading all of them at once."""
+
+    # Archived months are read one by one between ranges read from the database
+    start = from_
+    for archive in get_archives(session, asset_id, from_, to):
+        month_start, month_end = get_month_range(archive.month)
+        if start < month_start:
+            yield from _iter_minute_candlesticks(
+                session, asset_id, start, month_start - dt.timedelta(microseconds=1), batch_size, storage
+            )
+
+        month_from, month_to = max(start, month_start), min(to, month_end)
+        candlesticks = merge_candlesticks(
+            archive_store.read(archive, month_from, month_to),
+            _read_minute_candlesticks(session, asset_id, month_from, month_to, storage),
+        )
+        for i in range(0, len(candlesticks), batch_size):
+            yield candlesticks[i : i + batch_size]
+        start = month_end + dt.timedelta(microseconds=1)
+
+    if start <= to:
+        yield from _iter_minute_candlesticks(session, asset_id, start, to, batch_size, storage)
+
+
+def _iter_minute_candlesticks(
+    session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime, batch_size: int, storage: str
+) -> Iterator[Sequence]:
+    if storage == BLOCKS_STORAGE:
+        for candlesticks in iter_block_candlesticks(session, asset_id, from_, to):
+            for i in range(0, len(candlesticks), batch_size):
+                yield candlesticks[i : i + batch_size]
+        return
+
+    query = build_minute_query(asset_id, from_, to).execution_options(stream_results=True)
+    yield from session.execute(query).partitions(batch_size)
+
+
+def archive_month(
+    session: Session, asset_id: int, month: dt.date, storage: Optional[str] = ROWS_STORAGE
+) -> Optional[CandlestickArchive]:
+    """
+    Move minute candlesticks of the asset for the month from the database to an archive file.
+    Return a record of the archive or None if there are no candlesticks. A month which was not fetched entirely
+    is not archived. The file is written before the commit, so a rolled back transaction leaves an unreferenced file,
+    which is overwritten by the next attempt.
+    """
+
+    from_, to = get_month_range(month)
+    # Coverage intervals are half-open, so the end of the month is the next month start
+    if get_coverage_gaps(session, asset_id, from_, to + dt.timedelta(microseconds=1)):
+        raise RuntimeError(f'Candlesticks of asset={asset_id} for {month:%Y-%m} are not covered entirely')
+
+    candlesticks = _read_minute_candlesticks(session, asset_id, from_, to, storage)
+    if not candlesticks:
+        return None
+
+    archive = archive_store.write(asset_id, month, candlesticks)
+    # Candlesticks uploaded since they were read would be lost with the deleted ones
+    if storage == BLOCKS_STORAGE:
+        # An upload merged into a block of a day changes its count, so only blocks of the read counts are deleted
+        counts = Counter(candlestick.datetime.date() for candlestick in candlesticks)
+        blocks = and_(CandlestickBlock.asset_id == asset_id, CandlestickBlock.date.between(from_.date(), to.date()))
+        read_blocks = or_(
+            *(and_(CandlestickBlock.date == date, CandlestickBlock.count == count) for date, count in counts.items())
+        )
+        deleted = session.execute(delete(CandlestickBlock.__table__).where(and_(blocks, read_blocks))).rowcount
+        remaining = session.execute(select(func.count()).select_from(CandlestickBlock).where(blocks)).scalar()
+        is_changed = deleted != len(counts) or remaining
+    else:
+        condition = and_(Candlestick.asset_id == asset_id, Candlestick.datetime.between(from_, to))
+        deleted = session.execute(delete(Candlestick.__table__).where(condition)).rowcount
+        is_changed = deleted != len(candlesticks)
+    if is_changed:
+        raise RuntimeError(f'Candlesticks of asset={asset_id} for {month:%Y-%m} were changed while archiving')
+
+    session.add(archive)
+    return archive
+
+
+def rehydrate_archive(
+    session: Session, archive: CandlestickArchive, dialect: str, storage: Optional[str] = ROWS_STORAGE
+) -> IngestResult:
+    """
+    Move archived candlesticks back to the database and delete the record of the archive.
+    Candlesticks stored in the database win. The file is left to be removed after the commit.
+    """
+
+    rows = [to_candlestick_row(archive.asset_id, candlestick) for candlestick in archive_store.read(archive)]
+    session.delete(archive)
+    session.flush()
+    return _store_candlesticks(session, rows, dialect, ON_CONFLICT_NOTHING, storage)
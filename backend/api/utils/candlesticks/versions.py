@@ -0,0 +1,56 @@
+import datetime as dt
+import hashlib
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from api.database.models import CandlestickVersion
+
+
+class RangeVersion(NamedTuple):
+    """Versions of candlesticks of an asset for days of a range."""
+
+    count: int
+    version: int
+    updated_at: Optional[dt.datetime]
+
+    def get_etag(self, *parts: str) -> str:
+        # Versions are only increased, so their sum and the number of versioned days change on every ingest
+        key = ':'.join((*parts, str(self.count), str(self.version)))
+        return hashlib.sha1(key.encode()).hexdigest()
+
+
+def bump_versions(session: Session, asset_id: int, datetimes: List[dt.datetime], dialect: str) -> None:
+    """Increase versions of days of the given changed candlesticks."""
+
+    now = dt.datetime.utcnow()
+    rows = [
+        {'asset_id': asset_id, 'date': date, 'version': 1, 'updated_at': now}
+        for date in sorted({datetime.date() for datetime in datetimes})
+    ]
+    if not rows:
+        return
+
+    insert = postgresql_insert if dialect == 'postgresql' else sqlite_insert
+    statement = insert(CandlestickVersion.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['asset_id', 'date'],
+        set_={'version': CandlestickVersion.__table__.c.version + 1, 'updated_at': statement.excluded.updated_at},
+    )
+    session.execute(statement, rows)
+
+
+def get_range_version(session: Session, asset_id: int, from_: dt.datetime, to: dt.datetime) -> RangeVersion:
+    query = select(
+        func.count(),
+        func.coalesce(func.sum(CandlestickVersion.version), 0),
+        func.max(CandlestickVersion.updated_at),
+    ).where(
+        CandlestickVersion.asset_id == asset_id,
+        CandlestickVersion.date.between(from_.date(), to.date()),
+    )
+    count, version, updated_at = session.execute(query).one()
+    return RangeVersion(count, version, updated_at)
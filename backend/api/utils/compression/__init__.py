@@ -0,0 +1 @@
+from api.utils.compression.compression import Compression, DecompressionMiddleware, compression
@@ -0,0 +1,156 @@
+import gzip
+import io
+import logging
+import os
+from typing import Callable, Iterable, Optional, Tuple
+import zlib
+
+import brotli
+from flask import Flask, Response, request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge, UnsupportedMediaType
+from werkzeug.http import parse_accept_header
+
+from api.utils.metrics import COMPRESSED_BYTES, COMPRESSION_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+BROTLI_ENCODING = 'br'
+GZIP_ENCODING = 'gzip'
+# Preferred encodings go first, brotli makes smaller responses faster than gzip at the default levels
+ENCODINGS = (BROTLI_ENCODING, GZIP_ENCODING)
+# Decompressors yield request bodies by chunks of at most this size, so a body is checked against a limit early
+DECOMPRESSION_CHUNK_SIZE = 16 * 1024
+
+
+class Compression:
+    """
+    Compression of responses by brotli or gzip chosen by their Accept-Encoding and decompression of request bodies
+    sent with a Content-Encoding, e.g. uploads of the dashboard. Streamed responses are not compressed, so their
+    rows are sent as soon as they are read. ETags of responses are not changed, since they are the same data.
+    """
+
+    def __init__(
+        self,
+        min_size: Optional[int] = 1024,
+        gzip_level: Optional[int] = 1,
+        brotli_quality: Optional[int] = 1,
+        max_body_size: Optional[int] = 512 * 1024 * 1024,
+    ):
+        """
+        :param min_size: bytes of the least response which is compressed.
+        :param gzip_level: the fastest level by default. Higher ones take a few times longer for long ranges
+            and make responses only 10-20% smaller.
+        :param max_body_size: bytes of the largest decompressed request body. Larger ones are rejected.
+        """
+
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.max_body_size = max_body_size
+
+    def init_app(self, app: Flask) -> None:
+        self.min_size = int(os.environ.get('COMPRESSION_MIN_SIZE', self.min_size))
+        self.gzip_level = int(os.environ.get('COMPRESSION_GZIP_LEVEL', self.gzip_level))
+        self.brotli_quality = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', self.brotli_quality))
+        self.max_body_size = int(os.environ.get('COMPRESSION_MAX_BODY_SIZE', self.max_body_size))
+        app.after_request(self.compress_response)
+        app.wsgi_app = DecompressionMiddleware(app.wsgi_app, self.max_body_size)
+        app.extensions['compression'] = self
+
+    def is_compressible(self, status_code: int, payload_size: int) -> bool:
+        return status_code == 200 and payload_size >= self.min_size
+
+    @staticmethod
+    def get_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+        """Return the most acceptable of supported encodings, or None if a response should not be encoded."""
+
+        accept = parse_accept_header(accept_encoding)
+        encoding = max(ENCODINGS, key=lambda encoding: accept[encoding])
+        return encoding if accept[encoding] > 0 else None
+
+    def compress(self, payload: bytes, encoding: str) -> bytes:
+        with COMPRESSION_SECONDS.labels(encoding).time():
+            if encoding == BROTLI_ENCODING:
+                compressed = brotli.compress(payload, quality=self.brotli_quality)
+            else:
+                compressed = gzip.compress(payload, self.gzip_level)
+        COMPRESSED_BYTES.labels(encoding).observe(len(compressed))
+        return compressed
+
+    def compress_response(self, response: Response) -> Response:
+        if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers:
+            return response
+        if not self.is_compressible(response.status_code, response.calculate_content_length() or 0):
+            return response
+
+        # Responses of the same URL differ by the header, so shared caches keep them apart
+        response.vary.add('Accept-Encoding')
+        encoding = self.get_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(self.compress(response.get_data(), encoding))
+            response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class DecompressionMiddleware:
+    """A WSGI middleware which replaces request bodies encoded by brotli or gzip with decoded ones."""
+
+    def __init__(self, app: Callable, max_body_size: int):
+        self.app = app
+        self.max_body_size = max_body_size
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        encoding = environ.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return self.app(environ, start_response)
+        if encoding not in ENCODINGS:
+            logger.warning(f'Cannot decode a request body encoded by "{encoding}"')
+            return UnsupportedMediaType()(environ, start_response)
+
+        content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        body = environ['wsgi.input'].read(content_length)
+        try:
+            body, is_complete = self.decompress(body, encoding)
+        except (brotli.error, zlib.error) as e:
+            logger.warning(f'Cannot decode a request body encoded by "{encoding}": {e}')
+            return BadRequest()(environ, start_response)
+        if not is_complete:
+            logger.warning(f'A decoded request body is larger than {self.max_body_size} bytes')
+            return RequestEntityTooLarge()(environ, start_response)
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
+
+    def decompress(self, body: bytes, encoding: str) -> Tuple[bytes, bool]:
+        """Decode a body up to the size limit. Return decoded data and whether the body is decoded entirely."""
+
+        if encoding == GZIP_ENCODING:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            data = decompressor.decompress(body, self.max_body_size + 1)
+            if len(data) > self.max_body_size:
+                return b'', False
+            if not decompressor.eof:
+                raise zlib.error('Incomplete gzip data')
+            return data, True
+
+        # A brotli decoder keeps its output below the limit of a call, so a small body cannot expand at once
+        decompressor = brotli.Decompressor()
+        chunks = []
+        size = 0
+        data = body
+        while not decompressor.is_finished():
+            chunk = decompressor.process(data, output_buffer_limit=DECOMPRESSION_CHUNK_SIZE)
+            data = b''
+            size += len(chunk)
+            if size > self.max_body_size:
+                return b'', False
+            chunks.append(chunk)
+            if not chunk and not decompressor.is_finished() and decompressor.can_accept_more_data():
+                raise brotli.error('Incomplete brotli data')
+        return b''.join(chunks), True
+
+
+compression = Compression()
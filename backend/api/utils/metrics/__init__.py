@@ -0,0 +1,15 @@
+from api.utils.metrics.metrics import (
+    COMPRESSED_BYTES,
+    COMPRESSION_SECONDS,
+    DB_POOL_CHECKOUT_SECONDS,
+    DB_POOL_CONNECTIONS,
+    DB_POOL_SATURATION,
+    DB_POOL_TIMEOUTS,
+    DB_QUERY_SECONDS,
+    INGESTED_ROWS,
+    PAYLOAD_BYTES,
+    REQUEST_SECONDS,
+    ROWS_RETURNED,
+    SERIALIZATION_SECONDS,
+    generate_metrics,
+)
@@ -0,0 +1,103 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+ROW_BUCKETS = (0, 10, 100, 500, 1000, 5000, 10000, 50000, 100000, 500000, 1000000)
+BYTE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 ** 2, 5 * 1024 ** 2, 20 * 1024 ** 2, 100 * 1024 ** 2)
+
+REQUEST_SECONDS = Histogram(
+    'candlestick_api_request_seconds',
+    'Duration of API requests.',
+    ['method', 'endpoint', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_QUERY_SECONDS = Histogram(
+    'candlestick_api_db_query_seconds',
+    'Duration of database queries by a query kind.',
+    ['query'],
+    buckets=LATENCY_BUCKETS,
+)
+SERIALIZATION_SECONDS = Histogram(
+    'candlestick_api_serialization_seconds',
+    'Duration of candlestick serialization by a response format.',
+    ['format'],
+    buckets=LATENCY_BUCKETS,
+)
+ROWS_RETURNED = Histogram(
+    'candlestick_api_rows_returned',
+    'Number of candlesticks in responses by a resolution.',
+    ['resolution'],
+    buckets=ROW_BUCKETS,
+)
+PAYLOAD_BYTES = Histogram(
+    'candlestick_api_payload_bytes',
+    'Size of candlestick responses by a response format.',
+    ['format'],
+    buckets=BYTE_BUCKETS,
+)
+COMPRESSION_SECONDS = Histogram(
+    'candlestick_api_compression_seconds',
+    'Duration of response compression by an encoding.',
+    ['encoding'],
+    buckets=LATENCY_BUCKETS,
+)
+COMPRESSED_BYTES = Histogram(
+    'candlestick_api_compressed_bytes',
+    'Size of compressed responses by an encoding.',
+    ['encoding'],
+    buckets=BYTE_BUCKETS,
+)
+INGESTED_ROWS = Counter(
+    'candlestick_api_ingested_rows',
+    'Number of uploaded candlesticks by a result of ingestion.',
+    ['result'],
+)
+
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    'candlestick_api_db_pool_checkout_seconds',
+    'Time to get a connection from a database pool, including waiting for a free one.',
+    ['pool'],
+    buckets=LATENCY_BUCKETS,
+)
+DB_POOL_TIMEOUTS = Counter(
+    'candlestick_api_db_pool_timeouts',
+    'Number of connection requests which timed out waiting for a database pool.',
+    ['pool'],
+)
+# Connections are summed over live gunicorn workers on a scrape, saturation is reported by every worker
+DB_POOL_CONNECTIONS = Gauge(
+    'candlestick_api_db_pool_connections',
+    'Number of connections of database pools by a state.',
+    ['pool', 'state'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_SATURATION = Gauge(
+    'candlestick_api_db_pool_saturation',
+    'Share of connections of a database pool which are checked out, of its size with the overflow.',
+    ['pool'],
+    multiprocess_mode='liveall',
+)
+
+
+def generate_metrics() -> Tuple[bytes, str]:
+    """Return metrics in the Prometheus text format and its content type."""
+
+    # Metrics of every gunicorn worker are written to files in PROMETHEUS_MULTIPROC_DIR and merged on a scrape
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
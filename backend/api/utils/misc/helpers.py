@@ -3,16 +3,20 @@ import logging
 from logging.config import dictConfig
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from dotenv import load_dotenv
 
+from api.database.pool import InstrumentedAsyncQueuePool, InstrumentedQueuePool
+
 logger = logging.getLogger(__name__)
 
 
 DATE_STRING_FORMAT = '%Y-%m-%d'
 DATETIME_STRING_FORMAT = '%Y-%m-%d_%H-%M-%S'
 
+ASYNC_DRIVERS = {'postgresql': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
 
 def datetime_to_string(datetime: dt.datetime) -> str:
     return datetime.strftime(DATETIME_STRING_FORMAT)
@@ -29,10 +33,10 @@ def timestamp_to_datetime_utc(timestamp: int) -> dt.datetime:
     return dt.datetime.fromtimestamp(timestamp, tz=dt.timezone.utc)
 
 
-def get_db_connection_string() -> str:
+def get_db_connection_string(host: Optional[str] = None, port: Optional[str] = None) -> str:
     type_ = os.environ.get('DB_TYPE', 'sqlite')
-    host = os.environ.get('DB_HOST', '')
-    port = os.environ.get('DB_PORT', '')
+    host = host or os.environ.get('DB_HOST', '')
+    port = port or os.environ.get('DB_PORT', '')
     name = os.environ.get('DB_NAME', 'test.db')
     user = os.environ.get('DB_USER', '')
     password = os.environ.get('DB_PASSWORD', '')
@@ -44,6 +48,42 @@ def get_db_connection_string() -> str:
     return s
 
 
+def get_db_replica_connection_string() -> Optional[str]:
+    """Return a connection string of a read replica, which has the same database and credentials as the primary."""
+
+    host = os.environ.get('DB_REPLICA_HOST')
+    if not host or os.environ.get('DB_TYPE', 'sqlite') == 'sqlite':
+        return None
+    return get_db_connection_string(host, os.environ.get('DB_REPLICA_PORT'))
+
+
+def get_async_db_connection_string(connection_string: str) -> str:
+    """Return a connection string of the same database with an async driver."""
+
+    type_, rest = connection_string.split('://', 1)
+    return f'{ASYNC_DRIVERS[type_]}://{rest}'
+
+
+def get_db_engine_options(pool_name: Optional[str] = 'primary', is_async: Optional[bool] = False) -> Dict[str, Any]:
+    """Return options of a database engine. Every gunicorn worker has its own pool of this size."""
+
+    options = {
+        # Connections dropped by the server or a proxy are replaced before they are used
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', 'true').lower() not in ('0', 'false', 'no'),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    }
+    # SQLite connections are cheap to open, so they are pooled by defaults of SQLAlchemy
+    if os.environ.get('DB_TYPE', 'sqlite') != 'sqlite':
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool if is_async else InstrumentedQueuePool,
+            pool_logging_name=pool_name,
+            pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+            max_overflow=int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+            pool_timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+        )
+    return options
+
+
 def set_env(dotenv_config: Optional[str] = '') -> None:
     if dotenv_config:
         dotenv_config = Path(dotenv_config).absolute()
@@ -81,6 +121,7 @@ def set_logger_settings(log_file: Path, level: Optional[int] = logging.INFO) ->
         },
         loggers={
             'api_request': {'handlers': ['console', 'api_request'], 'level': level, 'propagate': False},
+            'api_request_metadata': {'handlers': ['api_request'], 'level': logging.INFO, 'propagate': False},
         },
         root={
             'handlers': ['console'],
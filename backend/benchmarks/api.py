@@ -0,0 +1,321 @@
+"""
+Benchmark read and write paths of the API in a process with the same WSGI stack as a gunicorn worker.
+A database is seeded with synthetic minute candlesticks, and results are written as JSON, so they may be compared
+between commits.
+
+    python -m benchmarks.api --tickers 2 --years 1 --output api.json
+
+The database is configured as for the API by env variables or a dotenv config. By default a temporary SQLite
+database is used. For Postgres apply migrations first.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List, Tuple
+
+from flask import Flask
+
+from api import create_app
+from api.database import db, Asset
+from api.utils.candlesticks import (
+    COLUMNS_BINARY_MIMETYPE,
+    JSON_MIMETYPE,
+    add_coverage,
+    bump_versions,
+    store_candlesticks,
+    update_rollups,
+)
+from api.utils.misc.helpers import DATETIME_STRING_FORMAT, DATE_STRING_FORMAT
+
+
+START_DATE = dt.date(2020, 1, 1)
+MARKET_OPEN = dt.time(14, 30)
+MINUTES_PER_DAY = 390
+
+# The finest resolution the dashboard uses for a range not longer than the given number of days
+RESOLUTION_DAYS = ((3, '1m'), (14, '5m'), (60, '15m'), (400, '1h'))
+
+BenchmarkResult = Dict[str, object]
+
+
+def get_trading_days(from_: dt.date, days: int) -> List[dt.date]:
+    dates = (from_ + dt.timedelta(days=i) for i in range(days))
+    return [date for date in dates if date.weekday() < 5]
+
+
+def generate_candlesticks(dates: List[dt.date], seed: int) -> List[Dict[str, object]]:
+    """Generate a random walk of minute candlesticks during regular market hours of the given days."""
+
+    random_ = random.Random(seed)
+    price = 100.0
+    candlesticks = []
+    for date in dates:
+        market_open = dt.datetime.combine(date, MARKET_OPEN)
+        for minute in range(MINUTES_PER_DAY):
+            open_price = price
+            price = max(price + random_.gauss(0, 0.05), 1.0)
+            candlesticks.append(
+                {
+                    'datetime': market_open + dt.timedelta(minutes=minute),
+                    'open_price': round(open_price, 4),
+                    'close_price': round(price, 4),
+                    'low_price': round(min(open_price, price) - random_.random() * 0.05, 4),
+                    'high_price': round(max(open_price, price) + random_.random() * 0.05, 4),
+                    'volume': float(random_.randint(100, 50000)),
+                    'weighted_volume': round((open_price + price) / 2, 4),
+                }
+            )
+    return candlesticks
+
+
+def seed(app: Flask, tickers: List[str], years: int) -> BenchmarkResult:
+    """Store candlesticks, rollups, coverage and versions of the given tickers month by month."""
+
+    dates = get_trading_days(START_DATE, 365 * years)
+    started_at = time.perf_counter()
+    rows_count = 0
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        storage = app.config['CANDLESTICK_STORAGE']
+        for i, ticker in enumerate(tickers):
+            asset = Asset.query.filter_by(ticker=ticker).first()
+            if asset:
+                print(f'{ticker} is seeded already. Skip', file=sys.stderr)
+                continue
+
+            asset = Asset(ticker=ticker)
+            db.session.add(asset)
+            db.session.flush()
+            for month_start in range(0, len(dates), 21):
+                month = dates[month_start : month_start + 21]
+                candlesticks = generate_candlesticks(month, seed=i * 100000 + month_start)
+                rows = [{'asset_id': asset.id, **candlestick} for candlestick in candlesticks]
+                result = store_candlesticks(db.session, rows, dialect, storage=storage)
+                update_rollups(db.session, asset.id, result.datetimes, dialect, storage)
+                bump_versions(db.session, asset.id, result.datetimes, dialect)
+                add_coverage(
+                    db.session,
+                    asset.id,
+                    dt.datetime.combine(month[0], dt.time()),
+                    dt.datetime.combine(month[-1] + dt.timedelta(days=1), dt.time()),
+                )
+                db.session.commit()
+                rows_count += len(rows)
+            print(f'Seeded {ticker}', file=sys.stderr)
+
+    seconds = time.perf_counter() - started_at
+    return {'rows': rows_count, 'seconds': seconds, 'rows_per_second': rows_count / seconds if seconds else None}
+
+
+def get_resolution(days: int) -> str:
+    for max_days, resolution in RESOLUTION_DAYS:
+        if days <= max_days:
+            return resolution
+    return '1d'
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    latencies = sorted(latencies)
+
+    def percentile(q: float) -> float:
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    return {
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(0.5) * 1000,
+        'p95_ms': percentile(0.95) * 1000,
+        'p99_ms': percentile(0.99) * 1000,
+        'max_ms': latencies[-1] * 1000,
+    }
+
+
+def measure_peak_memory(app: Flask, method: str, url: str, **kwargs) -> int:
+    """Return a peak of memory allocated by Python while a request is handled."""
+
+    client = app.test_client()
+    tracemalloc.start()
+    try:
+        getattr(client, method)(url, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def benchmark_get(
+    app: Flask, tickers: List[str], years: int, range_days: List[int], requests: int, concurrency: int
+) -> List[BenchmarkResult]:
+    last_date = START_DATE + dt.timedelta(days=365 * years - 1)
+    results = []
+    for days in range_days:
+        resolution = get_resolution(days)
+        for mimetype in (JSON_MIMETYPE, COLUMNS_BINARY_MIMETYPE):
+            # Ranges are chosen randomly, so a result cache or the database cache do not serve the same range
+            random_ = random.Random(days)
+            urls = []
+            for _ in range(requests):
+                from_ = START_DATE + dt.timedelta(days=random_.randint(0, max((last_date - START_DATE).days - days, 0)))
+                to = from_ + dt.timedelta(days=days - 1)
+                ticker = random_.choice(tickers)
+                urls.append(
+                    f'/assets/candlesticks/{ticker}/{from_.strftime(DATE_STRING_FORMAT)}/'
+                    f'{to.strftime(DATE_STRING_FORMAT)}?resolution={resolution}'
+                )
+
+            headers = {'Accept': mimetype}
+
+            def request(url: str) -> Tuple[float, int]:
+                client = app.test_client()
+                started_at = time.perf_counter()
+                response = client.get(url, headers=headers)
+                latency = time.perf_counter() - started_at
+                if response.status_code != 200:
+                    raise RuntimeError(f'GET {url} answered {response.status_code}')
+                return latency, len(response.data)
+
+            started_at = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                measurements = list(executor.map(request, urls))
+            seconds = time.perf_counter() - started_at
+
+            latencies = [latency for latency, _ in measurements]
+            result = {
+                'range_days': days,
+                'resolution': resolution,
+                'mimetype': mimetype,
+                'requests': requests,
+                'concurrency': concurrency,
+                'requests_per_second': requests / seconds,
+                'mean_payload_bytes': statistics.mean(size for _, size in measurements),
+                'peak_allocated_bytes': measure_peak_memory(app, 'get', urls[0], headers=headers),
+                **summarize(latencies),
+            }
+            results.append(result)
+            print(
+                f'GET {days:>4} days {resolution:>3} {mimetype}: p50 {result["p50_ms"]:.1f} ms, '
+                f'p95 {result["p95_ms"]:.1f} ms, {result["requests_per_second"]:.1f} rps',
+                file=sys.stderr,
+            )
+    return results
+
+
+def benchmark_post(app: Flask, batch_sizes: List[int], duplicate_ratios: List[float]) -> List[BenchmarkResult]:
+    """Upload batches to new tickers, a part of a batch is stored in advance to be duplicates."""
+
+    results = []
+    run_id = int(time.time())
+    for batch_size in batch_sizes:
+        days = -(-batch_size // MINUTES_PER_DAY)
+        dates = get_trading_days(START_DATE, days * 2)[:days]
+        for duplicate_ratio in duplicate_ratios:
+            ticker = f'POST_{run_id}_{batch_size}_{int(duplicate_ratio * 100)}'
+            candlesticks = [
+                {**candlestick, 'datetime': candlestick['datetime'].strftime(DATETIME_STRING_FORMAT)}
+                for candlestick in generate_candlesticks(dates, seed=batch_size)[:batch_size]
+            ]
+            client = app.test_client()
+            duplicates = int(batch_size * duplicate_ratio)
+            if duplicates:
+                client.post('/assets', json={'ticker': ticker, 'candlesticks': candlesticks[:duplicates]})
+
+            started_at = time.perf_counter()
+            response = client.post('/assets', json={'ticker': ticker, 'candlesticks': candlesticks})
+            seconds = time.perf_counter() - started_at
+            if response.status_code != 200:
+                raise RuntimeError(f'POST of {batch_size} candlesticks answered {response.status_code}')
+
+            result = {
+                'batch_size': batch_size,
+                'duplicate_ratio': duplicate_ratio,
+                'seconds': seconds,
+                'rows_per_second': batch_size / seconds,
+                **response.get_json()['results'],
+            }
+            results.append(result)
+            print(
+                f'POST {batch_size:>6} rows, {duplicate_ratio:.0%} duplicates: {result["rows_per_second"]:.0f} rows/s',
+                file=sys.stderr,
+            )
+    return results
+
+
+def get_environment(app: Flask, args: argparse.Namespace) -> BenchmarkResult:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+
+    return {
+        'commit': commit,
+        'started_at': dt.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dialect': dialect,
+        'storage': app.config['CANDLESTICK_STORAGE'],
+        'tickers': args.tickers,
+        'years': args.years,
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    if not args.config:
+        os.environ.setdefault('DB_TYPE', 'sqlite')
+        os.environ.setdefault('DB_NAME', os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    os.environ.setdefault('LOG_DIR', os.path.join(tempfile.gettempdir(), 'benchmark_logs'))
+    os.environ.setdefault('CRLF_TOKEN', 'benchmark')
+    # Every request should run queries unless the result cache is benchmarked
+    if not args.cache:
+        os.environ['CACHE_MAX_SIZE'] = '0'
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.create_all()
+
+    tickers = [f'BENCH{i}' for i in range(args.tickers)]
+    results = {'environment': get_environment(app, args)}
+    results['seed'] = seed(app, tickers, args.years)
+    results['memory_after_seed'] = {'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+    results['get'] = benchmark_get(app, tickers, args.years, args.range_days, args.requests, args.concurrency)
+    results['post'] = benchmark_post(app, args.batch_sizes, args.duplicate_ratios)
+    results['memory'] = {'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, required=False, default='', help='A dotenv file path.')
+    parser.add_argument('--tickers', type=int, default=2, help='A number of seeded tickers.')
+    parser.add_argument('--years', type=int, default=1, help='Years of seeded minute candlesticks per ticker.')
+    parser.add_argument('--range-days', type=int, nargs='+', default=[1, 7, 30, 365], help='Days of GET ranges.')
+    parser.add_argument('--requests', type=int, default=50, help='A number of GET requests per a range.')
+    parser.add_argument('--concurrency', type=int, default=1, help='A number of threads sending GET requests.')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000], help='POST sizes.')
+    parser.add_argument(
+        '--duplicate-ratios', type=float, nargs='+', default=[0, 0.5, 1], help='Parts of stored candlesticks in POSTs.'
+    )
+    parser.add_argument('--cache', action='store_true', help='If set, the result cache is enabled.')
+    parser.add_argument('--output', type=str, default='', help='A JSON file path. By default results are printed.')
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,263 @@
+"""
+Load test the API served by gunicorn in the sync (Flask) and async (ASGI) serving modes. Both modes are run with
+the same number of workers, and a mix of short and multi-year candlestick reads is sent by concurrent clients
+for a fixed time. Throughput, latencies of both kinds of reads and memory of server processes are written as JSON.
+
+    python -m benchmarks.load --tickers 2 --years 2 --workers 2 --concurrency 32 --output load.json
+
+The database is configured and seeded as by `benchmarks.api`. Memory is measured on Linux only.
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from api import create_app
+from api.database import db
+from api.utils.candlesticks import JSON_MIMETYPE
+from api.utils.misc.helpers import DATE_STRING_FORMAT
+from benchmarks.api import START_DATE, BenchmarkResult, get_environment, seed, summarize
+
+
+SERVER_COMMANDS = {
+    'sync': ['api:create_app({config!r})'],
+    'async': ['api.asgi:create_asgi_app({config!r})', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+READY_TIMEOUT = 60
+MEMORY_SAMPLE_INTERVAL = 0.5
+
+
+def get_process_tree(pid: int) -> List[int]:
+    """Return a process and all its descendants found in /proc."""
+
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # A process name in parentheses may contain spaces, so fields are counted after it
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    tree = [pid]
+    for parent in tree:
+        tree.extend(children.get(parent, []))
+    return tree
+
+
+def get_rss(pid: int) -> Optional[int]:
+    """Return a sum of resident memory of a process tree in bytes, or None if /proc is not available."""
+
+    if not os.path.isdir('/proc'):
+        return None
+
+    rss = 0
+    for tree_pid in get_process_tree(pid):
+        try:
+            with open(f'/proc/{tree_pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        rss += int(line.split()[1]) * 1024
+                        break
+        except OSError:
+            continue
+    return rss
+
+
+class MemorySampler(threading.Thread):
+    """Sample memory of a server while it is loaded and keep the peak."""
+
+    def __init__(self, pid: int):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.max_rss: Optional[int] = None
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(MEMORY_SAMPLE_INTERVAL):
+            rss = get_rss(self.pid)
+            if rss is not None:
+                self.max_rss = max(self.max_rss or 0, rss)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+
+def start_server(mode: str, args: argparse.Namespace) -> subprocess.Popen:
+    app, *options = SERVER_COMMANDS[mode]
+    command = [
+        sys.executable, '-m', 'gunicorn', app.format(config=args.config),
+        *options,
+        '-b', f'127.0.0.1:{args.port}',
+        '-w', str(args.workers),
+        '-t', '120',
+    ]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    started_at = time.monotonic()
+    while time.monotonic() - started_at < READY_TIMEOUT:
+        if server.poll() is not None:
+            raise RuntimeError(f'The {mode} server exited with {server.returncode}')
+        try:
+            if requests.get(f'http://127.0.0.1:{args.port}/service/db', timeout=1).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+
+    stop_server(server)
+    raise RuntimeError(f'The {mode} server is not ready in {READY_TIMEOUT} seconds')
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def get_urls(tickers: List[str], years: int, args: argparse.Namespace) -> List[Tuple[str, str]]:
+    """Return a shuffled mix of short reads of a day and long reads of all seeded years, labeled by kinds."""
+
+    random_ = random.Random(0)
+    last_date = START_DATE + dt.timedelta(days=365 * years - 1)
+    urls = []
+    for i in range(1000):
+        ticker = random_.choice(tickers)
+        if i < 1000 * args.long_ratio:
+            kind, from_, to, resolution = 'long', START_DATE, last_date, args.long_resolution
+        else:
+            kind, resolution = 'short', '1m'
+            from_ = to = START_DATE + dt.timedelta(days=random_.randint(0, (last_date - START_DATE).days))
+        urls.append(
+            (
+                kind,
+                f'/assets/candlesticks/{ticker}/{from_.strftime(DATE_STRING_FORMAT)}/'
+                f'{to.strftime(DATE_STRING_FORMAT)}?resolution={resolution}',
+            )
+        )
+    random_.shuffle(urls)
+    return urls
+
+
+def load(mode: str, urls: List[Tuple[str, str]], args: argparse.Namespace) -> BenchmarkResult:
+    server = start_server(mode, args)
+    sampler = MemorySampler(server.pid)
+    sampler.start()
+    latencies: Dict[str, List[float]] = {'short': [], 'long': []}
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def client(number: int) -> None:
+        session = requests.Session()
+        i = number
+        while time.monotonic() < stop_at:
+            kind, url = urls[i % len(urls)]
+            i += args.concurrency
+            started_at = time.perf_counter()
+            try:
+                response = session.get(
+                    f'http://127.0.0.1:{args.port}{url}', headers={'Accept': args.mimetype}, timeout=120
+                )
+                error = None if response.status_code == 200 else str(response.status_code)
+            except requests.RequestException as e:
+                error = type(e).__name__
+            latency = time.perf_counter() - started_at
+            with lock:
+                if error:
+                    errors.append(error)
+                else:
+                    latencies[kind].append(latency)
+
+    started_at = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(client, range(args.concurrency)))
+        seconds = time.perf_counter() - started_at
+    finally:
+        sampler.stop()
+        stop_server(server)
+
+    count = sum(len(kind_latencies) for kind_latencies in latencies.values())
+    result = {
+        'mode': mode,
+        'workers': args.workers,
+        'concurrency': args.concurrency,
+        'seconds': seconds,
+        'requests': count,
+        'errors': len(errors),
+        'requests_per_second': count / seconds,
+        'max_rss_bytes': sampler.max_rss,
+        'requests_per_second_per_gib': count / seconds / (sampler.max_rss / 2 ** 30) if sampler.max_rss else None,
+    }
+    for kind, kind_latencies in latencies.items():
+        result[kind] = {'requests': len(kind_latencies), **(summarize(kind_latencies) if kind_latencies else {})}
+    print(
+        f'{mode:>5}: {result["requests_per_second"]:.1f} rps, {len(errors)} errors, '
+        f'short p95 {result["short"].get("p95_ms", 0):.1f} ms, long p95 {result["long"].get("p95_ms", 0):.1f} ms',
+        file=sys.stderr,
+    )
+    return result
+
+
+def main(args: argparse.Namespace) -> None:
+    if not args.config:
+        os.environ.setdefault('DB_TYPE', 'sqlite')
+        os.environ.setdefault('DB_NAME', os.path.join(tempfile.mkdtemp(), 'benchmark.db'))
+    os.environ.setdefault('LOG_DIR', os.path.join(tempfile.gettempdir(), 'benchmark_logs'))
+    os.environ.setdefault('CRLF_TOKEN', 'benchmark')
+    os.environ.setdefault('REQUEST_METADATA_SINK', 'none')
+    # Every request should run queries, so the modes are compared by reads of the database
+    os.environ['CACHE_MAX_SIZE'] = '0'
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.create_all()
+
+    tickers = [f'BENCH{i}' for i in range(args.tickers)]
+    results = {'environment': get_environment(app, args)}
+    results['seed'] = seed(app, tickers, args.years)
+    urls = get_urls(tickers, args.years, args)
+    results['load'] = [load(mode, urls, args) for mode in args.modes]
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, required=False, default='', help='A dotenv file path.')
+    parser.add_argument('--tickers', type=int, default=2, help='A number of seeded tickers.')
+    parser.add_argument('--years', type=int, default=2, help='Years of seeded minute candlesticks per ticker.')
+    parser.add_argument('--modes', nargs='+', choices=list(SERVER_COMMANDS), default=list(SERVER_COMMANDS))
+    parser.add_argument('--workers', type=int, default=2, help='A number of gunicorn workers in every mode.')
+    parser.add_argument('--concurrency', type=int, default=32, help='A number of threads sending GET requests.')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds of load per a mode.')
+    parser.add_argument('--long-ratio', type=float, default=0.1, help='A part of reads of all seeded years.')
+    parser.add_argument('--long-resolution', type=str, default='1h', help='A resolution of long reads.')
+    parser.add_argument('--mimetype', type=str, default=JSON_MIMETYPE, help='An Accept header of reads.')
+    parser.add_argument('--port', type=int, default=8123, help='A port of the server.')
+    parser.add_argument('--output', type=str, default='', help='A JSON file path. By default results are printed.')
+    args = parser.parse_args()
+    main(args)
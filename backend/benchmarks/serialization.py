@@ -0,0 +1,128 @@
+"""
+Compare serialization of candlestick responses by CandlestickSchema with the column-wise orjson one.
+
+    python -m benchmarks.serialization --rows 10000 100000 1000000
+"""
+import argparse
+from collections import namedtuple
+import datetime as dt
+import json
+import random
+import time
+from typing import Callable, Dict, List
+
+from api.database import Candlestick
+from api.schemas import CandlestickSchema
+from api.utils.candlesticks import dump_candlestick_data
+
+
+MinuteRow = namedtuple(
+    'MinuteRow',
+    [
+        'datetime',
+        'low_price',
+        'high_price',
+        'open_price',
+        'close_price',
+        'volume',
+        'weighted_volume',
+        'first_datetime',
+        'last_datetime',
+    ],
+)
+
+
+def generate_rows(count: int) -> List[MinuteRow]:
+    random.seed(count)
+    start = dt.datetime(2021, 1, 4, 9, 30)
+    rows = []
+    price = 100.0
+    for i in range(count):
+        datetime = start + dt.timedelta(minutes=i)
+        price = round(max(price + random.gauss(0, 0.1), 1), 4)
+        rows.append(
+            MinuteRow(
+                datetime,
+                round(price - random.random(), 4),
+                round(price + random.random(), 4),
+                price,
+                round(price + random.gauss(0, 0.1), 4),
+                float(random.randint(100, 100000)),
+                round(price + random.gauss(0, 0.05), 4),
+                datetime,
+                datetime,
+            )
+        )
+    return rows
+
+
+def get_data(rows: List[MinuteRow]) -> Dict:
+    return {
+        'ticker': 'BENCH',
+        'resolution': '1m',
+        'status': 'OK',
+        'results': {
+            'min_datetime': rows[0].datetime.strftime('%Y-%m-%d_%H-%M-%S'),
+            'max_datetime': rows[-1].datetime.strftime('%Y-%m-%d_%H-%M-%S'),
+            'result_count': len(rows),
+        },
+    }
+
+
+def dump_by_schema(rows: List[MinuteRow]) -> bytes:
+    # ORM objects are created as the previous read path did, and encoded as jsonify does in production
+    fields = ('datetime', 'low_price', 'high_price', 'open_price', 'close_price', 'volume', 'weighted_volume')
+    candlesticks = [Candlestick(**{field: getattr(row, field) for field in fields}) for row in rows]
+    data = get_data(rows)
+    data['results']['data'] = CandlestickSchema().dump(candlesticks, many=True)
+    return (json.dumps(data, sort_keys=True, separators=(',', ':')) + '\n').encode()
+
+
+def dump_by_columns(rows: List[MinuteRow]) -> bytes:
+    return dump_candlestick_data(get_data(rows), rows)
+
+
+def measure(function: Callable[[List[MinuteRow]], bytes], rows: List[MinuteRow], repeat: int) -> Dict:
+    timings = []
+    payload = b''
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        payload = function(rows)
+        timings.append(time.perf_counter() - started_at)
+    return {'best_seconds': min(timings), 'mean_seconds': sum(timings) / len(timings), 'payload': payload}
+
+
+def main(args: argparse.Namespace) -> None:
+    results = []
+    for count in args.rows:
+        rows = generate_rows(count)
+        repeat = max(1, args.repeat if count < 1000000 else 1)
+        schema = measure(dump_by_schema, rows, repeat)
+        columns = measure(dump_by_columns, rows, repeat)
+        results.append(
+            {
+                'rows': count,
+                'schema_seconds': schema['best_seconds'],
+                'columns_seconds': columns['best_seconds'],
+                'speedup': schema['best_seconds'] / columns['best_seconds'],
+                'payload_bytes': len(columns['payload']),
+                'identical': schema['payload'] == columns['payload'],
+            }
+        )
+        print(
+            f'{count:>9} rows: schema {schema["best_seconds"]:.3f} s, columns {columns["best_seconds"]:.3f} s, '
+            f'x{results[-1]["speedup"]:.1f}, identical={results[-1]["identical"]}'
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000], help='Numbers of rows.')
+    parser.add_argument('--repeat', type=int, default=3, help='A number of runs per a number of rows.')
+    parser.add_argument('--output', type=str, default='', help='A JSON file path to write results to.')
+    args = parser.parse_args()
+    main(args)
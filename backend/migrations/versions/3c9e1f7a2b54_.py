@@ -0,0 +1,40 @@
+"""add candlestick rollup tables
+
+Revision ID: 3c9e1f7a2b54
+Revises: fbc82abed8ab
+Create Date: 2026-10-18 09:02:11.524913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e1f7a2b54'
+down_revision = 'fbc82abed8ab'
+branch_labels = None
+depends_on = None
+
+
+ROLLUP_TABLES = ('candlesticks_5m', 'candlesticks_1h', 'candlesticks_1d')
+
+
+def upgrade():
+    for table_name in ROLLUP_TABLES:
+        op.create_table(table_name,
+        sa.Column('asset_id', sa.Integer(), nullable=False),
+        sa.Column('datetime', sa.DateTime(), nullable=False),
+        sa.Column('low_price', sa.Float(), nullable=True),
+        sa.Column('high_price', sa.Float(), nullable=True),
+        sa.Column('open_price', sa.Float(), nullable=True),
+        sa.Column('close_price', sa.Float(), nullable=True),
+        sa.Column('volume', sa.Float(), nullable=True),
+        sa.Column('weighted_volume', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['asset_id'], ['assets.id'], ),
+        sa.PrimaryKeyConstraint('asset_id', 'datetime')
+        )
+
+
+def downgrade():
+    for table_name in reversed(ROLLUP_TABLES):
+        op.drop_table(table_name)
@@ -0,0 +1,49 @@
+"""add candlestick versions table
+
+Revision ID: 5e2a8c0d7f16
+Revises: 9d4b07e6c1a3
+Create Date: 2026-10-18 10:12:48.331052
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2a8c0d7f16'
+down_revision = '9d4b07e6c1a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('candlestick_versions',
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['assets.id'], ),
+    sa.PrimaryKeyConstraint('asset_id', 'date')
+    )
+
+    # Days stored already get the first version
+    candlesticks = sa.table('candlesticks', sa.column('asset_id', sa.Integer()), sa.column('datetime', sa.DateTime()))
+    versions = sa.table(
+        'candlestick_versions',
+        sa.column('asset_id', sa.Integer()),
+        sa.column('date', sa.Date()),
+        sa.column('version', sa.Integer()),
+        sa.column('updated_at', sa.DateTime()),
+    )
+    date = sa.func.date(candlesticks.c.datetime)
+    op.execute(
+        versions.insert().from_select(
+            ['asset_id', 'date', 'version', 'updated_at'],
+            sa.select(candlesticks.c.asset_id, date, sa.literal(1), sa.func.max(candlesticks.c.datetime))
+            .group_by(candlesticks.c.asset_id, date),
+        )
+    )
+
+
+def downgrade():
+    op.drop_table('candlestick_versions')
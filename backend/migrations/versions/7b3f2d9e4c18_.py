@@ -0,0 +1,119 @@
+"""key candlesticks by asset and datetime, partition them by month on postgres
+
+Revision ID: 7b3f2d9e4c18
+Revises: 5e2a8c0d7f16
+Create Date: 2026-10-18 12:40:17.902214
+
+"""
+import datetime as dt
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3f2d9e4c18'
+down_revision = '5e2a8c0d7f16'
+branch_labels = None
+depends_on = None
+
+PRICE_COLUMNS = ('low_price', 'high_price', 'open_price', 'close_price', 'volume', 'weighted_volume')
+COLUMNS = ', '.join(('datetime', *PRICE_COLUMNS, 'asset_id'))
+# Partitions are created for a few months ahead of the current one, then `flask partitions ensure` creates them
+MONTHS_AHEAD = 3
+
+
+def get_columns():
+    return [
+        sa.Column('datetime', sa.DateTime(), nullable=False),
+        *(sa.Column(column, sa.Float(), nullable=True) for column in PRICE_COLUMNS),
+    ]
+
+
+def get_next_month_start(datetime):
+    return (dt.datetime(datetime.year, datetime.month, 1) + dt.timedelta(days=32)).replace(day=1)
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        upgrade_postgresql()
+    else:
+        upgrade_sqlite()
+
+
+def upgrade_postgresql():
+    op.rename_table('candlesticks', 'candlesticks_unpartitioned')
+    op.execute(
+        'ALTER TABLE candlesticks_unpartitioned RENAME CONSTRAINT candlesticks_pkey TO candlesticks_unpartitioned_pkey'
+    )
+    op.create_table('candlesticks',
+    *get_columns(),
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['assets.id'], ),
+    sa.PrimaryKeyConstraint('asset_id', 'datetime', name='candlesticks_pkey'),
+    postgresql_partition_by='RANGE (datetime)'
+    )
+
+    now = dt.datetime.utcnow()
+    min_datetime = op.get_bind().execute(sa.text('SELECT min(datetime) FROM candlesticks_unpartitioned')).scalar()
+    month_start = dt.datetime((min_datetime or now).year, (min_datetime or now).month, 1)
+    last_month_start = dt.datetime(now.year, now.month, 1)
+    for _ in range(MONTHS_AHEAD):
+        last_month_start = get_next_month_start(last_month_start)
+
+    # Candlesticks are moved month by month in order of the key, so every partition is written clustered
+    max_datetime = op.get_bind().execute(sa.text('SELECT max(datetime) FROM candlesticks_unpartitioned')).scalar()
+    while month_start <= max(last_month_start, max_datetime or now):
+        name = f'candlesticks_y{month_start.year:04d}m{month_start.month:02d}'
+        next_month_start = get_next_month_start(month_start)
+        op.execute(
+            f'CREATE TABLE {name} PARTITION OF candlesticks '
+            f"FOR VALUES FROM ('{month_start.isoformat(' ')}') TO ('{next_month_start.isoformat(' ')}')"
+        )
+        op.execute(
+            f'INSERT INTO candlesticks ({COLUMNS}) SELECT {COLUMNS} FROM candlesticks_unpartitioned '
+            f"WHERE asset_id IS NOT NULL AND datetime >= '{month_start.isoformat(' ')}' "
+            f"AND datetime < '{next_month_start.isoformat(' ')}' ORDER BY asset_id, datetime"
+        )
+        month_start = next_month_start
+
+    op.drop_table('candlesticks_unpartitioned')
+
+
+def upgrade_sqlite():
+    op.create_table('candlesticks_clustered',
+    *get_columns(),
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['assets.id'], ),
+    sa.PrimaryKeyConstraint('asset_id', 'datetime', name='candlesticks_pkey'),
+    sqlite_with_rowid=False
+    )
+    op.execute(
+        f'INSERT INTO candlesticks_clustered ({COLUMNS}) SELECT {COLUMNS} FROM candlesticks '
+        f'WHERE asset_id IS NOT NULL ORDER BY asset_id, datetime'
+    )
+    op.drop_table('candlesticks')
+    op.rename_table('candlesticks_clustered', 'candlesticks')
+
+
+def downgrade():
+    op.rename_table('candlesticks', 'candlesticks_clustered')
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            'ALTER TABLE candlesticks_clustered RENAME CONSTRAINT candlesticks_pkey TO candlesticks_clustered_pkey'
+        )
+
+    op.create_table('candlesticks',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    *get_columns(),
+    sa.Column('asset_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['asset_id'], ['assets.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('datetime', 'asset_id', name='unique_candlesticks_date_asset_id')
+    )
+    op.execute(
+        f'INSERT INTO candlesticks ({COLUMNS}) SELECT {COLUMNS} FROM candlesticks_clustered '
+        f'ORDER BY asset_id, datetime'
+    )
+    # Partitions are dropped with their parent table
+    op.drop_table('candlesticks_clustered')
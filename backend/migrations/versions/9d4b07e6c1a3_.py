@@ -0,0 +1,33 @@
+"""add asset coverage table
+
+Revision ID: 9d4b07e6c1a3
+Revises: 3c9e1f7a2b54
+Create Date: 2026-10-18 09:41:37.206118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d4b07e6c1a3'
+down_revision = '3c9e1f7a2b54'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('asset_coverage',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('asset_id', sa.Integer(), nullable=False),
+    sa.Column('from_datetime', sa.DateTime(), nullable=False),
+    sa.Column('to_datetime', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['asset_id'], ['assets.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('index_asset_coverage_asset_id_from_datetime', 'asset_coverage', ['asset_id', 'from_datetime'], unique=False)
+
+
+def downgrade():
+    op.drop_index('index_asset_coverage_asset_id_from_datetime', table_name='asset_coverage')
+    op.drop_table('asset_coverage')
@@ -0,0 +1,72 @@
+"""merge assets with duplicate tickers, add a unique index on tickers
+
+Revision ID: a3d6f0c8e271
+Revises: e5b8d1f3a947
+Create Date: 2026-10-18 19:02:11.640315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d6f0c8e271'
+down_revision = 'e5b8d1f3a947'
+branch_labels = None
+depends_on = None
+
+# Tables keyed by an asset and a datetime, date or month. Rows of the kept asset win over ones of its duplicates
+KEYED_TABLES = (
+    ('candlesticks', 'datetime'),
+    ('candlesticks_5m', 'datetime'),
+    ('candlesticks_1h', 'datetime'),
+    ('candlesticks_1d', 'datetime'),
+    ('candlestick_versions', 'date'),
+    ('candlestick_blocks', 'date'),
+    ('candlestick_archives', 'month'),
+)
+
+
+def upgrade():
+    # Concurrent first uploads of a ticker could insert it several times. Data of duplicates are moved
+    # to the asset with the least ID, then duplicates are deleted. Rollups of merged assets are rebuilt
+    # by `flask rollups backfill` afterwards.
+    op.create_table('asset_duplicates',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('keep_id', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(
+        'INSERT INTO asset_duplicates (id, keep_id) '
+        'SELECT assets.id, kept.keep_id FROM assets '
+        'JOIN (SELECT ticker, min(id) AS keep_id FROM assets WHERE ticker IS NOT NULL GROUP BY ticker) AS kept '
+        'ON assets.ticker = kept.ticker WHERE assets.id <> kept.keep_id'
+    )
+
+    keep_id = 'SELECT keep_id FROM asset_duplicates WHERE asset_duplicates.id = {table}.asset_id'
+    for table, key in KEYED_TABLES:
+        op.execute(
+            f'UPDATE {table} SET asset_id = ({keep_id.format(table=table)}) '
+            f'WHERE asset_id IN (SELECT id FROM asset_duplicates) AND NOT EXISTS ('
+            f'SELECT 1 FROM {table} AS kept WHERE kept.asset_id = ({keep_id.format(table=table)}) '
+            f'AND kept.{key} = {table}.{key})'
+        )
+        op.execute(f'DELETE FROM {table} WHERE asset_id IN (SELECT id FROM asset_duplicates)')
+    op.execute(
+        f'UPDATE asset_coverage SET asset_id = ({keep_id.format(table="asset_coverage")}) '
+        f'WHERE asset_id IN (SELECT id FROM asset_duplicates)'
+    )
+    # Merged days are changed, so responses cached by their previous versions become stale
+    op.execute(
+        'UPDATE candlestick_versions SET version = version + 1 '
+        'WHERE asset_id IN (SELECT keep_id FROM asset_duplicates)'
+    )
+    op.execute('DELETE FROM assets WHERE id IN (SELECT id FROM asset_duplicates)')
+    op.drop_table('asset_duplicates')
+
+    op.create_index('ix_assets_ticker', 'assets', ['ticker'], unique=True)
+
+
+def downgrade():
+    # Merged assets are not split back
+    op.drop_index('ix_assets_ticker', table_name='assets')
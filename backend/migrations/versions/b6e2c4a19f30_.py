@@ -0,0 +1,32 @@
+"""add first and last minutes of rollup buckets
+
+Revision ID: b6e2c4a19f30
+Revises: a3d6f0c8e271
+Create Date: 2026-10-18 21:14:37.208519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6e2c4a19f30'
+down_revision = 'a3d6f0c8e271'
+branch_labels = None
+depends_on = None
+
+ROLLUP_TABLES = ('candlesticks_5m', 'candlesticks_1h', 'candlesticks_1d')
+
+
+def upgrade():
+    # Existing rollups are filled by `flask rollups backfill`, until then bucket starts are returned instead
+    for table in ROLLUP_TABLES:
+        op.add_column(table, sa.Column('first_datetime', sa.DateTime(), nullable=True))
+        op.add_column(table, sa.Column('last_datetime', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    for table in ROLLUP_TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('last_datetime')
+            batch_op.drop_column('first_datetime')
@@ -0,0 +1,30 @@
+import pytest
+from flask import Flask
+
+from api import create_app
+from api.database import db
+from api.utils.assets import asset_registry
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch) -> Flask:
+    """An app on an empty SQLite database in a temporary directory."""
+
+    monkeypatch.setenv('DB_TYPE', 'sqlite')
+    monkeypatch.setenv('DB_NAME', str(tmp_path / 'api.db'))
+    monkeypatch.setenv('LOG_DIR', str(tmp_path / 'logs'))
+    monkeypatch.setenv('ARCHIVE_DIR', str(tmp_path / 'archives'))
+    monkeypatch.setenv('CRLF_TOKEN', 'test')
+    monkeypatch.setenv('CACHE_BACKEND', 'memory')
+    monkeypatch.setenv('REQUEST_METADATA_SINK', 'none')
+    monkeypatch.delenv('DB_REPLICA_HOST', raising=False)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        # The registry is process-wide, so tickers of databases of other tests are forgotten
+        asset_registry.warm(db.session)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,98 @@
+import datetime as dt
+from typing import Dict, List
+
+import pytest
+
+from api.utils.candlesticks import CANDLESTICK_MIMETYPES, STREAMING_MIMETYPES
+from api.utils.misc.helpers import datetime_to_string
+
+
+def get_candlesticks(count: int, start: dt.datetime = dt.datetime(2021, 3, 1, 14, 30)) -> List[Dict]:
+    return [
+        {
+            'datetime': datetime_to_string(start + dt.timedelta(minutes=i)),
+            'open_price': 10.0 + i,
+            'high_price': 12.0 + i,
+            'low_price': 9.0 + i,
+            'close_price': 11.0 + i,
+            'volume': 100.0,
+            'weighted_volume': 10.5 + i,
+        }
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    response = client.post('/assets', json={'ticker': 'AAPL', 'candlesticks': get_candlesticks(10)})
+    assert response.status_code == 200
+    return client
+
+
+@pytest.mark.parametrize('mimetype', CANDLESTICK_MIMETYPES)
+@pytest.mark.parametrize('resolution', ['1m', '5m'])
+def test_content_type(client, mimetype, resolution):
+    url = f'/assets/candlesticks/AAPL/2021-03-01/2021-03-01?resolution={resolution}'
+    # The second request is answered from the cache
+    for _ in range(1 if mimetype in STREAMING_MIMETYPES else 2):
+        response = client.get(url, headers={'Accept': mimetype})
+        assert response.status_code == 200
+        assert response.headers.getlist('Content-Type') == [mimetype]
+
+
+def upload(client, candlesticks: List[Dict], on_conflict: str = 'nothing') -> Dict[str, int]:
+    response = client.post('/assets', json={'ticker': 'MSFT', 'candlesticks': candlesticks, 'on_conflict': on_conflict})
+    assert response.status_code == 200
+    return response.get_json()['results']
+
+
+def get_close_prices(client) -> List[float]:
+    response = client.get('/assets/candlesticks/MSFT/2021-03-01/2021-03-01', headers={'Accept': 'application/json'})
+    return [candlestick['close_price'] for candlestick in response.get_json()['results'].get('data', [])]
+
+
+@pytest.fixture(params=['rows', 'blocks'])
+def upload_client(app, request):
+    app.config['CANDLESTICK_STORAGE'] = request.param
+    return app.test_client()
+
+
+def test_upload_counts(upload_client):
+    candlesticks = get_candlesticks(5)
+    assert upload(upload_client, candlesticks) == {'inserted': 5, 'updated': 0, 'skipped': 0}
+    # Identical candlesticks are skipped, or updated if they are asked to be
+    assert upload(upload_client, candlesticks) == {'inserted': 0, 'updated': 0, 'skipped': 5}
+    assert upload(upload_client, candlesticks, 'update') == {'inserted': 0, 'updated': 5, 'skipped': 0}
+    assert get_close_prices(upload_client) == [11.0, 12.0, 13.0, 14.0, 15.0]
+
+
+def test_upload_changed_candlesticks(upload_client):
+    upload(upload_client, get_candlesticks(5))
+    changed = [{**candlestick, 'close_price': 20.5} for candlestick in get_candlesticks(3)]
+
+    assert upload(upload_client, changed) == {'inserted': 0, 'updated': 0, 'skipped': 3}
+    assert get_close_prices(upload_client) == [11.0, 12.0, 13.0, 14.0, 15.0]
+    assert upload(upload_client, changed, 'update') == {'inserted': 0, 'updated': 3, 'skipped': 0}
+    assert get_close_prices(upload_client) == [20.5, 20.5, 20.5, 14.0, 15.0]
+
+
+def test_upload_new_and_stored_candlesticks(upload_client):
+    upload(upload_client, get_candlesticks(3))
+    candlesticks = get_candlesticks(5)
+    candlesticks[0]['close_price'] = 30.5
+
+    assert upload(upload_client, candlesticks) == {'inserted': 2, 'updated': 0, 'skipped': 3}
+    assert upload(upload_client, candlesticks + get_candlesticks(2, dt.datetime(2021, 3, 1, 15)), 'update') == {
+        'inserted': 2,
+        'updated': 5,
+        'skipped': 0,
+    }
+    assert get_close_prices(upload_client) == [30.5, 12.0, 13.0, 14.0, 15.0, 11.0, 12.0]
+
+
+def test_upload_duplicates(upload_client):
+    # The last one of candlesticks with the same datetime wins
+    candlesticks = get_candlesticks(2) + [{**get_candlesticks(1)[0], 'close_price': 40.5}]
+    assert upload(upload_client, candlesticks) == {'inserted': 2, 'updated': 0, 'skipped': 0}
+    assert get_close_prices(upload_client) == [40.5, 12.0]
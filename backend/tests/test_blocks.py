@@ -0,0 +1,128 @@
+import datetime as dt
+import math
+from typing import Dict, List, Optional
+
+import pytest
+
+from api.database import db, CandlestickBlock
+from api.utils.candlesticks import decode_block, encode_block, ingest_blocks, read_block_candlesticks
+from api.utils.candlesticks.blocks import MinuteCandlestick, block_to_candlesticks
+from api.utils.candlesticks.ingest import ON_CONFLICT_UPDATE, PRICE_COLUMNS
+
+
+DAY = dt.datetime(2021, 3, 1)
+
+
+def get_row(minute: int, price: Optional[float] = 100.25, volume: Optional[float] = 1500.0, **values) -> Dict:
+    row = {
+        'asset_id': 1,
+        'datetime': DAY + dt.timedelta(minutes=minute),
+        'low_price': price,
+        'high_price': price,
+        'open_price': price,
+        'close_price': price,
+        'volume': volume,
+        'weighted_volume': price,
+    }
+    row.update(values)
+    return row
+
+
+def to_rows(candlesticks: List[MinuteCandlestick]) -> List[Dict]:
+    rows = []
+    for candlestick in candlesticks:
+        prices = {column: getattr(candlestick, column) for column in PRICE_COLUMNS}
+        rows.append({'asset_id': 1, 'datetime': candlestick.datetime, **prices})
+    return rows
+
+
+def round_trip(rows: List[Dict]) -> List[Dict]:
+    return to_rows(block_to_candlesticks(DAY.date(), decode_block(encode_block(rows))))
+
+
+def assert_same(decoded: List[Dict], rows: List[Dict]) -> None:
+    assert len(decoded) == len(rows)
+    for decoded_row, row in zip(decoded, sorted(rows, key=lambda row: row['datetime'])):
+        assert decoded_row.keys() == row.keys()
+        for key, value in row.items():
+            if isinstance(value, float) and math.isnan(value):
+                assert math.isnan(decoded_row[key]), key
+            else:
+                # Values are compared exactly, ticks are decoded to the same floats
+                assert decoded_row[key] == value and type(decoded_row[key]) is type(value), key
+
+
+def test_gaps():
+    minutes = [0, 1, 2, 7, 390, 391, 1000, 24 * 60 - 1]
+    rows = [get_row(minute, price=100 + minute / 100) for minute in minutes]
+    assert_same(round_trip(rows), rows)
+
+
+def test_unsorted_rows():
+    rows = [get_row(minute, price=50.0 + minute) for minute in (30, 10, 20)]
+    assert_same(round_trip(rows), rows)
+
+
+def test_single_row():
+    rows = [get_row(570, price=123.4567)]
+    assert_same(round_trip(rows), rows)
+
+
+def test_nulls():
+    rows = [
+        get_row(0, price=None, volume=None),
+        get_row(1, price=10.5, volume=None),
+        get_row(2, price=None, volume=200.0),
+        get_row(3, price=11.25, volume=300.0, weighted_volume=None),
+    ]
+    assert_same(round_trip(rows), rows)
+
+
+@pytest.mark.parametrize(
+    'values',
+    [
+        # Volumes beyond 2 ** 53 ticks are stored as raw floats
+        [1e15, 2.0 ** 60, 1e300, 5e-324],
+        [float('nan'), 1.5, float('nan')],
+        [float('inf'), float('-inf'), 0.0],
+        [-0.0, -12.5, 1e-8],
+        # Prices with more than 8 decimal digits are stored as raw floats
+        [0.1 + 0.2, 1 / 3, 123.456789012],
+    ],
+)
+def test_float_edge_values(values):
+    rows = [get_row(minute, price=value, volume=value) for minute, value in enumerate(values)]
+    assert_same(round_trip(rows), rows)
+
+
+def test_nan_is_not_null():
+    decoded = decode_block(encode_block([get_row(0, volume=float('nan')), get_row(1, volume=None)]))
+    assert decoded.nulls['volume'].tolist() == [False, True]
+
+
+def test_rows_of_several_days():
+    with pytest.raises(ValueError):
+        encode_block([get_row(0), get_row(24 * 60)])
+
+
+def test_append_to_block(app):
+    to = DAY + dt.timedelta(days=1) - dt.timedelta(microseconds=1)
+    with app.app_context():
+        first = [get_row(minute, price=100.0 + minute) for minute in (0, 10, 20)]
+        result = ingest_blocks(db.session, first, 'sqlite')
+        assert (result.inserted, result.updated, result.skipped) == (3, 0, 0)
+
+        # New rows fill gaps and extend the block, a stored row is skipped
+        second = [get_row(minute, price=200.0 + minute) for minute in (5, 15, 30, 10)]
+        result = ingest_blocks(db.session, second, 'sqlite')
+        assert (result.inserted, result.updated, result.skipped) == (3, 0, 1)
+        stored = first + second[:3]
+        assert_same(to_rows(read_block_candlesticks(db.session, 1, DAY, to)), stored)
+
+        third = [get_row(10, price=300.5), get_row(40, price=None)]
+        result = ingest_blocks(db.session, third, 'sqlite', ON_CONFLICT_UPDATE)
+        assert (result.inserted, result.updated, result.skipped) == (1, 1, 0)
+        stored = [row for row in stored if row['datetime'] != DAY + dt.timedelta(minutes=10)] + third
+        assert_same(to_rows(read_block_candlesticks(db.session, 1, DAY, to)), stored)
+        assert db.session.query(CandlestickBlock.count).scalar() == len(stored)
+
@@ -0,0 +1,47 @@
+import gzip
+import tracemalloc
+
+import brotli
+from werkzeug.test import Client
+from werkzeug.wrappers import Request, Response
+
+from api.utils.compression import DecompressionMiddleware
+
+
+MAX_BODY_SIZE = 1024 * 1024
+
+
+@Request.application
+def echo(request: Request) -> Response:
+    return Response(request.get_data())
+
+
+def post(body: bytes, encoding: str) -> Response:
+    client = Client(DecompressionMiddleware(echo, MAX_BODY_SIZE), Response)
+    return client.post('/', data=body, headers={'Content-Encoding': encoding})
+
+
+def test_decoded_bodies():
+    body = b'{"ticker": "AAPL"}' * 1000
+    assert post(brotli.compress(body), 'br').data == body
+    assert post(gzip.compress(body), 'gzip').data == body
+
+
+def test_brotli_bomb():
+    # 256 MiB of zeros are encoded by a few hundred bytes
+    bomb = brotli.compress(b'\0' * 256 * 1024 * 1024, quality=5)
+    assert len(bomb) < 1024
+
+    tracemalloc.start()
+    response = post(bomb, 'br')
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert response.status_code == 413
+    assert peak < 4 * MAX_BODY_SIZE
+
+
+def test_invalid_bodies():
+    assert post(brotli.compress(b'x' * 100)[:-1], 'br').status_code == 400
+    assert post(b'not gzip', 'gzip').status_code == 400
+    assert post(b'', 'zstd').status_code == 415
@@ -0,0 +1,308 @@
+"""
+Benchmark the path of a user request to plot candlesticks end to end without network access. A fake polygon server
+and the backend on SQLite are started locally, and the chart callback of the dashboard is driven for a cold range,
+the same range again and a range with a partial gap. Results are written as JSON with timings per stage.
+
+    python -m benchmarks.dashboard --days 5 --rounds 3 --output dashboard.json
+
+Stage timings are inclusive, e.g. `figure` includes `get_candlesticks`.
+"""
+import argparse
+from collections import defaultdict
+import datetime as dt
+from functools import wraps
+import json
+import os
+from pathlib import Path
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import flask
+import requests
+
+from benchmarks.polygon import FakePolygonServer
+from dashboard.backend import BackendClient
+from dashboard.candlesticks import CandlestickApp
+from dashboard.downloader import PolygonDownloader
+from dashboard.ingestion import Ingestor
+from dashboard.utils import DateTimeHelper
+from dashboard.workers import IngestionWorker, get_job_queue
+
+
+BACKEND_PATH = Path(__file__).absolute().parents[2] / 'backend'
+
+Timings = Dict[str, float]
+BenchmarkResult = Dict[str, object]
+
+
+class StageTimer:
+    """Accumulate durations of wrapped methods by stage until they are taken."""
+
+    def __init__(self):
+        self._timings = defaultdict(float)
+
+    def wrap(self, instance: object, method: str, stage: str) -> None:
+        function = getattr(instance, method)
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self._timings[stage] += time.perf_counter() - started_at
+
+        setattr(instance, method, timed)
+
+    def take(self) -> Timings:
+        timings = dict(self._timings)
+        self._timings.clear()
+        return timings
+
+
+class BackendProcess:
+    """The backend API served by gunicorn on a fresh SQLite database migrated to the latest revision."""
+
+    def __init__(self, port: int, workers: int, directory: Path):
+        self.url = f'http://127.0.0.1:{port}'
+        self._port = port
+        self._workers = workers
+        self._directory = directory
+        self._process = None
+        self._env = {
+            **os.environ,
+            'DB_TYPE': 'sqlite',
+            'DB_NAME': str(directory / 'backend.db'),
+            'LOG_DIR': str(directory / 'backend_logs'),
+            'CRLF_TOKEN': 'benchmark',
+            'FLASK_APP': 'api:create_app()',
+        }
+
+    def start(self, timeout: Optional[float] = 30) -> 'BackendProcess':
+        subprocess.run(
+            [sys.executable, '-m', 'flask', 'db', 'upgrade'],
+            cwd=BACKEND_PATH,
+            env=self._env,
+            check=True,
+            capture_output=True,
+        )
+        self._log = open(self._directory / 'gunicorn.log', 'w')
+        bind = f'127.0.0.1:{self._port}'
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', 'api:create_app()', '-b', bind, '-w', str(self._workers)],
+            cwd=BACKEND_PATH,
+            env=self._env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+        wait_for(self.url, timeout)
+        return self
+
+    def stop(self) -> None:
+        if self._process:
+            self._process.terminate()
+            self._process.wait()
+            self._log.close()
+
+
+def wait_for(url: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{url}/metrics').status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f'{url} is not ready in {timeout} s')
+
+
+class DashboardBenchmark:
+    """Drive the chart callback and run its ingestion job in the same process, as a worker would do it."""
+
+    def __init__(self, backend_url: str, polygon: FakePolygonServer, args: argparse.Namespace):
+        self._polygon = polygon
+        self._timer = StageTimer()
+
+        self._app = CandlestickApp()
+        self._timer.wrap(self._app._backend, 'get_coverage_gaps', 'get_coverage_gaps')
+        self._timer.wrap(self._app._backend, 'get_candlesticks', 'get_candlesticks')
+        self._timer.wrap(self._app._jobs, 'enqueue', 'enqueue')
+        self._timer.wrap(self._app, '_get_figure', 'figure')
+
+        backend = BackendClient(backend_url)
+        downloader = PolygonDownloader(
+            'benchmark',
+            url=polygon.url,
+            batch_limit=args.polygon_batch_limit,
+            workers=args.polygon_workers,
+            rate_limit=args.polygon_client_rate_limit,
+            burst=args.polygon_workers,
+        )
+        self._timer.wrap(backend, 'get_coverage_gaps', 'get_coverage_gaps')
+        self._timer.wrap(backend, 'post_candlesticks', 'post_candlesticks')
+        self._timer.wrap(downloader, 'download_many', 'polygon_download')
+        self._worker = IngestionWorker(get_job_queue(), Ingestor(backend, downloader, dt.timedelta(minutes=15)))
+
+    def run_scenario(self, name: str, ticker: str, from_: dt.date, to: dt.date) -> BenchmarkResult:
+        """Plot a range, and if a job is enqueued, run it and poll it as the interval callback does."""
+
+        self._polygon.reset_stats()
+        phases = {}
+        started_at = time.perf_counter()
+
+        figure, job, _ = self._measure(
+            phases,
+            'plot',
+            lambda: self._trigger(
+                f'{CandlestickApp.plot_button_id}.n_clicks',
+                1,
+                ticker,
+                DateTimeHelper.date_to_string(from_),
+                DateTimeHelper.date_to_string(to),
+                None,
+            ),
+        )
+        if job:
+            self._measure(phases, 'ingest', self._run_jobs)
+            figure, _, _ = self._measure(
+                phases,
+                'poll',
+                lambda: self._trigger(f'{CandlestickApp.job_interval_id}.n_intervals', 1, ticker, None, None, job),
+            )
+
+        result = {
+            'scenario': name,
+            'ticker': ticker,
+            'from': str(from_),
+            'to': str(to),
+            'seconds': time.perf_counter() - started_at,
+            'job': job is not None,
+            'plotted_candlesticks': len(figure.data[0].x) if figure.data else 0,
+            'phases': phases,
+            'polygon': self._polygon.get_stats(),
+        }
+        print(
+            f'{name:>12} {ticker}: {result["seconds"] * 1000:.1f} ms, '
+            + ', '.join(f'{phase} {timings["seconds"] * 1000:.1f} ms' for phase, timings in phases.items()),
+            file=sys.stderr,
+        )
+        return result
+
+    def _measure(self, phases: Dict[str, Timings], phase: str, function: Callable):
+        self._timer.take()
+        started_at = time.perf_counter()
+        result = function()
+        phases[phase] = {'seconds': time.perf_counter() - started_at, 'stages': self._timer.take()}
+        return result
+
+    def _trigger(self, prop_id: str, value: int, *args):
+        # Dash reads triggered inputs of a callback from flask.g, so they are set as Dash sets them for a request
+        with self._app.app.server.test_request_context():
+            flask.g.triggered_inputs = [{'prop_id': prop_id, 'value': value}]
+            return self._app._generate_candlestick_chart(value, value, *args)
+
+    def _run_jobs(self) -> None:
+        while self._worker.run_once():
+            pass
+
+
+def summarize(results: List[BenchmarkResult]) -> Dict[str, Dict[str, float]]:
+    summary = {}
+    for scenario in dict.fromkeys(result['scenario'] for result in results):
+        seconds = [result['seconds'] for result in results if result['scenario'] == scenario]
+        summary[scenario] = {
+            'rounds': len(seconds),
+            'mean_ms': statistics.mean(seconds) * 1000,
+            'median_ms': statistics.median(seconds) * 1000,
+            'max_ms': max(seconds) * 1000,
+        }
+    return summary
+
+
+def get_environment(args: argparse.Namespace) -> BenchmarkResult:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'started_at': dt.datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'arguments': vars(args),
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    directory = Path(tempfile.mkdtemp(prefix='dashboard_benchmark_'))
+    polygon = FakePolygonServer(latency=args.polygon_latency, rate_limit=args.polygon_rate_limit).start()
+    backend = None
+    if not args.backend_url:
+        backend = BackendProcess(args.backend_port, args.backend_workers, directory).start()
+
+    os.environ['BACKEND_API_URL'] = args.backend_url or backend.url
+    os.environ['INGESTION_QUEUE_PATH'] = str(directory / 'ingestion_jobs.db')
+    os.environ['TICKERS'] = 'BENCH'
+    os.environ.setdefault('BACKEND_CACHE_SIZE', '32')
+
+    try:
+        benchmark = DashboardBenchmark(os.environ['BACKEND_API_URL'], polygon, args)
+        from_ = DateTimeHelper.string_to_date(args.from_)
+        to = from_ + dt.timedelta(days=args.days - 1)
+        extended_to = to + dt.timedelta(days=args.gap_days)
+
+        results = []
+        run_id = int(time.time())
+        for i in range(args.rounds):
+            # Every round starts from an empty storage for a new ticker
+            ticker = f'BENCH{run_id}{i}'
+            results.append(benchmark.run_scenario('cold', ticker, from_, to))
+            results.append(benchmark.run_scenario('warm', ticker, from_, to))
+            results.append(benchmark.run_scenario('partial_gap', ticker, from_, extended_to))
+    finally:
+        polygon.stop()
+        if backend:
+            backend.stop()
+
+    output = json.dumps(
+        {'environment': get_environment(args), 'summary': summarize(results), 'results': results}, indent=2
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--from', dest='from_', type=str, default='2021-03-01', help='The first date of ranges.')
+    parser.add_argument('--days', type=int, default=5, help='Days of the cold and warm ranges.')
+    parser.add_argument('--gap-days', type=int, default=7, help='Days added to the range with a partial gap.')
+    parser.add_argument('--rounds', type=int, default=3, help='A number of times every scenario is run.')
+    parser.add_argument('--polygon-latency', type=float, default=0.1, help='Seconds to delay polygon responses.')
+    parser.add_argument(
+        '--polygon-rate-limit', type=float, default=0, help='Polygon requests per minute, or 0 to not limit them.'
+    )
+    parser.add_argument(
+        '--polygon-client-rate-limit', type=float, default=6000, help='Requests per minute of the downloader.'
+    )
+    parser.add_argument('--polygon-workers', type=int, default=4, help='Threads of the downloader.')
+    parser.add_argument('--polygon-batch-limit', type=int, default=50000, help='Minutes per polygon request.')
+    parser.add_argument(
+        '--backend-url', type=str, default='', help='A running backend to use instead of starting one on SQLite.'
+    )
+    parser.add_argument('--backend-port', type=int, default=8765, help='A port of the started backend.')
+    parser.add_argument('--backend-workers', type=int, default=2, help='Gunicorn workers of the started backend.')
+    parser.add_argument('--output', type=str, default='', help='A JSON file path. By default results are printed.')
+    args = parser.parse_args()
+    main(args)
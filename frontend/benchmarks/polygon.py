@@ -0,0 +1,185 @@
+import datetime as dt
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+MARKET_OPEN = dt.time(14, 30)
+MINUTES_PER_DAY = 390
+EPOCH = dt.datetime(1970, 1, 1)
+
+
+class FakePolygonServer:
+    """
+    A local server of the polygon.io minute aggregates API answering with deterministic random candlesticks of
+    regular market hours on weekdays. Every response is delayed by `latency` seconds, and requests over
+    `rate_limit` per minute are answered with 429 as polygon does. Status codes appended to `errors` are answered
+    to the next requests one by one, e.g. to test retries.
+    """
+
+    path_pattern = re.compile(
+        r'^/v2/aggs/ticker/(?P<ticker>[^/]+)/range/1/minute/(?P<from>\d{4}-\d{2}-\d{2})/(?P<to>\d{4}-\d{2}-\d{2})$'
+    )
+
+    def __init__(
+        self,
+        host: Optional[str] = '127.0.0.1',
+        port: Optional[int] = 0,
+        latency: Optional[float] = 0,
+        rate_limit: Optional[float] = 0,
+    ):
+        """
+        :param port: a port to listen. If 0, a free one is chosen.
+        :param rate_limit: requests per minute. If 0, requests are not limited.
+        """
+
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.errors: List[int] = []
+        self._lock = threading.Lock()
+        self._request_times = []
+        self._stats = {'requests': 0, 'rate_limited': 0, 'candlesticks': 0}
+
+        self._server = ThreadingHTTPServer((host, port), self._get_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake_polygon', daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> 'FakePolygonServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {key: 0 for key in self._stats}
+
+    def _pop_error(self) -> Optional[int]:
+        with self._lock:
+            if not self.errors:
+                return None
+            self._stats['requests'] += 1
+            return self.errors.pop(0)
+
+    def _is_rate_limited(self) -> bool:
+        with self._lock:
+            self._stats['requests'] += 1
+            if not self.rate_limit:
+                return False
+
+            now = time.monotonic()
+            self._request_times = [request_time for request_time in self._request_times if now - request_time < 60]
+            if len(self._request_times) >= self.rate_limit:
+                self._stats['rate_limited'] += 1
+                return True
+            self._request_times.append(now)
+            return False
+
+    def _get_candlesticks(self, ticker: str, from_: dt.date, to: dt.date, limit: int) -> List[Dict[str, float]]:
+        candlesticks = []
+        date = from_
+        while date <= to and len(candlesticks) < limit:
+            if date.weekday() < 5:
+                candlesticks.extend(generate_day(ticker, date))
+            date += dt.timedelta(days=1)
+
+        candlesticks = candlesticks[:limit]
+        with self._lock:
+            self._stats['candlesticks'] += len(candlesticks)
+        return candlesticks
+
+    def _get_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive as polygon does, so a pooled session of the downloader reuses them
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                match = server.path_pattern.match(url.path)
+                if not match:
+                    self._send(404, {'status': 'NOT_FOUND'})
+                    return
+
+                time.sleep(server.latency)
+                error = server._pop_error()
+                if error:
+                    headers = {'Retry-After': '1'} if error == 429 else None
+                    self._send(error, {'status': 'ERROR', 'error': 'Injected error'}, headers)
+                    return
+                if server._is_rate_limited():
+                    self._send(429, {'status': 'ERROR', 'error': 'Too many requests'}, {'Retry-After': '1'})
+                    return
+
+                limit = int(parse_qs(url.query).get('limit', ['50000'])[0])
+                from_ = dt.date.fromisoformat(match['from'])
+                to = dt.date.fromisoformat(match['to'])
+                results = server._get_candlesticks(match['ticker'], from_, to, limit)
+                self._send(
+                    200,
+                    {
+                        'ticker': match['ticker'],
+                        'status': 'OK',
+                        'adjusted': True,
+                        'queryCount': len(results),
+                        'resultsCount': len(results),
+                        'results': results,
+                    },
+                )
+
+            def _send(self, status: int, data: dict, headers: Optional[Dict[str, str]] = None) -> None:
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def generate_day(ticker: str, date: dt.date) -> List[Dict[str, float]]:
+    """Generate a random walk of minute aggregates in the polygon format. The same day is always the same."""
+
+    random_ = random.Random(f'{ticker}:{date}')
+    price = random_.uniform(10, 500)
+    market_open = dt.datetime.combine(date, MARKET_OPEN)
+    candlesticks = []
+    for minute in range(MINUTES_PER_DAY):
+        open_price = price
+        price = max(price + random_.gauss(0, 0.05), 1.0)
+        candlesticks.append(
+            {
+                't': (market_open + dt.timedelta(minutes=minute) - EPOCH) // dt.timedelta(milliseconds=1),
+                'o': round(open_price, 4),
+                'c': round(price, 4),
+                'l': round(min(open_price, price) - random_.random() * 0.05, 4),
+                'h': round(max(open_price, price) + random_.random() * 0.05, 4),
+                'v': random_.randint(100, 50000),
+                'vw': round((open_price + price) / 2, 4),
+                'n': random_.randint(1, 500),
+            }
+        )
+    return candlesticks
@@ -0,0 +1,36 @@
+import datetime as dt
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+import dash
+import dash_bootstrap_components as dbc
+from flask import Flask, Response
+
+from dashboard.candlesticks import CandlestickApp
+from dashboard.metrics import generate_metrics
+from dashboard.utils import DateTimeHelper, set_env, set_logger_settings
+
+
+def create_app(config: Optional[str] = '', debug: Optional[bool] = False) -> CandlestickApp:
+    set_env(config)
+    level = logging.DEBUG if debug else logging.INFO
+
+    now = DateTimeHelper.datetime_to_string(dt.datetime.utcnow())
+    log_name = f'candlestick_dashboard_{os.getpid()}_{now}.log'
+    set_logger_settings(Path(os.environ['LOG_DIR']) / log_name, level)
+    os.environ['LOG'] = log_name
+
+    server = Flask(__name__)
+    server.add_url_rule('/metrics', 'metrics', get_metrics)
+    app = dash.Dash('dash_app', server, url_base_pathname='/', external_stylesheets=[dbc.themes.BOOTSTRAP])
+
+    candlestick_app = CandlestickApp(app)
+
+    return candlestick_app
+
+
+def get_metrics() -> Response:
+    metrics, content_type = generate_metrics()
+    return Response(metrics, content_type=content_type)
@@ -0,0 +1,326 @@
+from collections import OrderedDict
+import datetime as dt
+import gzip
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+import brotli
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from dashboard.metrics import BACKEND_REQUEST_SECONDS
+from dashboard.utils import DateTimeHelper
+
+
+logger = logging.getLogger(__name__)
+
+Interval = Tuple[dt.datetime, dt.datetime]
+
+# Responses of gateways and proxies in front of a restarting backend
+RETRY_STATUSES = (502, 503, 504)
+# Encodings of compressed uploads, which are decoded by the backend
+UPLOAD_ENCODINGS = ('br', 'gzip')
+COMPRESSION_MIN_SIZE = 1024
+
+
+class Candlesticks:
+    """Candlestick columns decoded from a backend response."""
+
+    # A little-endian uint64 row count followed by int64 epoch milliseconds and a float64 buffer per price column.
+    mimetype = 'application/vnd.candlesticks.columns.float64'
+    price_columns = ('open_price', 'high_price', 'low_price', 'close_price', 'volume', 'weighted_volume')
+
+    def __init__(
+        self,
+        datetime: np.ndarray,
+        columns: Dict[str, np.ndarray],
+        min_datetime: Optional[dt.datetime] = None,
+        max_datetime: Optional[dt.datetime] = None,
+    ):
+        self.datetime = datetime
+        self.open_price = columns['open_price']
+        self.high_price = columns['high_price']
+        self.low_price = columns['low_price']
+        self.close_price = columns['close_price']
+        self.volume = columns['volume']
+        self.weighted_volume = columns['weighted_volume']
+        self.min_datetime = min_datetime
+        self.max_datetime = max_datetime
+
+    def __len__(self) -> int:
+        return len(self.datetime)
+
+    @classmethod
+    def empty(cls) -> 'Candlesticks':
+        return cls(np.array([], dtype='datetime64[ms]'), {column: np.array([]) for column in cls.price_columns})
+
+    @classmethod
+    def from_buffer(
+        cls, buffer: bytes, min_datetime: Optional[dt.datetime] = None, max_datetime: Optional[dt.datetime] = None
+    ) -> 'Candlesticks':
+        """Decode packed column buffers without copying them."""
+
+        count = int(np.frombuffer(buffer, dtype='<u8', count=1)[0])
+        offset = 8
+        datetime = np.frombuffer(buffer, dtype='<i8', count=count, offset=offset).view('datetime64[ms]')
+        offset += 8 * count
+
+        columns = {}
+        for column in cls.price_columns:
+            columns[column] = np.frombuffer(buffer, dtype='<f8', count=count, offset=offset)
+            offset += 8 * count
+        return cls(datetime, columns, min_datetime, max_datetime)
+
+    @classmethod
+    def from_columns(cls, data: Dict) -> 'Candlesticks':
+        """Decode a result of a batch response: JSON columns and datetimes of the first and the last minute."""
+
+        if not data.get('columns'):
+            return cls.empty()
+
+        datetime = np.array(data['columns']['datetime'], dtype=np.int64).view('datetime64[ms]')
+        # Missing prices are nulls, which become NaN as they are in packed columns
+        columns = {column: np.array(data['columns'][column], dtype=float) for column in cls.price_columns}
+        return cls(
+            datetime,
+            columns,
+            DateTimeHelper.string_to_datetime(data['min_datetime']),
+            DateTimeHelper.string_to_datetime(data['max_datetime']),
+        )
+
+
+class _CachedCandlesticks(NamedTuple):
+    etag: str
+    candlesticks: Candlesticks
+
+
+class BackendClient:
+    """
+    A client of the backend API. Candlesticks are kept in a local LRU cache and revalidated by their ETags,
+    so unchanged ones are not downloaded again.
+
+    A client may be used by several threads at once, e.g. of waitress. Connections are kept alive in a pool
+    shared by all threads, and every thread has its own session on top of it. GET requests are retried
+    on connection errors and 502-504 responses, uploads only if they cannot connect. Responses are accepted
+    compressed by brotli or gzip, and uploads are sent compressed.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        cache_size: Optional[int] = 32,
+        pool_size: Optional[int] = 8,
+        connect_timeout: Optional[float] = 3.05,
+        read_timeout: Optional[float] = 60,
+        max_retries: Optional[int] = 2,
+        backoff: Optional[float] = 0.5,
+        upload_encoding: Optional[str] = 'gzip',
+    ):
+        """
+        :param pool_size: connections kept alive, e.g. a number of threads sending requests at once.
+        :param read_timeout: seconds to wait for the next byte of a response, long ranges take a while to read.
+        :param backoff: seconds to wait before the second retry. Every next retry waits twice longer.
+        :param upload_encoding: `br`, `gzip` or an empty string to upload uncompressed data.
+        """
+
+        if upload_encoding and upload_encoding not in UPLOAD_ENCODINGS:
+            raise ValueError(f'Unknown upload encoding "{upload_encoding}"')
+
+        self._url = url.strip('/')
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._timeout = (connect_timeout, read_timeout)
+        self._upload_encoding = upload_encoding
+
+        # Connection errors are retried for any method, since a request is not sent then
+        retry = Retry(
+            total=max_retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            backoff_factor=backoff / 2,
+            raise_on_status=False,
+        )
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> 'BackendClient':
+        return cls(
+            os.environ['BACKEND_API_URL'],
+            cache_size=int(os.environ.get('BACKEND_CACHE_SIZE', 32)),
+            pool_size=int(os.environ.get('BACKEND_POOL_SIZE', 8)),
+            connect_timeout=float(os.environ.get('BACKEND_CONNECT_TIMEOUT', 3.05)),
+            read_timeout=float(os.environ.get('BACKEND_READ_TIMEOUT', 60)),
+            max_retries=int(os.environ.get('BACKEND_MAX_RETRIES', 2)),
+            upload_encoding=os.environ.get('BACKEND_UPLOAD_ENCODING', 'gzip'),
+        )
+
+    @property
+    def _session(self) -> requests.Session:
+        # Sessions are not thread-safe, so threads share only the connection pool of the adapter
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount(self._url, self._adapter)
+            session.headers['Accept-Encoding'] = 'br, gzip'
+            self._local.session = session
+        return session
+
+    def _request(self, method: str, name: str, url: str, **kwargs) -> Optional[requests.Response]:
+        """Send a request timed by a metric. Return None if the backend cannot be reached or does not answer in time."""
+
+        with BACKEND_REQUEST_SECONDS.labels(name).time():
+            try:
+                return self._session.request(method, url, timeout=self._timeout, **kwargs)
+            except requests.RequestException as e:
+                logger.warning(f'Cannot send a request to backend by url={url}: {e}')
+                return None
+
+    def get_candlesticks(
+        self, ticker: str, from_: dt.datetime, to: dt.datetime, resolution: str
+    ) -> Optional[Candlesticks]:
+        """Get candlesticks from the backend. Return None if the backend cannot handle a request."""
+
+        url = f'{self._url}/assets/candlesticks/{ticker}/{from_.date()}/{to.date()}'
+        logger.debug(f'Requesting to db by url={url}, resolution={resolution}')
+        cache_key = (url, resolution)
+        with self._cache_lock:
+            cached = self._cache.get(cache_key)
+
+        headers = {'Accept': Candlesticks.mimetype}
+        if cached:
+            headers['If-None-Match'] = cached.etag
+        response = self._request('GET', 'get_candlesticks', url, params={'resolution': resolution}, headers=headers)
+        if response is None:
+            return None
+        if response.status_code == 304 and cached:
+            logger.debug(f'Candlesticks are not modified, etag={cached.etag}')
+            with self._cache_lock:
+                if cache_key in self._cache:
+                    self._cache.move_to_end(cache_key)
+            return cached.candlesticks
+
+        if response.status_code != 200:
+            logger.warning(f'Cannot get data from backend by url={url}')
+            return None
+
+        # The backend answers with JSON if there is no data to pack, e.g. for an unknown ticker
+        if not response.headers.get('Content-Type', '').startswith(Candlesticks.mimetype):
+            return Candlesticks.empty()
+
+        min_datetime = response.headers.get('X-Min-Datetime')
+        max_datetime = response.headers.get('X-Max-Datetime')
+        candlesticks = Candlesticks.from_buffer(
+            response.content,
+            DateTimeHelper.string_to_datetime(min_datetime) if min_datetime else None,
+            DateTimeHelper.string_to_datetime(max_datetime) if max_datetime else None,
+        )
+
+        etag = response.headers.get('ETag')
+        if etag and self._cache_size > 0:
+            with self._cache_lock:
+                self._cache[cache_key] = _CachedCandlesticks(etag, candlesticks)
+                self._cache.move_to_end(cache_key)
+                while len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+        return candlesticks
+
+    def get_batch_candlesticks(
+        self, tickers: List[str], from_: dt.datetime, to: dt.datetime, resolution: str
+    ) -> Optional[Dict[str, Candlesticks]]:
+        """Get candlesticks of several tickers by one request. Return None if the backend cannot handle it."""
+
+        url = f'{self._url}/assets/batch/candlesticks/{from_.date()}/{to.date()}'
+        logger.debug(f'Requesting to db by url={url}, tickers={tickers}, resolution={resolution}')
+        params = {'tickers': ','.join(tickers), 'resolution': resolution}
+        response = self._request('GET', 'get_batch_candlesticks', url, params=params)
+        if response is None or response.status_code != 200:
+            logger.warning(f'Cannot get data from backend by url={url}, tickers={tickers}')
+            return None
+
+        results = response.json()['results']
+        return {ticker: Candlesticks.from_columns(results.get(ticker, {})) for ticker in tickers}
+
+    def get_coverage_gaps(self, ticker: str, from_: dt.datetime, to: dt.datetime) -> Optional[List[Interval]]:
+        """Get [from, to) intervals which were never fetched from extra sources. Return None on a backend error."""
+
+        url = f'{self._url}/assets/coverage/{ticker}/{from_.date()}/{to.date()}'
+        logger.debug(f'Requesting coverage gaps by url={url}')
+        response = self._request('GET', 'get_coverage_gaps', url)
+        if response is None or response.status_code != 200:
+            logger.warning(f'Cannot get coverage gaps from backend by url={url}')
+            return None
+
+        return [
+            (DateTimeHelper.string_to_datetime(gap['from']), DateTimeHelper.string_to_datetime(gap['to']))
+            for gap in response.json()['results']['gaps']
+        ]
+
+    def get_batch_coverage_gaps(
+        self, tickers: List[str], from_: dt.datetime, to: dt.datetime
+    ) -> Optional[Dict[str, List[Interval]]]:
+        """Get coverage gaps of several tickers by one request. Return None on a backend error."""
+
+        url = f'{self._url}/assets/batch/coverage/{from_.date()}/{to.date()}'
+        logger.debug(f'Requesting coverage gaps by url={url}, tickers={tickers}')
+        response = self._request('GET', 'get_batch_coverage_gaps', url, params={'tickers': ','.join(tickers)})
+        if response is None or response.status_code != 200:
+            logger.warning(f'Cannot get coverage gaps from backend by url={url}, tickers={tickers}')
+            return None
+
+        results = response.json()['results']
+        return {
+            ticker: [
+                (DateTimeHelper.string_to_datetime(gap['from']), DateTimeHelper.string_to_datetime(gap['to']))
+                for gap in results[ticker]['gaps']
+            ]
+            for ticker in tickers
+        }
+
+    def post_candlesticks(
+        self,
+        ticker: str,
+        candlesticks: List[Dict[str, Union[float, str]]],
+        coverage: Optional[List[Interval]] = None,
+    ) -> bool:
+        """Upload candlesticks and [from, to) intervals they were fetched for."""
+
+        url = f'{self._url}/assets'
+        json_data = {'ticker': ticker, 'candlesticks': candlesticks}
+        if coverage:
+            json_data['coverage'] = [
+                {'from': DateTimeHelper.datetime_to_string(from_), 'to': DateTimeHelper.datetime_to_string(to)}
+                for from_, to in coverage
+            ]
+        logger.debug(f'Upload {len(candlesticks)} candlesticks and {len(coverage or [])} intervals by url={url}')
+        body, headers = self._encode_json(json_data)
+        response = self._request('POST', 'post_candlesticks', url, data=body, headers=headers)
+        if response is None or response.status_code != 200:
+            logger.error('Cannot upload new data')
+            return False
+
+        results = response.json().get('results', {})
+        logger.debug(f'Uploaded candlesticks: inserted={results.get("inserted")}, skipped={results.get("skipped")}')
+        return True
+
+    def _encode_json(self, data: Dict) -> Tuple[bytes, Dict[str, str]]:
+        """Serialize an upload and compress it unless it is small."""
+
+        body = json.dumps(data).encode()
+        headers = {'Content-Type': 'application/json'}
+        if not self._upload_encoding or len(body) < COMPRESSION_MIN_SIZE:
+            return body, headers
+
+        # The fastest levels make uploads of candlesticks several times smaller
+        if self._upload_encoding == 'br':
+            body = brotli.compress(body, quality=1)
+        else:
+            body = gzip.compress(body, 1)
+        headers['Content-Encoding'] = self._upload_encoding
+        return body, headers
@@ -1,6 +1,7 @@
 import datetime as dt
 import logging
 import os
+import time
 from typing import Callable, Dict, List, Optional, Union
 
 import dash
@@ -8,27 +9,54 @@ import dash_bootstrap_components as dbc
 import dash_core_components as dcc
 import dash_html_components as html
 from dash.dependencies import Input, Output, State
+import numpy as np
 import plotly.graph_objects as go
-from polygon import RESTClient
-import requests
+from prometheus_client import Histogram
 import waitress
 
+from dashboard.backend import BackendClient, Candlesticks
+from dashboard.jobs import IngestionJobQueue
+from dashboard.metrics import LATENCY_BUCKETS
 from dashboard.utils import DateTimeHelper, generate_id
+from dashboard.workers import get_job_queue
 
 
 logger = logging.getLogger(__name__)
 
+JobData = Dict[str, Union[float, str, List[int], List[str]]]
+
+# Figures are built by the dashboard only, so the metric is not created in ingestion and scheduler processes
+FIGURE_BUILD_SECONDS = Histogram(
+    'candlestick_dashboard_figure_build_seconds',
+    'Duration of building a candlestick figure including a backend request.',
+    buckets=LATENCY_BUCKETS,
+)
+
 
 class CandlestickApp:
     ticker_dropdown_id = generate_id()
+    compare_dropdown_id = generate_id()
     bar_graph_id = generate_id()
     date_range_id = generate_id()
     plot_button_id = generate_id()
+    job_interval_id = generate_id()
+    job_store_id = generate_id()
+
+    # The finest resolution which is used for a date range not longer than the given span.
+    resolution_spans = (
+        (dt.timedelta(days=3), '1m'),
+        (dt.timedelta(days=14), '5m'),
+        (dt.timedelta(days=60), '15m'),
+        (dt.timedelta(days=400), '1h'),
+    )
+    max_resolution = '1d'
 
     def __init__(self, app: Optional[dash.Dash] = None):
-        self._backend_api_url = os.environ['BACKEND_API_URL'].strip('/')
-        self._polygon_api_key = os.environ['POLYGON_API_KEY']
-        self._batch_limit = int(os.environ['POLYGON_BATCH_LIMIT'])
+        self._backend = BackendClient.from_env()
+        self._jobs = get_job_queue()
+        self._job_timeout = float(os.environ.get('INGESTION_JOB_TIMEOUT', 600))
+        # Trailing gaps which are shorter than the tolerance are filled by the prewarming scheduler
+        self._data_freshness = dt.timedelta(seconds=int(os.environ.get('DATA_FRESHNESS', 0)))
         self.tickers = os.environ['TICKERS'].strip(',').split(',')
 
         self.app = app or dash.Dash(__name__)
@@ -45,20 +73,26 @@ class CandlestickApp:
         """Create a layout for laying out of components of an application."""
 
         ticker_dropdown = self._get_ticker_dropdown()
+        compare_dropdown = self._get_compare_dropdown()
         date_range = self._get_date_range()
         candlestick_chart = self._get_candlestick_chart()
         plot_button = self._get_plot_button()
+        job_interval = self._get_job_interval()
+        job_store = dcc.Store(id=self.job_store_id)
 
         layout = html.Div(
             [
                 dbc.Row(
                     [
                         dbc.Col(ticker_dropdown, width=2, align='center', className='ml-1 mt-1'),
+                        dbc.Col(compare_dropdown, width=3, align='center', className='mt-1'),
                         dbc.Col(date_range, width=3, align='center', className='mt-1'),
                         dbc.Col(plot_button, width=2, align='center', className='mt-1'),
                     ]
                 ),
                 dbc.Row([dbc.Col(candlestick_chart)]),
+                job_interval,
+                job_store,
             ]
         )
         return layout
@@ -86,6 +120,18 @@ class CandlestickApp:
 
         return component
 
+    def _get_compare_dropdown(self) -> dcc.Dropdown:
+        """Tickers plotted along with the selected one as a comparison chart of their price changes."""
+
+        component = dcc.Dropdown(
+            id=self.compare_dropdown_id,
+            options=[{'label': ticker, 'value': ticker} for ticker in self.tickers],
+            placeholder='Compare with...',
+            multi=True,
+        )
+
+        return component
+
     def _get_date_range(self) -> dcc.DatePickerRange:
         today = dt.date.today()
         component = dcc.DatePickerRange(
@@ -105,6 +151,12 @@ class CandlestickApp:
         component = dcc.Graph(id=self.bar_graph_id, style={'width': '90vw', 'height': '90vh'})
         return component
 
+    def _get_job_interval(self) -> dcc.Interval:
+        """An interval polling an ingestion job status. It is enabled while a job is in flight."""
+
+        component = dcc.Interval(id=self.job_interval_id, interval=2000, disabled=True)
+        return component
+
     def set_callbacks(self) -> None:
         """Set all callbacks of an application inside this method."""
 
@@ -113,151 +165,157 @@ class CandlestickApp:
     def _set_generate_bar_graph_callback(self):
         inputs = [
             Input(self.plot_button_id, 'n_clicks'),
+            Input(self.job_interval_id, 'n_intervals'),
         ]
         states = [
             State(self.ticker_dropdown_id, 'value'),
             State(self.date_range_id, 'start_date'),
             State(self.date_range_id, 'end_date'),
+            State(self.job_store_id, 'data'),
+            State(self.compare_dropdown_id, 'value'),
+        ]
+        output = [
+            Output(self.bar_graph_id, 'figure'),
+            Output(self.job_store_id, 'data'),
+            Output(self.job_interval_id, 'disabled'),
         ]
-        output = Output(self.bar_graph_id, 'figure')
         self.register_callback(self._generate_candlestick_chart, inputs, output, states)
 
-    def _generate_candlestick_chart(self, _, ticker: str, from_: str, to: str):
+    def _generate_candlestick_chart(
+        self,
+        _,
+        __,
+        ticker: str,
+        from_: str,
+        to: str,
+        job: Optional[JobData],
+        compared_tickers: Optional[List[str]] = None,
+    ):
+        """
+        Plot candlesticks which are already stored, or a comparison chart if other tickers are chosen to compare with.
+        If some data are missing, enqueue ingestion jobs and poll them by an interval. When the jobs are finished,
+        plot the chart again.
+        """
+
         context = dash.callback_context
         if not context.triggered:
-            return go.Figure()
+            return go.Figure(), None, True
 
         if context.triggered[0]['value'] is None:
-            return go.Figure()
+            return go.Figure(), None, True
+
+        if context.triggered[0]['prop_id'].startswith(self.job_interval_id):
+            return self._poll_job(job)
 
         if not ticker:
-            return go.Figure()
+            return go.Figure(), None, True
 
         from_ = DateTimeHelper.date_to_datetime(DateTimeHelper.string_to_date(from_))
         to = DateTimeHelper.date_to_datetime(DateTimeHelper.string_to_date(to))
         to += dt.timedelta(hours=23, minutes=59, seconds=59)
-        logger.info(f'Creating a candlestick for ticker={ticker}, from={from_}, to={to}')
+        tickers = list(dict.fromkeys([ticker, *(compared_tickers or [])]))
+        logger.info(f'Creating a candlestick for tickers={tickers}, from={from_}, to={to}')
         if from_ > to:
             logger.warning(f'Incorrect user input: from={from_} > to={to}')
-            return go.Figure()
+            return go.Figure(), None, True
+
+        # Intervals which were never fetched from extra sources are downloaded by ingestion workers. Meanwhile,
+        # plot what is stored already.
+        # Data are always plotted from the storage, so the backend aggregates them to the chosen resolution.
+        if len(tickers) == 1:
+            gaps = self._backend.get_coverage_gaps(ticker, from_, to)
+            ticker_gaps = {ticker: gaps} if gaps is not None else None
+        else:
+            ticker_gaps = self._backend.get_batch_coverage_gaps(tickers, from_, to)
+        if ticker_gaps is None:
+            return go.Figure(), None, True
+
+        job_ids = []
+        now = dt.datetime.utcnow()
+        for ticker_, gaps in ticker_gaps.items():
+            if any(gap_from < now - self._data_freshness for gap_from, _ in gaps):
+                job_ids.append(self._jobs.enqueue(ticker_, from_, to))
+
+        job = None
+        if job_ids:
+            job = {
+                'ids': job_ids,
+                'tickers': tickers,
+                'from': DateTimeHelper.datetime_to_string(from_),
+                'to': DateTimeHelper.datetime_to_string(to),
+                'enqueued_at': time.time(),
+            }
 
-        url = f'{self._backend_api_url}/assets/candlesticks/{ticker}/{from_.date()}/{to.date()}'
-        logger.debug(f'Requesting to db by url={url}')
-        response = requests.get(url)
-        if response.status_code != 200:
-            logger.warning(f'Cannot get data from backend by url={url}')
-            return go.Figure()
+        return self._get_figure(tickers, from_, to), job, job is None
 
-        # If there are data in inner data storage, use it to plot a candlestick graph.
-        # Data from the storage may be incomplete, therefore, download missing data from extra sources
-        # and upload them to the storage.
-        # If there are no any data in the storage for the given date range, make full downloading and upload them to
-        # the storage.
-
-        db_candlesticks = response.json()
-        if db_candlesticks.get('results'):
-            db_candlesticks = db_candlesticks['results']
-            datetime_candlestick_mapping = {
-                DateTimeHelper.string_to_datetime(candlestick['datetime']): candlestick
-                for candlestick in db_candlesticks['data']
-            }
+    def _poll_job(self, job: Optional[JobData]):
+        if not job:
+            return dash.no_update, None, True
 
-            missing_data = []
-            db_min_datetime = DateTimeHelper.string_to_datetime(db_candlesticks['min_datetime'])
-            if from_ < db_min_datetime:
-                logger.debug(f'Detect missing data between {from_} and {db_min_datetime}')
-                data = self._download_data(ticker, from_, db_min_datetime)
-                missing_data.extend(data)
-                logger.debug(f'Downloaded {len(data)} missing data')
-
-            db_max_datetime = DateTimeHelper.string_to_datetime(db_candlesticks['max_datetime'])
-            if to > db_max_datetime:
-                logger.debug(f'Detect missing data between {db_max_datetime} and {to}')
-                data = self._download_data(ticker, db_max_datetime, to)
-                missing_data.extend(data)
-                logger.debug(f'Downloaded {len(data)} missing data')
-
-            if missing_data:
-                url = f'{self._backend_api_url}/assets'
-                logger.debug(f'Upload missing data by url={url}')
-                response = requests.post(url, json={'ticker': ticker, 'candlesticks': missing_data})
-                if response.status_code != 200:
-                    logger.error('Cannot upload missing data')
-
-                missing_data = {
-                    DateTimeHelper.string_to_datetime(candlestick['datetime']): candlestick
-                    for candlestick in missing_data
-                }
-
-                datetime_candlestick_mapping.update(missing_data)
-        else:
-            logger.debug(f'No stored data for ticker={ticker}, from {from_} to {to}. Start downloading')
-            new_candlesticks = self._download_data(ticker, from_, to)
-            if not new_candlesticks:
-                return go.Figure()
-
-            url = f'{self._backend_api_url}/assets'
-            logger.debug(f'Upload new data by url={url}')
-            response = requests.post(url, json={'ticker': ticker, 'candlesticks': new_candlesticks})
-            if response.status_code != 201:
-                logger.error('Cannot upload new data')
-
-            datetime_candlestick_mapping = {
-                DateTimeHelper.string_to_datetime(candlestick['datetime']): candlestick
-                for candlestick in new_candlesticks
-            }
+        statuses = [self._jobs.get_status(job_id) for job_id in job['ids']]
+        if any(status in IngestionJobQueue.IN_FLIGHT for status in statuses):
+            if time.time() - job['enqueued_at'] < self._job_timeout:
+                return dash.no_update, job, False
+
+            logger.warning(f'Jobs {job["ids"]} are not finished in {self._job_timeout} s. Stop waiting')
+            return dash.no_update, None, True
 
-        graph_data = dict(sorted(datetime_candlestick_mapping.items()))
+        logger.debug(f'Jobs {job["ids"]} are {statuses}. Update the candlestick chart')
+        from_ = DateTimeHelper.string_to_datetime(job['from'])
+        to = DateTimeHelper.string_to_datetime(job['to'])
+        return self._get_figure(job['tickers'], from_, to), None, True
+
+    @FIGURE_BUILD_SECONDS.time()
+    def _get_figure(self, tickers: List[str], from_: dt.datetime, to: dt.datetime) -> go.Figure:
+        resolution = self._choose_resolution(from_, to)
+        if len(tickers) > 1:
+            return self._get_comparison_figure(tickers, from_, to, resolution)
+
+        db_candlesticks = self._backend.get_candlesticks(tickers[0], from_, to, resolution)
+        if not db_candlesticks:
+            return go.Figure()
 
         graph = go.Candlestick(
-            x=list(graph_data.keys()),
-            open=[candlestick['open_price'] for candlestick in graph_data.values()],
-            close=[candlestick['close_price'] for candlestick in graph_data.values()],
-            high=[candlestick['high_price'] for candlestick in graph_data.values()],
-            low=[candlestick['low_price'] for candlestick in graph_data.values()],
+            x=db_candlesticks.datetime,
+            open=db_candlesticks.open_price,
+            close=db_candlesticks.close_price,
+            high=db_candlesticks.high_price,
+            low=db_candlesticks.low_price,
         )
         fig = go.Figure(data=graph)
         fig.update_layout(xaxis_rangeslider_visible=True, yaxis_title='Price')
         return fig
 
-    def _download_data(self, ticker: str, from_: dt.datetime, to: dt.datetime) -> List[Dict[str, Union[float, str]]]:
-        """Download data from an extra source. Now, polygon.io is supported."""
-
-        days = self._batch_limit // 60 // 24
-        start_date_ = from_
-        end_date_ = min(start_date_ + dt.timedelta(days=days), to)
-
-        data = []
-        with RESTClient(self._polygon_api_key) as api_client:
-            while start_date_ != to:
-                limit = int((end_date_ - start_date_).total_seconds() // 60)
-                response = api_client.stocks_equities_aggregates(
-                    ticker=ticker,
-                    from_=DateTimeHelper.date_to_string(start_date_.date()),
-                    to=DateTimeHelper.date_to_string(end_date_.date()),
-                    multiplier=1,
-                    timespan='minute',
-                    limit=limit,
-                )
-
-                data.extend(
-                    [
-                        {
-                            'open_price': candlestick['o'],
-                            'close_price': candlestick['c'],
-                            'low_price': candlestick['l'],
-                            'high_price': candlestick['h'],
-                            'volume': candlestick['v'],
-                            'weighted_volume': candlestick['vw'],
-                            'datetime': DateTimeHelper.datetime_to_string(
-                                DateTimeHelper.timestamp_to_datetime_utc(candlestick['t'] // 1000)
-                            ),
-                        }
-                        for candlestick in response.results
-                    ]
-                )
+    def _get_comparison_figure(self, tickers: List[str], from_: dt.datetime, to: dt.datetime, resolution: str):
+        """Plot close prices of all tickers as changes from their first close, so they share one axis."""
+
+        ticker_candlesticks = self._backend.get_batch_candlesticks(tickers, from_, to, resolution)
+        if not ticker_candlesticks:
+            return go.Figure()
+
+        lines = []
+        for ticker, candlesticks in ticker_candlesticks.items():
+            changes = self._get_changes(candlesticks)
+            if changes is not None:
+                lines.append(go.Scatter(x=candlesticks.datetime, y=changes, mode='lines', name=ticker))
+        fig = go.Figure(data=lines)
+        fig.update_layout(xaxis_rangeslider_visible=True, yaxis_title='Change, %', hovermode='x unified')
+        return fig
+
+    @staticmethod
+    def _get_changes(candlesticks: Candlesticks) -> Optional[np.ndarray]:
+        """Return close prices as percentage changes from the first known one, or None if there is no such price."""
+
+        known = np.flatnonzero(np.isfinite(candlesticks.close_price) & (candlesticks.close_price != 0))
+        if not len(known):
+            return None
+        return (candlesticks.close_price / candlesticks.close_price[known[0]] - 1) * 100
 
-                start_date_ = end_date_
-                end_date_ = min(end_date_ + dt.timedelta(days=days), to)
+    def _choose_resolution(self, from_: dt.datetime, to: dt.datetime) -> str:
+        """Choose a candlestick resolution keeping the number of plotted candlesticks bounded for any date range."""
 
-        return data
+        span = to - from_
+        for max_span, resolution in self.resolution_spans:
+            if span <= max_span:
+                return resolution
+        return self.max_resolution
@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+import datetime as dt
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from dashboard.metrics import POLYGON_FETCH_SECONDS, POLYGON_RESPONSES
+from dashboard.utils import DateTimeHelper
+
+
+logger = logging.getLogger(__name__)
+
+Candlestick = Dict[str, Union[float, str]]
+Interval = Tuple[dt.datetime, dt.datetime]
+Window = Tuple[dt.date, dt.date]
+
+
+class PolygonDownloadError(Exception):
+    pass
+
+
+class TokenBucket:
+    """A thread-safe token bucket allowing `rate` requests per second with bursts up to `capacity` requests."""
+
+    def __init__(self, rate: float, capacity: Optional[int] = 1):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it."""
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+            time.sleep(wait)
+
+
+class PolygonDownloader:
+    """
+    Download minute candlesticks from polygon.io aggregates API.
+    A date range is split into windows of at most `batch_limit` minutes which are fetched concurrently
+    by a thread pool. Requests are limited by a token bucket shared by all threads and retried with
+    exponential backoff on connection errors, 429 and 5xx responses.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        url: Optional[str] = 'https://api.polygon.io',
+        batch_limit: Optional[int] = 50000,
+        workers: Optional[int] = 4,
+        rate_limit: Optional[float] = 5,
+        burst: Optional[int] = 1,
+        max_retries: Optional[int] = 5,
+        backoff: Optional[float] = 1,
+        timeout: Optional[float] = 30,
+    ):
+        """
+        :param rate_limit: requests per minute.
+        :param backoff: seconds to wait before the first retry. Every next retry waits twice longer.
+        """
+
+        self._api_key = api_key
+        self._url = url.strip('/')
+        self._batch_limit = batch_limit
+        self._window_days = max(batch_limit // 60 // 24, 1)
+        self._workers = workers
+        self._rate_limiter = TokenBucket(rate_limit / 60, burst)
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._timeout = timeout
+
+        self._session = requests.Session()
+        self._session.mount(self._url, HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+
+    def download(self, ticker: str, from_: dt.datetime, to: dt.datetime) -> List[Candlestick]:
+        """Download candlesticks within [from, to). Raise PolygonDownloadError if any window cannot be fetched."""
+
+        data = self.download_many(ticker, [(from_, to)])[0]
+        if data is None:
+            raise PolygonDownloadError(f'Cannot download {ticker} from {from_} to {to}')
+        return data
+
+    def download_many(self, ticker: str, intervals: List[Interval]) -> List[Optional[List[Candlestick]]]:
+        """
+        Download candlesticks within every [from, to) interval fetching windows of all intervals concurrently.
+        Return a list of candlesticks in order per interval or None for an interval which cannot be fetched.
+        """
+
+        windows = [self._split(from_, to) for from_, to in intervals]
+        flat_windows = [window for interval_windows in windows for window in interval_windows]
+        logger.debug(f'Download {ticker} by {len(flat_windows)} windows in {len(intervals)} intervals')
+
+        with ThreadPoolExecutor(max_workers=self._workers) as executor:
+            results = iter(executor.map(lambda window: self._download_window(ticker, window), flat_windows))
+
+        data = []
+        for (from_, to), interval_windows in zip(intervals, windows):
+            interval_results = [next(results) for _ in interval_windows]
+            if any(result is None for result in interval_results):
+                data.append(None)
+                continue
+
+            candlesticks = []
+            for result in interval_results:
+                candlesticks.extend(self._convert(result, from_, to))
+            data.append(candlesticks)
+        return data
+
+    def _split(self, from_: dt.datetime, to: dt.datetime) -> List[Window]:
+        """Split [from, to) into inclusive date windows as polygon expects them."""
+
+        windows = []
+        start_date = from_.date()
+        last_date = (to - dt.timedelta(microseconds=1)).date()
+        while start_date <= last_date:
+            end_date = min(start_date + dt.timedelta(days=self._window_days - 1), last_date)
+            windows.append((start_date, end_date))
+            start_date = end_date + dt.timedelta(days=1)
+        return windows
+
+    def _download_window(self, ticker: str, window: Window) -> Optional[List[Dict[str, float]]]:
+        started_at = time.monotonic()
+        results = self._request_window(ticker, window)
+        POLYGON_FETCH_SECONDS.labels('ok' if results is not None else 'failed').observe(time.monotonic() - started_at)
+        return results
+
+    def _request_window(self, ticker: str, window: Window) -> Optional[List[Dict[str, float]]]:
+        from_, to = window
+        url = (
+            f'{self._url}/v2/aggs/ticker/{ticker}/range/1/minute/'
+            f'{DateTimeHelper.date_to_string(from_)}/{DateTimeHelper.date_to_string(to)}'
+        )
+        params = {'apiKey': self._api_key, 'limit': self._batch_limit, 'sort': 'asc', 'adjusted': 'true'}
+
+        for attempt in range(self._max_retries + 1):
+            self._rate_limiter.acquire()
+            retry_after = None
+            try:
+                response = self._session.get(url, params=params, timeout=self._timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                logger.warning(f'Cannot connect to polygon for {ticker} from {from_} to {to}: {e}')
+            else:
+                POLYGON_RESPONSES.labels(response.status_code).inc()
+                if response.status_code == 200:
+                    return response.json().get('results') or []
+                if response.status_code != 429 and response.status_code < 500:
+                    logger.error(f'Polygon rejected {ticker} from {from_} to {to}: {response.status_code}')
+                    return None
+
+                logger.warning(f'Polygon answered {response.status_code} for {ticker} from {from_} to {to}')
+                retry_after = response.headers.get('Retry-After')
+
+            if attempt < self._max_retries:
+                if retry_after and retry_after.isdigit():
+                    delay = float(retry_after)
+                else:
+                    delay = self._backoff * 2 ** attempt * (1 + random.random() / 2)
+                logger.debug(f'Retry {attempt + 1} of {self._max_retries} in {delay:.1f} s')
+                time.sleep(delay)
+
+        logger.error(f'Cannot download {ticker} from {from_} to {to} after {self._max_retries} retries')
+        return None
+
+    @staticmethod
+    def _convert(results: List[Dict[str, float]], from_: dt.datetime, to: dt.datetime) -> List[Candlestick]:
+        # Polygon returns whole days, so keep only candlesticks within the requested interval
+        candlesticks = []
+        for candlestick in results:
+            datetime = DateTimeHelper.timestamp_to_datetime_utc(candlestick['t'] // 1000).replace(tzinfo=None)
+            if not from_ <= datetime < to:
+                continue
+
+            candlesticks.append(
+                {
+                    'open_price': candlestick['o'],
+                    'close_price': candlestick['c'],
+                    'low_price': candlestick['l'],
+                    'high_price': candlestick['h'],
+                    'volume': candlestick['v'],
+                    'weighted_volume': candlestick.get('vw'),
+                    'datetime': DateTimeHelper.datetime_to_string(datetime),
+                }
+            )
+        return candlesticks
@@ -0,0 +1,81 @@
+import datetime as dt
+import logging
+import os
+from typing import List, Tuple
+
+from dashboard.backend import BackendClient
+from dashboard.downloader import PolygonDownloader
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionError(Exception):
+    pass
+
+
+class Ingestor:
+    """Download candlesticks missing in the storage from extra sources and upload them to the storage."""
+
+    def __init__(self, backend: BackendClient, downloader: PolygonDownloader, data_delay: dt.timedelta):
+        """
+        :param data_delay: the latest minutes which may be incomplete yet in extra sources.
+            They are uploaded but not marked as covered, so they are downloaded again next time.
+        """
+
+        self._backend = backend
+        self._downloader = downloader
+        self._data_delay = data_delay
+
+    @classmethod
+    def from_env(cls) -> 'Ingestor':
+        backend = BackendClient.from_env()
+        downloader = PolygonDownloader(
+            os.environ['POLYGON_API_KEY'],
+            url=os.environ.get('POLYGON_API_URL', 'https://api.polygon.io'),
+            batch_limit=int(os.environ['POLYGON_BATCH_LIMIT']),
+            workers=int(os.environ.get('POLYGON_WORKERS', 4)),
+            rate_limit=float(os.environ.get('POLYGON_RATE_LIMIT', 5)),
+            max_retries=int(os.environ.get('POLYGON_MAX_RETRIES', 5)),
+        )
+        data_delay = dt.timedelta(minutes=int(os.environ.get('POLYGON_DATA_DELAY', 15)))
+        return cls(backend, downloader, data_delay)
+
+    def ingest(self, ticker: str, from_: dt.datetime, to: dt.datetime) -> int:
+        """Fill coverage gaps of a ticker between the given dates. Return a number of downloaded candlesticks."""
+
+        gaps = self._backend.get_coverage_gaps(ticker, from_, to)
+        if gaps is None:
+            raise IngestionError(f'Cannot get coverage gaps for ticker={ticker} from {from_} to {to}')
+
+        if not gaps:
+            logger.debug(f'No coverage gaps for ticker={ticker} from {from_} to {to}')
+            return 0
+        return self.fill_gaps(ticker, gaps)
+
+    def fill_gaps(self, ticker: str, gaps: List[Tuple[dt.datetime, dt.datetime]]) -> int:
+        """Download candlesticks for [from, to) gaps and upload them to the storage."""
+
+        now = dt.datetime.utcnow()
+        # The latest minutes may be incomplete yet, so they are not marked as covered
+        covered_to = now - self._data_delay
+
+        gaps = [(from_, min(to, now)) for from_, to in gaps if from_ < now]
+        for from_, to in gaps:
+            logger.debug(f'Detect missing data between {from_} and {to}')
+
+        candlesticks = []
+        coverage = []
+        for (from_, to), data in zip(gaps, self._downloader.download_many(ticker, gaps)):
+            if data is None:
+                logger.error(f'Cannot download missing data between {from_} and {to}')
+                continue
+
+            candlesticks.extend(data)
+            logger.debug(f'Downloaded {len(data)} missing data between {from_} and {to}')
+            if from_ < min(to, covered_to):
+                coverage.append((from_, min(to, covered_to)))
+
+        if (candlesticks or coverage) and not self._backend.post_candlesticks(ticker, candlesticks, coverage):
+            raise IngestionError(f'Cannot upload {len(candlesticks)} candlesticks for ticker={ticker}')
+        return len(candlesticks)
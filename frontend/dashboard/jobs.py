@@ -0,0 +1,191 @@
+from contextlib import contextmanager
+import datetime as dt
+import logging
+import sqlite3
+import time
+from typing import Iterator, NamedTuple, Optional
+import uuid
+
+from dashboard.utils import DateTimeHelper
+
+
+logger = logging.getLogger(__name__)
+
+
+class Job(NamedTuple):
+    id: int
+    ticker: str
+    from_: dt.datetime
+    to: dt.datetime
+    # A token of the claim, so a worker which lost the job cannot finish it after it was claimed again
+    token: str
+
+
+class IngestionJobQueue:
+    """
+    A queue of ingestion jobs stored in a local SQLite database, so it is shared by the dashboard and worker processes
+    without an external broker. Pending and running jobs are deduplicated by (ticker, from, to). Workers send
+    heartbeats of running jobs, and finished jobs are deleted after `retention` seconds. A running job is updated only
+    by the worker which holds its latest claim.
+    """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    IN_FLIGHT = (PENDING, RUNNING)
+
+    def __init__(self, path: str, timeout: Optional[float] = 30, retention: Optional[float] = 24 * 60 * 60):
+        """
+        :param retention: seconds to keep finished jobs for, so clients polling them see their statuses.
+        """
+
+        self._path = path
+        self._timeout = timeout
+        self._retention = retention
+        with self._connect() as connection:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS ingestion_jobs ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'ticker TEXT NOT NULL, '
+                'from_datetime TEXT NOT NULL, '
+                'to_datetime TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'error TEXT, '
+                'created_at REAL NOT NULL, '
+                'updated_at REAL NOT NULL, '
+                'heartbeat_at REAL, '
+                'claim_token TEXT)'
+            )
+            # Queues created before heartbeats and claim tokens were added
+            columns = {row[1] for row in connection.execute('PRAGMA table_info(ingestion_jobs)')}
+            if 'heartbeat_at' not in columns:
+                connection.execute('ALTER TABLE ingestion_jobs ADD COLUMN heartbeat_at REAL')
+            if 'claim_token' not in columns:
+                connection.execute('ALTER TABLE ingestion_jobs ADD COLUMN claim_token TEXT')
+            connection.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS index_ingestion_jobs_in_flight '
+                'ON ingestion_jobs (ticker, from_datetime, to_datetime) '
+                f"WHERE status IN ('{self.PENDING}', '{self.RUNNING}')"
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS index_ingestion_jobs_status ON ingestion_jobs (status, id)')
+            connection.execute('COMMIT')
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # A connection per operation in the autocommit mode, so the queue may be used from any thread and process
+        connection = sqlite3.connect(self._path, timeout=self._timeout, isolation_level=None)
+        try:
+            yield connection
+        finally:
+            connection.close()
+
+    def enqueue(self, ticker: str, from_: dt.datetime, to: dt.datetime) -> int:
+        """Add a job and return its ID. If the same job is in flight already, return its ID instead."""
+
+        from_ = DateTimeHelper.datetime_to_string(from_)
+        to = DateTimeHelper.datetime_to_string(to)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT id FROM ingestion_jobs WHERE ticker = ? AND from_datetime = ? AND to_datetime = ? '
+                'AND status IN (?, ?)',
+                (ticker, from_, to, *self.IN_FLIGHT),
+            ).fetchone()
+            if row:
+                job_id = row[0]
+                logger.debug(f'Job {job_id} for ticker={ticker} from {from_} to {to} is in flight already')
+            else:
+                cursor = connection.execute(
+                    'INSERT INTO ingestion_jobs (ticker, from_datetime, to_datetime, status, created_at, updated_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (ticker, from_, to, self.PENDING, now, now),
+                )
+                job_id = cursor.lastrowid
+                logger.debug(f'Enqueued job {job_id} for ticker={ticker} from {from_} to {to}')
+            self._prune(connection, now)
+            connection.execute('COMMIT')
+        return job_id
+
+    def _prune(self, connection: sqlite3.Connection, now: float) -> None:
+        count = connection.execute(
+            'DELETE FROM ingestion_jobs WHERE status IN (?, ?) AND updated_at < ?',
+            (self.DONE, self.FAILED, now - self._retention),
+        ).rowcount
+        if count:
+            logger.debug(f'Deleted {count} jobs finished more than {self._retention} s ago')
+
+    def claim(self) -> Optional[Job]:
+        """Take the oldest pending job and mark it as running under a new claim token."""
+
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                'SELECT id, ticker, from_datetime, to_datetime FROM ingestion_jobs '
+                'WHERE status = ? ORDER BY id LIMIT 1',
+                (self.PENDING,),
+            ).fetchone()
+            token = uuid.uuid4().hex
+            if row:
+                now = time.time()
+                connection.execute(
+                    'UPDATE ingestion_jobs SET status = ?, updated_at = ?, heartbeat_at = ?, claim_token = ? '
+                    'WHERE id = ?',
+                    (self.RUNNING, now, now, token, row[0]),
+                )
+            connection.execute('COMMIT')
+
+        if not row:
+            return None
+        job_id, ticker, from_, to = row
+        from_ = DateTimeHelper.string_to_datetime(from_)
+        to = DateTimeHelper.string_to_datetime(to)
+        return Job(job_id, ticker, from_, to, token)
+
+    def finish(self, job: Job, error: Optional[str] = None) -> bool:
+        """
+        Mark a claimed job as done or failed. Return False if the claim is lost, e.g. the job was requeued
+        and claimed by another worker, so its result is dropped.
+        """
+
+        status = self.FAILED if error else self.DONE
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'UPDATE ingestion_jobs SET status = ?, error = ?, updated_at = ? '
+                'WHERE id = ? AND status = ? AND claim_token = ?',
+                (status, error, time.time(), job.id, self.RUNNING, job.token),
+            )
+        return cursor.rowcount > 0
+
+    def heartbeat(self, job: Job) -> bool:
+        """Mark a claimed job as alive. Return False if the claim is lost."""
+
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'UPDATE ingestion_jobs SET heartbeat_at = ? WHERE id = ? AND status = ? AND claim_token = ?',
+                (time.time(), job.id, self.RUNNING, job.token),
+            )
+        return cursor.rowcount > 0
+
+    def get_status(self, job_id: int) -> Optional[str]:
+        with self._connect() as connection:
+            row = connection.execute('SELECT status FROM ingestion_jobs WHERE id = ?', (job_id,)).fetchone()
+        return row[0] if row else None
+
+    def requeue_stale(self, timeout: float) -> int:
+        """
+        Return running jobs without a heartbeat within the timeout, e.g. of a killed worker, to the queue.
+        Jobs which run longer are kept while their workers send heartbeats.
+        """
+
+        now = time.time()
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'UPDATE ingestion_jobs SET status = ?, updated_at = ?, claim_token = NULL '
+                'WHERE status = ? AND COALESCE(heartbeat_at, updated_at) < ?',
+                (self.PENDING, now, self.RUNNING, now - timeout),
+            )
+        return cursor.rowcount
@@ -0,0 +1,45 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+POLYGON_FETCH_SECONDS = Histogram(
+    'candlestick_dashboard_polygon_fetch_seconds',
+    'Duration of downloading a date window from polygon including rate limiting and retries.',
+    ['result'],
+    buckets=LATENCY_BUCKETS,
+)
+POLYGON_RESPONSES = Counter(
+    'candlestick_dashboard_polygon_responses',
+    'Number of polygon responses by a status code.',
+    ['status'],
+)
+BACKEND_REQUEST_SECONDS = Histogram(
+    'candlestick_dashboard_backend_request_seconds',
+    'Duration of backend requests.',
+    ['request'],
+    buckets=LATENCY_BUCKETS,
+)
+
+
+def generate_metrics() -> Tuple[bytes, str]:
+    """Return metrics in the Prometheus text format and its content type."""
+
+    # Metrics of ingestion worker processes are written to files in PROMETHEUS_MULTIPROC_DIR and merged on a scrape
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ or 'prometheus_multiproc_dir' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
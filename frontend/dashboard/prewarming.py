@@ -0,0 +1,99 @@
+import datetime as dt
+import logging
+import time
+from typing import List, NoReturn, Optional
+
+from dateutil import tz
+
+from dashboard.ingestion import Ingestor
+
+
+logger = logging.getLogger(__name__)
+
+
+class PrewarmingScheduler:
+    """
+    Keep candlesticks of the given tickers up to date in the storage, so dashboard reads rarely go to extra sources.
+    Every `interval` during market hours the latest data are ingested, and once a day at `backfill_at`
+    the last `backfill_days` days are backfilled. Only coverage gaps are downloaded in both cases.
+    """
+
+    def __init__(
+        self,
+        ingestor: Ingestor,
+        tickers: List[str],
+        market_timezone: Optional[str] = 'America/New_York',
+        market_open: Optional[dt.time] = dt.time(4, 0),
+        market_close: Optional[dt.time] = dt.time(20, 0),
+        interval: Optional[dt.timedelta] = dt.timedelta(minutes=1),
+        backfill_at: Optional[dt.time] = dt.time(2, 0),
+        backfill_days: Optional[int] = 7,
+    ):
+        """
+        :param market_open: market opening time in the market timezone, including pre-market hours.
+        :param market_close: market closing time in the market timezone, including after-hours.
+        :param backfill_at: time of a nightly backfill in the market timezone.
+        """
+
+        self._ingestor = ingestor
+        self._tickers = tickers
+        self._market_timezone = tz.gettz(market_timezone)
+        self._market_open = market_open
+        self._market_close = market_close
+        self._interval = interval
+        self._backfill_at = backfill_at
+        self._backfill_days = backfill_days
+        self._next_backfill_at = self._get_next_backfill_at(dt.datetime.now(tz=dt.timezone.utc))
+
+    def run(self) -> NoReturn:
+        logger.info(f'Prewarming of {", ".join(self._tickers)} is started. Next backfill at {self._next_backfill_at}')
+        while True:
+            started_at = time.monotonic()
+            self.run_once(dt.datetime.now(tz=dt.timezone.utc))
+            time.sleep(max(self._interval.total_seconds() - (time.monotonic() - started_at), 0))
+
+    def run_once(self, now: dt.datetime) -> None:
+        """Run tasks which are due at the given UTC time."""
+
+        if now >= self._next_backfill_at:
+            self.backfill(now)
+            self._next_backfill_at = self._get_next_backfill_at(now)
+            logger.info(f'Next backfill at {self._next_backfill_at}')
+
+        if self.is_market_open(now):
+            self.update(now)
+
+    def is_market_open(self, now: dt.datetime) -> bool:
+        market_now = now.astimezone(self._market_timezone)
+        return market_now.weekday() < 5 and self._market_open <= market_now.time() < self._market_close
+
+    def update(self, now: dt.datetime) -> None:
+        """Ingest the latest data of today."""
+
+        now = now.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        self._ingest(now - dt.timedelta(days=1), now)
+
+    def backfill(self, now: dt.datetime) -> None:
+        """Ingest data of the last days."""
+
+        now = now.astimezone(dt.timezone.utc).replace(tzinfo=None)
+        logger.info(f'Backfill the last {self._backfill_days} days')
+        self._ingest(now - dt.timedelta(days=self._backfill_days), now)
+
+    def _ingest(self, from_: dt.datetime, to: dt.datetime) -> None:
+        for ticker in self._tickers:
+            try:
+                count = self._ingestor.ingest(ticker, from_, to)
+            except Exception:
+                logger.exception(f'Cannot prewarm ticker={ticker} from {from_} to {to}')
+            else:
+                logger.debug(f'Prewarmed ticker={ticker} from {from_} to {to} by {count} candlesticks')
+
+    def _get_next_backfill_at(self, now: dt.datetime) -> dt.datetime:
+        market_now = now.astimezone(self._market_timezone)
+        backfill_at = dt.datetime.combine(market_now.date(), self._backfill_at, tzinfo=self._market_timezone)
+        if backfill_at <= market_now:
+            backfill_at = dt.datetime.combine(
+                market_now.date() + dt.timedelta(days=1), self._backfill_at, tzinfo=self._market_timezone
+            )
+        return backfill_at.astimezone(dt.timezone.utc)
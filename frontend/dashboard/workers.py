@@ -0,0 +1,120 @@
+from contextlib import contextmanager
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, List, NoReturn, Optional
+
+from dashboard.ingestion import Ingestor
+from dashboard.jobs import IngestionJobQueue, Job
+
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorker:
+    """Run ingestion jobs from a queue one by one."""
+
+    def __init__(
+        self,
+        queue: IngestionJobQueue,
+        ingestor: Ingestor,
+        poll_interval: Optional[float] = 1,
+        stale_timeout: Optional[float] = 60,
+        heartbeat_interval: Optional[float] = 10,
+    ):
+        """
+        :param poll_interval: seconds to wait when there are no pending jobs.
+        :param stale_timeout: seconds without a heartbeat after which a running job is considered to be lost
+            by its worker.
+        :param heartbeat_interval: seconds between heartbeats of a running job, less than the stale timeout.
+        """
+
+        self._queue = queue
+        self._ingestor = ingestor
+        self._poll_interval = poll_interval
+        self._stale_timeout = stale_timeout
+        self._heartbeat_interval = heartbeat_interval
+
+    def run(self) -> NoReturn:
+        logger.info(f'Ingestion worker {os.getpid()} is started')
+        while True:
+            requeued = self._queue.requeue_stale(self._stale_timeout)
+            if requeued:
+                logger.warning(f'Requeued {requeued} stale jobs')
+
+            if not self.run_once():
+                time.sleep(self._poll_interval)
+
+    def run_once(self) -> bool:
+        """Run the oldest pending job. Return False if there are no pending jobs."""
+
+        job = self._queue.claim()
+        if not job:
+            return False
+
+        logger.info(f'Run job {job.id} for ticker={job.ticker} from {job.from_} to {job.to}')
+        try:
+            with self._send_heartbeats(job):
+                count = self._ingestor.ingest(job.ticker, job.from_, job.to)
+        except Exception as e:
+            logger.exception(f'Job {job.id} failed')
+            is_finished = self._queue.finish(job, error=str(e) or e.__class__.__name__)
+        else:
+            logger.info(f'Job {job.id} is done. Downloaded {count} candlesticks')
+            is_finished = self._queue.finish(job)
+        # Candlesticks are uploaded idempotently, so only the status of the job is dropped
+        if not is_finished:
+            logger.warning(f'Job {job.id} was requeued while it ran. Its status is left to the latest claim')
+        return True
+
+    @contextmanager
+    def _send_heartbeats(self, job: Job) -> Iterator[None]:
+        """Send heartbeats of a job in background, so it is not requeued while it runs longer than the stale timeout."""
+
+        stopped = threading.Event()
+
+        def send() -> None:
+            while not stopped.wait(self._heartbeat_interval):
+                try:
+                    if not self._queue.heartbeat(job):
+                        logger.warning(f'Job {job.id} is not claimed by this worker anymore. It may have been requeued')
+                except sqlite3.Error:
+                    logger.exception(f'Cannot send a heartbeat of job {job.id}')
+
+        thread = threading.Thread(target=send, name=f'heartbeat_{job.id}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+
+def get_job_queue() -> IngestionJobQueue:
+    return IngestionJobQueue(
+        os.environ.get('INGESTION_QUEUE_PATH', 'ingestion_jobs.db'),
+        retention=float(os.environ.get('INGESTION_JOB_RETENTION', 24 * 60 * 60)),
+    )
+
+
+def run_worker() -> NoReturn:
+    worker = IngestionWorker(
+        get_job_queue(),
+        Ingestor.from_env(),
+        stale_timeout=float(os.environ.get('INGESTION_STALE_TIMEOUT', 60)),
+    )
+    worker.run()
+
+
+def start_workers(count: int) -> List[multiprocessing.Process]:
+    """Start ingestion worker processes. Environment variables must be set before."""
+
+    processes = []
+    for i in range(count):
+        process = multiprocessing.Process(target=run_worker, name=f'ingestion_worker_{i}', daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
@@ -1,7 +1,8 @@
 import argparse
 from typing import NoReturn
 
-from dashboard import create_app
+from dashboard.app import create_app
+from dashboard.workers import start_workers
 
 
 def main(args: argparse.Namespace) -> NoReturn:
@@ -14,6 +15,7 @@ def main(args: argparse.Namespace) -> NoReturn:
 
     config = args.config
     app = create_app(config, debug)
+    start_workers(args.workers)
     app.run(host=args.host, port=args.port, debug=debug)
 
 
@@ -33,5 +35,8 @@ if __name__ == '__main__':
         '--host', type=str, required=False, default='localhost', help='A host where server is deployed.'
     )
     parser.add_argument('--port', type=int, required=False, default=8050, help='A port where server is deployed.')
+    parser.add_argument(
+        '--workers', type=int, required=False, default=2, help='A number of ingestion worker processes to start.'
+    )
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,37 @@
+import argparse
+import datetime as dt
+import logging
+import os
+from pathlib import Path
+from typing import NoReturn
+
+from dashboard.ingestion import Ingestor
+from dashboard.prewarming import PrewarmingScheduler
+from dashboard.utils import DateTimeHelper, set_env, set_logger_settings
+
+
+def main(args: argparse.Namespace) -> NoReturn:
+    set_env(args.config)
+    now = DateTimeHelper.datetime_to_string(dt.datetime.utcnow())
+    log_name = f'prewarming_scheduler_{os.getpid()}_{now}.log'
+    set_logger_settings(Path(os.environ['LOG_DIR']) / log_name, logging.DEBUG if args.debug == 'True' else logging.INFO)
+
+    scheduler = PrewarmingScheduler(
+        Ingestor.from_env(),
+        os.environ['TICKERS'].strip(',').split(','),
+        market_timezone=os.environ.get('MARKET_TIMEZONE', 'America/New_York'),
+        market_open=dt.time.fromisoformat(os.environ.get('MARKET_OPEN', '04:00')),
+        market_close=dt.time.fromisoformat(os.environ.get('MARKET_CLOSE', '20:00')),
+        interval=dt.timedelta(seconds=int(os.environ.get('PREWARMING_INTERVAL', 60))),
+        backfill_at=dt.time.fromisoformat(os.environ.get('PREWARMING_BACKFILL_AT', '02:00')),
+        backfill_days=int(os.environ.get('PREWARMING_BACKFILL_DAYS', 7)),
+    )
+    scheduler.run()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--debug', required=False, default='False', help='If True, debug messages are logged.')
+    parser.add_argument('--config', type=str, required=False, default='', help='A dotenv file path.')
+    args = parser.parse_args()
+    main(args)
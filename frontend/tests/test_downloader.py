@@ -0,0 +1,119 @@
+import datetime as dt
+import threading
+import time
+
+import pytest
+
+from benchmarks.polygon import MINUTES_PER_DAY, FakePolygonServer
+from dashboard.downloader import PolygonDownloadError, PolygonDownloader, TokenBucket
+
+
+# A weekday, so the fake server answers with a whole day of candlesticks
+DAY = dt.datetime(2021, 3, 1)
+
+
+@pytest.fixture
+def polygon():
+    server = FakePolygonServer().start()
+    yield server
+    server.stop()
+
+
+def get_downloader(polygon: FakePolygonServer, **kwargs) -> PolygonDownloader:
+    options = {'rate_limit': 60 * 1000, 'burst': 10, 'max_retries': 3, 'backoff': 0.01, 'timeout': 5, **kwargs}
+    return PolygonDownloader('key', polygon.url, **options)
+
+
+def test_token_bucket_paces_requests():
+    bucket = TokenBucket(rate=20)
+    started_at = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    # The first token is available at once, each next one in 1 / rate seconds
+    assert time.monotonic() - started_at >= 4 / 20
+
+
+def test_token_bucket_allows_bursts():
+    bucket = TokenBucket(rate=1, capacity=5)
+    started_at = time.monotonic()
+    for _ in range(5):
+        bucket.acquire()
+    assert time.monotonic() - started_at < 0.5
+
+
+def test_token_bucket_is_shared_by_threads():
+    bucket = TokenBucket(rate=40)
+    threads = [threading.Thread(target=lambda: [bucket.acquire() for _ in range(3)]) for _ in range(3)]
+    started_at = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - started_at >= 8 / 40
+
+
+def test_download(polygon):
+    candlesticks = get_downloader(polygon).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    assert len(candlesticks) == MINUTES_PER_DAY
+    assert candlesticks[0]['datetime'] == '2021-03-01_14-30-00'
+    assert polygon.get_stats()['requests'] == 1
+
+
+@pytest.mark.parametrize('status', [500, 502, 503])
+def test_retries(polygon, status):
+    polygon.errors.extend([status, status])
+    candlesticks = get_downloader(polygon).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    assert len(candlesticks) == MINUTES_PER_DAY
+    assert polygon.get_stats()['requests'] == 3
+
+
+def test_backoff(polygon):
+    polygon.errors.extend([503, 503, 503])
+    started_at = time.monotonic()
+    get_downloader(polygon, backoff=0.1).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    # Retries wait 0.1, 0.2 and 0.4 seconds at least
+    assert time.monotonic() - started_at >= 0.7
+
+
+def test_retry_after(polygon):
+    polygon.errors.append(429)
+    started_at = time.monotonic()
+    candlesticks = get_downloader(polygon, backoff=10).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    # A rate limited request is retried after the Retry-After second instead of the backoff
+    assert 1 <= time.monotonic() - started_at < 5
+    assert len(candlesticks) == MINUTES_PER_DAY
+    assert polygon.get_stats()['requests'] == 2
+
+
+def test_rate_limit(polygon):
+    polygon.rate_limit = 2
+    downloader = get_downloader(polygon)
+    downloader.download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    downloader.download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    # The fake server allows 2 requests per minute, so the third one is answered with 429
+    with pytest.raises(PolygonDownloadError):
+        get_downloader(polygon, max_retries=0).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    assert polygon.get_stats()['rate_limited'] == 1
+
+
+def test_retries_are_exhausted(polygon):
+    polygon.errors.extend([503] * 4)
+    with pytest.raises(PolygonDownloadError):
+        get_downloader(polygon).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    assert polygon.get_stats()['requests'] == 4
+
+
+def test_client_errors_are_not_retried(polygon):
+    polygon.errors.append(403)
+    with pytest.raises(PolygonDownloadError):
+        get_downloader(polygon).download('AAPL', DAY, DAY + dt.timedelta(days=1))
+    assert polygon.get_stats()['requests'] == 1
+
+
+def test_download_many_marks_failed_intervals(polygon):
+    polygon.errors.extend([404])
+    intervals = [(DAY, DAY + dt.timedelta(days=1)), (DAY + dt.timedelta(days=1), DAY + dt.timedelta(days=2))]
+    downloader = get_downloader(polygon, workers=1)
+    data = downloader.download_many('AAPL', intervals)
+    assert data[0] is None
+    assert len(data[1]) == MINUTES_PER_DAY
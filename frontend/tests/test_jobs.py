@@ -0,0 +1,169 @@
+import datetime as dt
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from dashboard import jobs
+from dashboard.jobs import IngestionJobQueue
+from dashboard.workers import IngestionWorker
+
+
+FROM = dt.datetime(2021, 3, 1)
+TO = dt.datetime(2021, 3, 2)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Time of the queue, which is moved by tests instead of waiting."""
+
+    clock = SimpleNamespace(now=time.time())
+    monkeypatch.setattr(jobs, 'time', SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock) -> IngestionJobQueue:
+    return IngestionJobQueue(str(tmp_path / 'jobs.db'), retention=60)
+
+
+class Ingestor:
+    def __init__(self, run=None):
+        self._run = run
+
+    def ingest(self, ticker: str, from_: dt.datetime, to: dt.datetime) -> int:
+        if self._run:
+            self._run()
+        return 1
+
+
+def test_enqueue_deduplicates_jobs_in_flight(queue):
+    job_id = queue.enqueue('AAPL', FROM, TO)
+    assert queue.enqueue('AAPL', FROM, TO) == job_id
+    assert queue.enqueue('MSFT', FROM, TO) != job_id
+
+    job = queue.claim()
+    assert queue.enqueue('AAPL', FROM, TO) == job_id
+    assert queue.finish(job)
+    assert queue.enqueue('AAPL', FROM, TO) != job_id
+
+
+def test_claim(queue):
+    first_id = queue.enqueue('AAPL', FROM, TO)
+    second_id = queue.enqueue('MSFT', FROM, TO)
+
+    job = queue.claim()
+    assert (job.id, job.ticker, job.from_, job.to) == (first_id, 'AAPL', FROM, TO)
+    assert queue.get_status(first_id) == IngestionJobQueue.RUNNING
+    assert queue.claim().id == second_id
+    assert queue.claim() is None
+
+
+def test_finish(queue):
+    queue.enqueue('AAPL', FROM, TO)
+    queue.enqueue('MSFT', FROM, TO)
+    done, failed = queue.claim(), queue.claim()
+
+    assert queue.finish(done)
+    assert queue.finish(failed, error='Cannot download')
+    assert queue.get_status(done.id) == IngestionJobQueue.DONE
+    assert queue.get_status(failed.id) == IngestionJobQueue.FAILED
+    # A job is finished once
+    assert not queue.finish(done, error='Cannot download')
+    assert queue.get_status(done.id) == IngestionJobQueue.DONE
+
+
+def test_heartbeat_keeps_jobs_running(queue, clock):
+    queue.enqueue('AAPL', FROM, TO)
+    job = queue.claim()
+
+    for _ in range(3):
+        clock.now += 20
+        assert queue.heartbeat(job)
+        assert queue.requeue_stale(30) == 0
+    assert queue.get_status(job.id) == IngestionJobQueue.RUNNING
+
+
+def test_requeue_stale(queue, clock):
+    queue.enqueue('AAPL', FROM, TO)
+    job = queue.claim()
+
+    clock.now += 20
+    assert queue.requeue_stale(30) == 0
+    clock.now += 20
+    assert queue.requeue_stale(30) == 1
+    assert queue.get_status(job.id) == IngestionJobQueue.PENDING
+    assert queue.claim().id == job.id
+
+
+def test_stale_claim_cannot_finish_requeued_job(queue, clock):
+    queue.enqueue('AAPL', FROM, TO)
+    stale = queue.claim()
+    clock.now += 60
+    queue.requeue_stale(30)
+    job = queue.claim()
+    assert job.id == stale.id and job.token != stale.token
+
+    # The first worker wakes up after its job was claimed again
+    assert not queue.heartbeat(stale)
+    assert not queue.finish(stale)
+    assert not queue.finish(stale, error='Cannot download')
+    assert queue.get_status(job.id) == IngestionJobQueue.RUNNING
+
+    assert queue.heartbeat(job)
+    assert queue.finish(job)
+    assert queue.get_status(job.id) == IngestionJobQueue.DONE
+
+
+def test_worker_drops_status_of_lost_job(queue, clock):
+    job_id = queue.enqueue('AAPL', FROM, TO)
+    claims = []
+
+    def lose_job():
+        # The job is requeued and claimed by another worker while this one runs it
+        clock.now += 60
+        queue.requeue_stale(30)
+        claims.append(queue.claim())
+
+    assert IngestionWorker(queue, Ingestor(lose_job), heartbeat_interval=60).run_once()
+    assert queue.get_status(job_id) == IngestionJobQueue.RUNNING
+    assert queue.finish(claims[0])
+
+
+def test_worker_finishes_jobs(queue):
+    job_id = queue.enqueue('AAPL', FROM, TO)
+    worker = IngestionWorker(queue, Ingestor(), heartbeat_interval=60)
+    assert worker.run_once()
+    assert queue.get_status(job_id) == IngestionJobQueue.DONE
+    assert not worker.run_once()
+
+
+def test_finished_jobs_are_pruned(queue, clock):
+    job_id = queue.enqueue('AAPL', FROM, TO)
+    queue.finish(queue.claim())
+
+    clock.now += 30
+    queue.enqueue('MSFT', FROM, TO)
+    assert queue.get_status(job_id) == IngestionJobQueue.DONE
+    clock.now += 60
+    queue.enqueue('TSLA', FROM, TO)
+    assert queue.get_status(job_id) is None
+
+
+def test_queues_without_claim_tokens_are_migrated(tmp_path, clock):
+    path = str(tmp_path / 'jobs.db')
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE ingestion_jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, ticker TEXT NOT NULL, '
+        'from_datetime TEXT NOT NULL, to_datetime TEXT NOT NULL, status TEXT NOT NULL, error TEXT, '
+        'created_at REAL NOT NULL, updated_at REAL NOT NULL)'
+    )
+    connection.commit()
+    connection.close()
+
+    queue = IngestionJobQueue(path)
+    queue.enqueue('AAPL', FROM, TO)
+    job = queue.claim()
+    assert queue.heartbeat(job)
+    assert queue.finish(job)
@@ -0,0 +1,29 @@
+import argparse
+import datetime as dt
+import logging
+import os
+from pathlib import Path
+from typing import NoReturn
+
+from dashboard.utils import DateTimeHelper, set_env, set_logger_settings
+from dashboard.workers import start_workers
+
+
+def main(args: argparse.Namespace) -> NoReturn:
+    set_env(args.config)
+    now = DateTimeHelper.datetime_to_string(dt.datetime.utcnow())
+    log_name = f'ingestion_worker_{os.getpid()}_{now}.log'
+    set_logger_settings(Path(os.environ['LOG_DIR']) / log_name, logging.DEBUG if args.debug == 'True' else logging.INFO)
+
+    processes = start_workers(args.workers)
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--debug', required=False, default='False', help='If True, debug messages are logged.')
+    parser.add_argument('--config', type=str, required=False, default='', help='A dotenv file path.')
+    parser.add_argument('--workers', type=int, required=False, default=2, help='A number of worker processes.')
+    args = parser.parse_args()
+    main(args)